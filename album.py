@@ -1,12 +1,17 @@
 import glob
 import os
 import shutil
+import time
 
+import events
+import metacache
 from api import get
 from config import config
 from cover import download_cover_image
-from downloader import download_track
-from tagger import tag_audio
+from downloader import download_track, stopped_by_user
+from models import Album, parse_albums
+from retryqueue import RetryQueue
+from tagger import reset_tag_stats, tag_audio, tag_stats_fields
 from utils import require_login, sanitize_filename
 
 
@@ -19,50 +24,137 @@ def find_album_by_title(title: str):
         print("API returned no result.")
         return []
     
-    return results.get("albums", [])
+    return parse_albums(results.get("albums"))
 
 
-def download_album(album_id: str, cli_args=None, directory=None, discography_artist=None):
+def album_track_metadata(album: dict, track: dict) -> dict:
+    """Tags written for a track downloaded as part of an album."""
+    return {
+        "title": track.get("title", ""),
+        "artist": track.get("artist", ""),
+        "album": album.get("title", ""),
+        "genre": album.get("genre", ""),
+        "date": album.get("releaseDate", "")[:4],
+        "albumArtist": album.get("artist", ""),
+    }
+
+
+def album_folder_path(album: dict, album_id: str, directory: str = None):
+    """Return (parent directory, album folder) an album is downloaded into."""
+    title = album.get("title", f"album_{album_id}")[:64]
+    artist = album.get("artist", f"album_{album_id}")[:64]
+    year = album.get("releaseDate", "")[:4]
+    output_directory = directory or os.path.join(config.output_directory, "albums")
+    return output_directory, os.path.join(output_directory, sanitize_filename(f"{year} - {artist} - {title} - {album_id}"))
+
+
+def album_excluded(output_directory: str, album_id: str) -> list:
+    return glob.glob(os.path.join(output_directory, '.excluded', f'*{album_id}'))
+
+
+def track_selected(album: dict, track: dict, discography_artist: str = None) -> bool:
+    """Discography downloads only keep tracks the artist appears on."""
+    if discography_artist is None:
+        return True
+    return (
+        discography_artist in album.get("title", "")[:64] or
+        discography_artist in album.get("artist", "")[:64] or
+        discography_artist in track['title'] or
+        discography_artist in track['artist']
+    )
+
+
+def _download_album_track(album: dict, track: dict, idx: int, album_folder: str, quality: str, cover_path: str) -> bool:
+    raw_path = download_track(
+        track_id=track["id"],
+        quality=quality,
+        directory=album_folder,
+        index=idx,
+        track_meta=track,
+    )
+    if not raw_path:
+        return False
+    
+    # Convert only if needed (e.g., remove ffmpeg if not used)
+    converted_path = raw_path  # assuming same format as output; update if you use convert_audio
+    # converted_path = convert_audio(raw_path, output_format)
+    
+    # Build metadata, applying CLI overrides if present
+    metadata = album_track_metadata(album, track)
+    
+    # Embed cover
+    tag_audio(converted_path, metadata, cover_path=cover_path)
+    
+    # Remove temporary raw file if configured
+    if config.delete_raw_files and raw_path != converted_path:
+        try:
+            os.remove(raw_path)
+        except Exception:
+            pass
+    return True
+
+
+def retry_album_track(album: dict, track: dict, idx: int, album_folder: str, quality: str) -> bool:
+    """Download one album track outside its album run (deferred retries), fetching the cover if it is gone."""
+    cover_path = os.path.join(album_folder, "cover.jpg")
+    fetched = False
+    if not os.path.exists(cover_path) and album.get("cover"):
+        os.makedirs(album_folder, exist_ok=True)
+        fetched = bool(download_cover_image(album["cover"], cover_path))
+    try:
+        return _download_album_track(album, track, idx, album_folder, quality,
+                                     cover_path if os.path.exists(cover_path) else None)
+    finally:
+        if fetched and not config.keep_cover_file and os.path.exists(cover_path):
+            os.remove(cover_path)
+
+
+def download_album(album_id: str, cli_args=None, directory=None, discography_artist=None, retries=None):
     """
     Download an album by ID.
     cli_args: optional object containing --title, --artist, --album, --genre, --date
+    retries: a RetryQueue shared by a larger run (discography); failed tracks are
+    deferred to it instead of being retried at the end of this album.
+    Returns True when every selected track is on disk afterwards (or deferred), False otherwise
+    (also when a track was stopped with 'q': it is skipped, not deferred).
     """
     if not require_login(config):
-        return
+        return False
     
+    started = time.monotonic()
     album_data = get(f"/album?albumId={album_id}")
     if not album_data or "album" not in album_data:
-        print("Could not fetch album details.")
-        return
+        events.emit("failed", scope="album", album_id=str(album_id), reason="metadata")
+        return False
     
-    album = album_data["album"]
+    album = Album.from_api(album_data["album"])
+    del album_data
     tracks = album.get("tracks", [])
+    metacache.remember_album(album)
+    reset_tag_stats()
     
     if not tracks:
-        print("Album has no tracks or failed to load.")
-        return
+        events.emit("failed", scope="album", album_id=str(album_id), reason="no_tracks")
+        return False
     
     title = album.get("title", f"album_{album_id}")[:64]
-    artist = album.get("artist", f"album_{album_id}")[:64]
-    year = album.get("releaseDate", "")[:4]
     
-    output_format = cli_args.format or config.output_format
+    output_format = getattr(cli_args, "format", None) or config.output_format
     quality = "5" if output_format == "mp3" else "27"
     
-    output_directory = directory or os.path.join(config.output_directory, "albums")
-    album_folder = os.path.join(output_directory, sanitize_filename(f"{year} - {artist} - {title} - {album_id}"))
+    output_directory, album_folder = album_folder_path(album, album_id, directory)
     
-    excluded_matches = glob.glob(os.path.join(output_directory, '.excluded', f'*{album_id}'))
+    excluded_matches = album_excluded(output_directory, album_id)
     if len(excluded_matches) > 0:
-        print(f"Album {album_id} is excluded.")
+        events.emit("skipped", scope="album", album_id=str(album_id), reason="excluded")
         for match in excluded_matches:
             for track in glob.glob(os.path.join(match, "*")):
                 os.remove(track)
-        return
+        return True
     
     os.makedirs(album_folder, exist_ok=True)
     
-    print(f"Downloading Album: {title} ({len(tracks)} tracks)")
+    events.emit("started", scope="album", album_id=str(album_id), title=title, tracks=len(tracks), path=album_folder)
     
     # Download album cover once
     cover_url = album.get("cover")
@@ -71,50 +163,30 @@ def download_album(album_id: str, cli_args=None, directory=None, discography_art
         album_cover_path = download_cover_image(cover_url, os.path.join(album_folder, "cover.jpg"))
     
     count = 0
+    failed = 0
+    deferred = 0
+    stopped = 0
+    queue = retries if retries is not None else RetryQueue("album")
     for idx, track in enumerate(tracks, 1):
-        if discography_artist is None or (
-            discography_artist in title or
-            discography_artist in artist or
-            discography_artist in track['title'] or
-            discography_artist in track['artist']
-        ):
-            print(f"[{idx}/{len(tracks)}] {track['title']} — {track['artist']}")
+        if track_selected(album, track, discography_artist):
+            events.emit("queued", track_id=str(track["id"]), position=idx, count=len(tracks),
+                        label=f"{track['title']} — {track['artist']}")
             count += 1
             
-            raw_path = download_track(
-                track_id=track["id"],
-                quality=quality,
-                directory=album_folder,
-                index=idx,
-                track_meta=track,
-            )
-            if not raw_path:
-                print("Skipping: download failed.")
-                continue
-            
-            # Convert only if needed (e.g., remove ffmpeg if not used)
-            converted_path = raw_path  # assuming same format as output; update if you use convert_audio
-            # converted_path = convert_audio(raw_path, output_format)
-            
-            # Build metadata, applying CLI overrides if present
-            metadata = {
-                "title": track.get("title", ""),
-                "artist": track.get("artist", ""),
-                "album": album.get("title", ""),
-                "genre": album.get("genre", ""),
-                "date": album.get("releaseDate", "")[:4],
-                "albumArtist": album.get("artist", ""),
-            }
-            
-            # Embed cover
-            tag_audio(converted_path, metadata, cover_path=album_cover_path)
-            
-            # Remove temporary raw file if configured
-            if config.delete_raw_files and raw_path != converted_path:
-                try:
-                    os.remove(raw_path)
-                except Exception:
-                    pass
+            if not _download_album_track(album, track, idx, album_folder, quality, album_cover_path):
+                if stopped_by_user():
+                    stopped += 1
+                    continue
+                queue.defer(
+                    {"kind": "album", "album_id": str(album_id), "track_id": str(track["id"]), "index": idx,
+                     "folder": album_folder, "quality": quality, "label": f"{track['title']} — {track['artist']}"},
+                    lambda track=track, idx=idx: retry_album_track(album, track, idx, album_folder, quality),
+                )
+                deferred += 1
+    
+    # Failed tracks are retried at the end of the album, or of the whole run when a queue was passed in
+    if retries is None:
+        failed = len(queue.run())
     
     try:
         if count == 0:
@@ -124,3 +196,8 @@ def download_album(album_id: str, cli_args=None, directory=None, discography_art
             os.remove(os.path.join(album_folder, "cover.jpg"))
     except Exception:
         pass
+    
+    events.emit("completed", scope="album", album_id=str(album_id), path=album_folder,
+                tracks=count, failed=failed, deferred=deferred, stopped=stopped, duration=round(time.monotonic() - started, 3),
+                **(tag_stats_fields() if count else {}))
+    return failed == 0 and stopped == 0
@@ -1,11 +1,21 @@
 # api.py  
 import requests  
+import metrics  
 from config import config  
+from limiter import THROTTLE_STATUSES, api_request  
+from models import loads  
 from utils import require_login  
+import time  
 import urllib.parse  
   
 BASE_URL = "https://dab.yeet.su/api"  
   
+# GET endpoints whose answers can be reused for a while by a long-lived process  
+# (the shell); stream URLs and libraries are always fetched fresh  
+CACHEABLE = ("/search", "/discography", "/album")  
+CACHE_TTL = 600  # seconds  
+_cache = None  # (endpoint, params) -> (expires, result), set up by enable_cache()  
+  
   
 def _should_debug() -> bool:  
     return bool(getattr(config, "debug", False) or getattr(config, "test_mode", False))  
@@ -55,7 +65,7 @@ def login(email: str, password: str):
   
 def _safe_json(resp, endpoint):  
     try:  
-        return resp.json()  
+        return loads(resp.content)  
     except ValueError:  
         if _should_debug():  
             print(f"[DEBUG] Invalid JSON response from {endpoint} ({len(resp.text)} bytes):\n{resp.text[:800]}")  
@@ -92,23 +102,52 @@ def _request(method: str, endpoint: str, **kwargs):
             body_preview = f" | JSON: {str(kwargs['json'])[:200]}"  
         print(f"[DEBUG] {method} {debug_url} | HEADERS: {masked_headers}{body_preview}")  
   
+    kwargs.setdefault("timeout", 30)  
+    label = metrics.endpoint_label(endpoint)  
+    started = time.monotonic()  
+    status = "error"  
     try:  
-        resp = requests.request(method, url, headers=headers, **kwargs)  
+        # Rate limits (429/503) and timeouts are retried inside api_request  
+        resp = api_request(method, url, headers=headers, **kwargs)  
+        status = resp.status_code  
         resp.raise_for_status()  
         return _safe_json(resp, endpoint)  
     except requests.HTTPError as e:  
+        if e.response is not None and e.response.status_code in THROTTLE_STATUSES:  
+            print(f"[API] Still rate-limited on {endpoint} after retries (HTTP {e.response.status_code})")  
         if _should_debug() and e.response is not None:  
             print(f"[DEBUG] HTTP error {e.response.status_code} on {debug_url}")  
             print(f"[DEBUG] Response body: {e.response.text[:1000]}")  
         return None  
     except requests.RequestException as e:  
+        if isinstance(e, requests.Timeout):  
+            status = "timeout"  
         if _should_debug():  
             print(f"[DEBUG] Request error on {debug_url}: {e}")  
         return None  
+    finally:  
+        metrics.API_REQUESTS.inc(endpoint=label, method=method, status=str(status))  
+        metrics.API_SECONDS.observe(time.monotonic() - started, endpoint=label)  
+  
+  
+def enable_cache():  
+    """Keep CACHEABLE answers in memory for CACHE_TTL seconds (for the rest of the process)."""  
+    global _cache  
+    if _cache is None:  
+        _cache = {}  
   
   
 def get(endpoint: str, params=None):  
-    return _request("GET", endpoint, params=params)  
+    if _cache is None or not endpoint.startswith(CACHEABLE):  
+        return _request("GET", endpoint, params=params)  
+    key = (endpoint, tuple(sorted((params or {}).items())))  
+    hit = _cache.get(key)  
+    if hit and hit[0] > time.monotonic():  
+        return hit[1]  
+    result = _request("GET", endpoint, params=params)  
+    if result is not None:  
+        _cache[key] = (time.monotonic() + CACHE_TTL, result)  
+    return result  
   
   
 def post(endpoint: str, json=None):  
@@ -1,13 +1,19 @@
 # artist.py
+import glob
 import os
+import time
 
 from tabulate import tabulate
 
-from album import download_album
+import events
+import metacache
+from album import download_album, track_selected
 from api import get
 from config import config
+from models import parse_albums
+from retryqueue import RetryQueue
 from search import search_and_return
-from utils import require_login, sanitize_filename
+from utils import load_json, remember_listing, require_login, sanitize_filename, save_json
 
 
 def _search_artist_by_name(name: str):
@@ -19,11 +25,12 @@ def _search_artist_by_name(name: str):
     return results
 
 
-def get_discography(artist_id, sort_by="year", sort_order="asc", fetch_all=False, limit=None):
+def get_discography(artist_id, sort_by="year", sort_order="asc", fetch_all=False, limit=None, stop_at=None):
     """    
     Returns full structure: {"artist": {...}, "albums": [...]}    
     - fetch_all=True will paginate until no more results.    
     - limit: stops after retrieving this many albums (even if fetch_all=True).    
+    - stop_at: set of album IDs; stops (exclusive) at the first one seen.    
     """
     full_data = None
     albums = []
@@ -48,7 +55,13 @@ def get_discography(artist_id, sort_by="year", sort_order="asc", fetch_all=False
                 "albums": [],
             }
         
-        albums.extend(result.get("albums", []))
+        page = parse_albums(result.get("albums"))
+        if stop_at:
+            known = next((i for i, alb in enumerate(page) if alb.get("id") in stop_at), None)
+            if known is not None:
+                albums.extend(page[:known])
+                break
+        albums.extend(page)
         
         # Stop if limit reached    
         if limit is not None and len(albums) >= limit:
@@ -75,6 +88,7 @@ def print_discography(data):
         exit(1)
     
     print(f"[Discography] {artist.get('name', 'Unknown Artist')} ({artist.get('albumsCount', len(albums))} albums)\n")
+    remember_listing("album", [alb.get("id", "") for alb in albums])
     table = [
         [
             idx + 1,
@@ -96,6 +110,8 @@ def download_discography(
     view_only=False,
     limit=None,
     cli_args=None,  # <--- add this
+    sync=False,
+    plan=False,
 ):
     if not require_login(config):
         return
@@ -115,6 +131,7 @@ def download_discography(
                 for idx, art in enumerate(matches)
             ]
             print(tabulate(table, headers=["No", "Name", "Artist ID", "Albums"], tablefmt="fancy_grid"))
+            remember_listing("artist", [art.get("id", "") for art in matches])
             try:
                 choice = int(input("\nEnter the number of the artist to select: "))
                 sel = matches[choice - 1]
@@ -127,6 +144,18 @@ def download_discography(
         artist_id = artist_query
         artist_name = artist_query
     
+    if plan and not view_only:
+        from planner import plan_discography
+        complete = set((load_json(_sync_state_path(artist_id), {}) or {}).get("complete", [])) if sync else None
+        data = get_discography(artist_id, sort_by, sort_order, fetch_all=True, limit=limit, stop_at=complete)
+        if data:
+            plan_discography(data, artist_id, cli_args=cli_args)
+        return
+    
+    if sync and not view_only:
+        sync_discography(artist_id, cli_args=cli_args)
+        return
+    
     # Fetch albums
     data = get_discography(
         artist_id,
@@ -149,24 +178,150 @@ def download_discography(
         exit(0)
         
     artist_folder = sanitize_filename(f"{artist} - {artist_id}")
-    print(f"[Discography] Starting download for {len(albums)} albums by {artist} ({artist_id})...\n")
+    started = time.monotonic()
+    events.emit("started", scope="discography", artist_id=str(artist_id), artist=artist, albums=len(albums))
     
     completed = 0
     failed = 0
+    interrupted = False
+    retries = RetryQueue("discography")
     for idx, alb in enumerate(albums, 1):
-        print(f"\n[Discography] ({idx}/{len(albums)}) {alb['title']} — {alb.get('releaseDate', '')[:4]}")
+        events.emit("queued", scope="album", album_id=str(alb["id"]), position=idx, count=len(albums),
+                    title=alb["title"], year=alb.get("releaseDate", "")[:4])
         try:
             # Pass cli_args to download_album so metadata overrides are applied
             directory = os.path.join(config.output_directory, "discographies", artist_folder)
-            download_album(alb["id"], cli_args=cli_args, directory=directory, discography_artist=artist)
+            download_album(alb["id"], cli_args=cli_args, directory=directory, discography_artist=artist, retries=retries)
             completed += 1
         except KeyboardInterrupt:
             print("\n[Discography] Interrupted by user.")
+            interrupted = True
             break
         except Exception as e:
-            print(f"[Discography] Failed: {e}")
+            events.emit("failed", scope="album", album_id=str(alb["id"]), reason="exception", error=str(e))
             failed += 1
     
+    # Tracks that failed anywhere in the discography get their retries once, at the end
+    failed_tracks = retries.save() if interrupted else retries.run()
+    
     os.makedirs(os.path.join(config.output_directory, "discographies", artist_folder, '.excluded'), exist_ok=True)
 
-    print(f"\n[Discography] Finished. Completed: {completed} | Failed: {failed}")
+    events.emit("completed", scope="discography", artist_id=str(artist_id), artist=artist,
+                completed=completed, failed=failed, failed_tracks=len(failed_tracks), duration=round(time.monotonic() - started, 3))
+
+
+
+def _sync_state_path(artist_id) -> str:
+    return config.state_path("sync", "artists", f"{sanitize_filename(str(artist_id))}.json")
+
+
+def _selected_track_ids(album_id, artist: str, recorded: dict):
+    """
+    IDs of the tracks a discography download keeps from this album: the set a
+    previous sync recorded, else worked out from the cached album metadata.
+    None when neither is known.
+    """
+    if str(album_id) in recorded:
+        return recorded[str(album_id)]
+    album = metacache.cached_album(album_id)
+    if not album or not album.get("tracks"):
+        return None
+    return [str(t["id"]) for t in album["tracks"] if track_selected(album, t, artist)]
+
+
+def _album_on_disk(directory: str, alb: dict, selected=None) -> bool:
+    """
+    True if a folder for this album already holds every selected track (files
+    end in " - <track id>.<format>"). Without a known selection, fall back to
+    holding at least trackCount audio files.
+    """
+    if selected is not None and not selected:
+        return True
+    expected = alb.get("trackCount")
+    if selected is None and not expected:
+        return False
+    for folder in glob.glob(os.path.join(glob.escape(directory), f"* - {glob.escape(str(alb['id']))}")):
+        files = glob.glob(os.path.join(glob.escape(folder), f"*.{config.output_format}"))
+        if selected is None:
+            if len(files) >= expected:
+                return True
+            continue
+        on_disk = {os.path.splitext(os.path.basename(f))[0].rsplit(" - ", 1)[-1] for f in files}
+        if set(selected) <= on_disk:
+            return True
+    return False
+
+
+def sync_discography(artist_id: str, cli_args=None):
+    """
+    Download only releases that are new since the last sync, plus albums that
+    were left incomplete. Pages are walked newest-first and pagination stops at
+    the first album already known to be complete.
+    """
+    state_path = _sync_state_path(artist_id)
+    state = load_json(state_path, {}) or {}
+    complete = set(state.get("complete", []))
+    incomplete = set(state.get("incomplete", []))
+    selections = dict(state.get("tracks", {}))
+    
+    data = get_discography(artist_id, "year", "desc", fetch_all=True, stop_at=complete)
+    if not data:
+        return
+    
+    artist = data["artist"].get("name") or state.get("name")
+    if not artist:
+        print("[Discography] No artist name found, exiting.")
+        return
+    
+    directory = os.path.join(config.output_directory, "discographies", sanitize_filename(f"{artist} - {artist_id}"))
+    new_albums = [alb for alb in data["albums"] if alb.get("id") not in complete]
+    
+    # Albums a previous run left unfinished may be older than the stop point
+    listed = {alb["id"] for alb in new_albums}
+    pending = new_albums + [{"id": album_id, "title": album_id} for album_id in sorted(incomplete - listed)]
+    
+    print(f"[Discography] Sync {artist} ({artist_id}): {len(complete)} known complete, "
+          f"{len(new_albums)} new, {len(incomplete - listed)} to resume")
+    
+    started = time.monotonic()
+    events.emit("started", scope="discography", artist_id=str(artist_id), artist=artist, albums=len(pending), sync=True)
+    
+    done = 0
+    for idx, alb in enumerate(pending, 1):
+        album_id = alb["id"]
+        if _album_on_disk(directory, alb, _selected_track_ids(album_id, artist, selections)):
+            ok = True
+        else:
+            events.emit("queued", scope="album", album_id=str(album_id), position=idx, count=len(pending),
+                        title=alb.get("title", album_id), year=alb.get("releaseDate", "")[:4])
+            try:
+                ok = download_album(album_id, cli_args=cli_args, directory=directory, discography_artist=artist)
+            except KeyboardInterrupt:
+                print("\n[Discography] Interrupted by user.")
+                break
+            except Exception as e:
+                events.emit("failed", scope="album", album_id=str(album_id), reason="exception", error=str(e))
+                ok = False
+            selected = _selected_track_ids(album_id, artist, {})
+            if selected is not None:
+                selections[str(album_id)] = selected
+        
+        if ok:
+            complete.add(album_id)
+            incomplete.discard(album_id)
+            done += 1
+        else:
+            incomplete.add(album_id)
+        
+        # Persist after every album so an interrupted sync resumes where it stopped
+        save_json(state_path, {
+            "artist_id": str(artist_id),
+            "name": artist,
+            "complete": sorted(complete),
+            "incomplete": sorted(incomplete),
+            "tracks": selections,
+        })
+    
+    os.makedirs(os.path.join(directory, ".excluded"), exist_ok=True)
+    events.emit("completed", scope="discography", artist_id=str(artist_id), artist=artist, sync=True,
+                completed=done, incomplete=len(incomplete), duration=round(time.monotonic() - started, 3))
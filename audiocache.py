@@ -0,0 +1,485 @@
+# audiocache.py
+"""
+Read-through audio cache for playback.
+
+mpv is pointed at a small HTTP proxy on 127.0.0.1 instead of the CDN. The first
+play of a track streams from the CDN and is teed into a size-bounded LRU disk
+cache keyed by track ID and quality; later plays are served from disk.
+"""
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import governor
+import transport
+from config import config
+
+CHUNK_SIZE = 64 * 1024
+STOP_TIMEOUT = 60  # seconds stop() waits for cache fills and post-processing
+
+
+def _format_for_quality(quality: str) -> str:
+    return "mp3" if str(quality) == "5" else "flac"
+
+
+class AudioCache:
+    """
+    Size-bounded LRU cache of complete audio files (recency = file mtime).
+    Pinned files (still being post-processed) are never evicted.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or config.stream_cache_directory or os.path.join(
+            os.path.expanduser("~"), ".cache", "dabcli", "audio"
+        )
+        self.max_bytes = max_bytes if max_bytes is not None else int(config.stream_cache_size_mb) * 1024 * 1024
+        self._lock = threading.Lock()
+        self._pinned = {}
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_stale_parts()
+
+    def path_for(self, track_id: str, quality: str) -> str:
+        return os.path.join(self.directory, f"q{quality}", f"{track_id}.{_format_for_quality(quality)}")
+
+    def lookup(self, track_id: str, quality: str):
+        """Return the cached file path (and mark it recently used), or None."""
+        path = self.path_for(track_id, quality)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def part_path(self, track_id: str, quality: str) -> str:
+        path = self.path_for(track_id, quality)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.part{threading.get_ident()}"
+
+    def commit(self, part_path: str, track_id: str, quality: str) -> str:
+        """Move a finished fill into place; the file comes back pinned, the caller unpins it."""
+        path = self.path_for(track_id, quality)
+        os.replace(part_path, path)
+        self.pin(path)
+        self.evict()
+        return path
+
+    def pin(self, path: str):
+        with self._lock:
+            self._pinned[path] = self._pinned.get(path, 0) + 1
+
+    def unpin(self, path: str):
+        with self._lock:
+            count = self._pinned.get(path, 0) - 1
+            if count > 0:
+                self._pinned[path] = count
+            else:
+                self._pinned.pop(path, None)
+
+    def evict(self):
+        """Delete least recently used files until the cache fits its budget."""
+        with self._lock:
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.directory):
+                for name in filenames:
+                    if ".part" in name:
+                        continue
+                    path = os.path.join(dirpath, name)
+                    if path in self._pinned:
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def _remove_stale_parts(self, max_age: int = 3600):
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    if ".part" in name and now - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+
+class _Fill:
+    """State of one in-progress cache fill, shared with readers following it."""
+
+    def __init__(self, part: str):
+        self.part = part
+        self.path = None
+        self.length = None
+        self.content_type = "application/octet-stream"
+        self.ok = False
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+    def finish(self, ok: bool):
+        if self.done.is_set():
+            return
+        self.ok = ok
+        self.started.set()
+        self.done.set()
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    server_version = "dabcli-cache"
+
+    def log_message(self, format, *args):
+        if config.debug:
+            print(f"[Cache] {format % args}")
+
+    def do_GET(self):
+        self.server.proxy.handle(self)
+
+
+class CacheProxy:
+    """
+    Localhost HTTP proxy in front of the CDN.
+    resolve_url(track_id, quality) returns a fresh stream URL (or None).
+    on_ready(track_id, quality, path) is called whenever a complete cached file exists.
+    """
+
+    def __init__(self, resolve_url, cache: AudioCache = None, on_ready=None):
+        self.cache = cache or AudioCache()
+        self.resolve_url = resolve_url
+        self.on_ready = on_ready
+        self._filling = {}
+        self._filling_lock = threading.Lock()
+        self._jobs = []
+        self._prefetches = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ProxyHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """
+        Stop serving, then wait (up to timeout seconds) for running cache fills and
+        on_ready post-processing, so exports finish and no .part files are left behind.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        deadline = time.monotonic() + timeout
+        for thread in self._prefetches:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Fills served to mpv run on the server's request threads: wait until they deregister
+        while self._filling and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for job in self._jobs:
+            job.join(max(0.0, deadline - time.monotonic()))
+        running = len(self._filling) + sum(1 for job in self._jobs if job.is_alive())
+        if running:
+            print(f"[Cache] Gave up waiting for {running} transfers or exports after {timeout:g}s")
+
+    def url_for(self, track_id: str, quality: str) -> str:
+        port = self._server.server_address[1]
+        return f"http://127.0.0.1:{port}/q/{quality}/{urllib.parse.quote(str(track_id))}"
+
+    # --- request handling ---
+    def handle(self, req):
+        parts = req.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "q":
+            req.send_error(404)
+            return
+        quality, track_id = parts[1], urllib.parse.unquote(parts[2])
+
+        cached = self.cache.lookup(track_id, quality)
+        if cached:
+            self._notify(track_id, quality, cached)
+            self._serve_file(req, cached)
+            return
+
+        range_header = req.headers.get("Range")
+        from_start = _is_range_from_start(range_header)
+        with self._filling_lock:
+            fill = self._filling.get((track_id, quality))
+        if fill and from_start:
+            # Already being fetched (e.g. prefetched): read along behind the writer
+            self._follow(req, fill)
+            return
+
+        url = self.resolve_url(track_id, quality)
+        if not url:
+            req.send_error(502, "Could not resolve stream URL")
+            return
+
+        fill = self._claim(track_id, quality) if from_start else None
+        if not fill:
+            # A seek into an uncached track: pass it through, and fill the cache
+            # in the background so the track is still kept (and exported)
+            self.prefetch(track_id, quality, url)
+            self._passthrough(req, url, range_header)
+            return
+
+        try:
+            self._tee(req, url, track_id, quality, fill)
+        finally:
+            self._release(track_id, quality)
+
+    def prefetch(self, track_id: str, quality: str, url: str = None):
+        """Fill the cache for a track in the background (no-op if cached or already filling)."""
+        if self.cache.lookup(track_id, quality):
+            return
+        fill = self._claim(track_id, quality)
+        if not fill:
+            return
+
+        def run():
+            try:
+                stream_url = url or self.resolve_url(track_id, quality)
+                if stream_url:
+                    self._tee(None, stream_url, track_id, quality, fill)
+            finally:
+                fill.finish(False)
+                self._release(track_id, quality)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        with self._filling_lock:
+            self._prefetches = [t for t in self._prefetches if t.is_alive()] + [thread]
+
+    def _claim(self, track_id, quality):
+        """Register a new cache fill; returns None if one is already running."""
+        with self._filling_lock:
+            if (track_id, quality) in self._filling:
+                return None
+            fill = _Fill(self.cache.part_path(track_id, quality))
+            self._filling[(track_id, quality)] = fill
+            return fill
+
+    def _release(self, track_id, quality):
+        with self._filling_lock:
+            self._filling.pop((track_id, quality), None)
+
+    def _tee(self, req, url, track_id, quality, fill):
+        """Stream to the client (if any) while filling the cache; keep filling if the client goes away."""
+        part = fill.part
+        client_alive = req is not None
+        headers_sent = False
+        completed = False
+        try:
+            with governor.NETWORK.hold(governor.stream_buffer(CHUNK_SIZE)), \
+                    transport.request("GET", url, stream=True, timeout=30) as r, open(part, "wb") as f:
+                r.raise_for_status()
+                fill.content_type = r.headers.get("content-type", "application/octet-stream")
+                fill.length = r.headers.get("content-length")
+                fill.started.set()
+                if client_alive:
+                    headers_sent = True
+                    req.send_response(200)
+                    req.send_header("Content-Type", fill.content_type)
+                    if fill.length:
+                        req.send_header("Content-Length", fill.length)
+                    req.send_header("Accept-Ranges", "bytes")
+                    req.end_headers()
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    f.flush()
+                    if client_alive:
+                        try:
+                            req.wfile.write(chunk)
+                        except OSError:
+                            client_alive = False
+            completed = True
+        except requests.RequestException as e:
+            if config.debug:
+                print(f"[Cache] Upstream error for {track_id}: {e}")
+            if client_alive and not headers_sent:
+                try:
+                    req.send_error(502)
+                except OSError:
+                    pass
+        finally:
+            if completed:
+                path = self.cache.commit(part, track_id, quality)
+                fill.path = path
+                fill.finish(True)
+                self._notify(track_id, quality, path)
+                self.cache.unpin(path)
+            else:
+                fill.finish(False)
+                if os.path.exists(part):
+                    os.remove(part)
+
+    def _follow(self, req, fill):
+        """Serve a file that another thread is still downloading, reading behind the writer."""
+        fill.started.wait(30)
+        if not fill.started.is_set() or (fill.done.is_set() and not fill.ok):
+            req.send_error(502)
+            return
+        req.send_response(200)
+        req.send_header("Content-Type", fill.content_type)
+        if fill.length:
+            req.send_header("Content-Length", fill.length)
+        req.end_headers()
+        sent = 0
+        try:
+            while True:
+                path = fill.path if fill.done.is_set() and fill.ok else fill.part
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(sent)
+                        chunk = f.read(CHUNK_SIZE)
+                except FileNotFoundError:
+                    if fill.done.is_set() and not fill.ok:
+                        return
+                    chunk = b""
+                if chunk:
+                    req.wfile.write(chunk)
+                    sent += len(chunk)
+                elif fill.done.is_set():
+                    return
+                else:
+                    fill.done.wait(0.2)  # writer is behind; only while a fill is active
+        except OSError:
+            pass
+
+    def _passthrough(self, req, url, range_header=None):
+        headers = {"Range": range_header} if range_header else {}
+        try:
+            with governor.NETWORK.hold(governor.stream_buffer(CHUNK_SIZE)), \
+                    transport.request("GET", url, stream=True, timeout=30, headers=headers) as r:
+                req.send_response(r.status_code)
+                for name in ("content-type", "content-length", "content-range", "accept-ranges"):
+                    if r.headers.get(name):
+                        req.send_header(name.title(), r.headers[name])
+                req.end_headers()
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    req.wfile.write(chunk)
+        except (requests.RequestException, OSError):
+            pass
+
+    def _serve_file(self, req, path):
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        byte_range = _parse_range(req.headers.get("Range"), size)
+        if byte_range:
+            start, end = byte_range
+            req.send_response(206)
+            req.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            req.send_response(200)
+        req.send_header("Content-Type", "audio/mpeg" if path.endswith(".mp3") else "audio/flac")
+        req.send_header("Content-Length", str(end - start + 1))
+        req.send_header("Accept-Ranges", "bytes")
+        req.end_headers()
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    req.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except OSError:
+            pass  # client closed the connection (skip/seek)
+
+    def _notify(self, track_id, quality, path):
+        """Run on_ready off the request thread so playback never waits for it; the file stays pinned meanwhile."""
+        if not self.on_ready:
+            return
+
+        def run():
+            try:
+                self.on_ready(track_id, quality, path)
+            except Exception as e:
+                print(f"[Cache] Post-processing failed for {track_id}: {e}")
+            finally:
+                self.cache.unpin(path)
+
+        self.cache.pin(path)
+        job = threading.Thread(target=run)
+        job.start()
+        with self._filling_lock:
+            self._jobs = [j for j in self._jobs if j.is_alive()] + [job]
+
+
+def _is_range_from_start(header: str) -> bool:
+    return not header or header.replace(" ", "") in ("bytes=0-", "bytes=0-0")
+
+
+def _parse_range(header: str, size: int):
+    """Parse a single 'bytes=a-b' range; returns (start, end) or None."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            start = max(0, size - int(end_s))
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+def export_track(track: dict, cached_path: str, quality: str, directory: str = None):
+    """
+    Copy a cached track into the output directory under its usual name and tag it
+    (used by `play --mode download`). Existing files are left alone.
+    """
+    from cover import download_cover_image
+    from downloader import _format_filename
+    from tagger import tag_audio
+    from utils import sanitize_filename
+
+    directory = directory or config.output_directory
+    output_format = _format_for_quality(quality)
+    filename = sanitize_filename(_format_filename(track, str(track["id"]), output_format))
+    dest = os.path.join(directory, filename)
+    if os.path.exists(dest):
+        return dest
+
+    os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(cached_path, dest + ".part")
+    os.replace(dest + ".part", dest)
+
+    cover_path = None
+    if track.get("albumCover"):
+        cover_path = download_cover_image(
+            track["albumCover"], os.path.join(directory, sanitize_filename(f"{track.get('title', 'cover')}.jpg")),
+        )
+    tag_audio(dest, {
+        "title": track.get("title", ""),
+        "artist": track.get("artist", ""),
+        "album": track.get("albumTitle", ""),
+        "genre": track.get("genre", ""),
+        "date": (track.get("releaseDate") or "")[:4],
+    }, cover_path=cover_path)
+    if cover_path and os.path.exists(cover_path) and not config.keep_cover_file:
+        try:
+            os.remove(cover_path)
+        except OSError:
+            pass
+    return dest
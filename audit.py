@@ -0,0 +1,290 @@
+# audit.py
+"""
+Collection audit: walks the output tree with a process pool and checks every
+audio file for zero-byte or PHANTOM DATA stubs, broken headers, unreadable
+streams, missing tags and missing embedded cover art; optionally it decodes
+FLAC files in full (`flac -t`) to verify the STREAMINFO MD5. Orphaned .lrc
+and cover files are listed too.
+
+Results go to .dabcli/audit.json. Re-runs only re-check files whose size or
+mtime changed. --repair queues broken tracks in .dabcli/repair-queue.json and
+downloads them again.
+"""
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import store
+from config import config
+from utils import load_json, parse_track_filename, save_json
+
+AUDIO_EXTS = {".flac", ".mp3"}
+COVER_EXTS = {".jpg", ".jpeg", ".png"}
+REQUIRED_TAGS = ("title", "artist", "album")
+
+# Issues that mean the audio itself is bad and must be downloaded again
+BROKEN = {"empty", "phantom", "bad_header", "unreadable", "no_duration", "decode_failed"}
+
+
+def _report_path() -> str:
+    return config.state_path("audit.json")
+
+
+def _repair_queue_path() -> str:
+    return config.state_path("repair-queue.json")
+
+
+def check_file(path: str, verify: bool = False) -> list:
+    """Return the list of issue codes for one audio file (empty list = healthy)."""
+    from mutagen.flac import FLAC
+    from mutagen.id3 import ID3
+    from mutagen.mp3 import MP3
+
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return ["unreadable"]
+    if size == 0:
+        return ["empty"]
+    if head.startswith(b"PHANTOM DATA"):
+        return ["phantom"]
+
+    ext = os.path.splitext(path)[1].lower()
+    issues = []
+    try:
+        if ext == ".flac":
+            if not head.startswith(b"fLaC"):
+                return ["bad_header"]
+            audio = FLAC(path)
+            tags = {k.lower() for k in (audio.tags or {}).keys()}
+            has_cover = bool(audio.pictures)
+        else:
+            if not (head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2", b"\xff\xfa")):
+                return ["bad_header"]
+            audio = MP3(path)
+            try:
+                id3 = ID3(path)
+            except Exception:
+                id3 = {}
+            frame_map = {"title": "TIT2", "artist": "TPE1", "album": "TALB"}
+            tags = {name for name, frame in frame_map.items() if frame in id3}
+            has_cover = any(key.startswith("APIC") for key in id3.keys()) if id3 else False
+    except Exception:
+        return ["unreadable"]
+
+    if not getattr(audio.info, "length", 0):
+        issues.append("no_duration")
+    for tag in REQUIRED_TAGS:
+        if tag not in tags:
+            issues.append(f"missing_tag:{tag}")
+    if not has_cover:
+        issues.append("no_cover")
+
+    if verify and ext == ".flac" and "no_duration" not in issues:
+        flac_bin = shutil.which("flac")
+        if not flac_bin:
+            issues.append("verify_unavailable")
+        elif subprocess.run([flac_bin, "-t", "-s", path], capture_output=True).returncode != 0:
+            issues.append("decode_failed")
+    return issues
+
+
+def _check_job(job):
+    rel, path, verify = job
+    return rel, check_file(path, verify)
+
+
+def _scan(root: str):
+    """Return (audio_files, orphans) for the tree, skipping dabcli's own state folder."""
+    state_root = os.path.abspath(config.state_path())
+    audio_files = []
+    orphans = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if os.path.abspath(dirpath).startswith(state_root):
+            dirnames[:] = []
+            continue
+        dirnames[:] = [d for d in dirnames if d not in (".removed",)]
+        audio_bases = {os.path.splitext(n)[0] for n in filenames if os.path.splitext(n)[1].lower() in AUDIO_EXTS}
+        for name in filenames:
+            base, ext = os.path.splitext(name)
+            ext = ext.lower()
+            path = os.path.join(dirpath, name)
+            if ext in AUDIO_EXTS:
+                audio_files.append(path)
+            elif ext == ".lrc" and base not in audio_bases:
+                orphans.append(path)
+            elif ext in COVER_EXTS and not audio_bases:
+                orphans.append(path)
+    return audio_files, orphans
+
+
+def audit_collection(path: str = None, verify: bool = False, workers: int = None, full: bool = False):
+    """
+    Audit every audio file under path (default: output directory).
+    Returns the report dict that is also written to .dabcli/audit.json.
+    """
+    root = os.path.abspath(path or config.output_directory)
+    prefix = os.path.relpath(root, os.path.abspath(config.output_directory))
+    known = (load_json(_report_path(), {}) or {}).get("files", {})
+    # Entries outside an audited subtree are carried over untouched
+    outside = {k: v for k, v in known.items() if not _within(k, prefix)}
+    previous = {} if full else known
+
+    audio_files, orphans = _scan(root)
+    files = {}
+    jobs = []
+    for file_path in audio_files:
+        rel = os.path.relpath(file_path, os.path.abspath(config.output_directory))
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        entry = {"size": st.st_size, "mtime": int(st.st_mtime), "track_id": parse_track_filename(file_path)[3]}
+        old = previous.get(rel)
+        if (old and old.get("size") == entry["size"] and old.get("mtime") == entry["mtime"]
+                and (old.get("verified") or not verify)):
+            files[rel] = old
+            continue
+        entry["verified"] = bool(verify)
+        files[rel] = entry
+        jobs.append((rel, file_path, verify))
+
+    print(f"[Audit] {len(audio_files)} audio files, {len(jobs)} to check "
+          f"({len(audio_files) - len(jobs)} unchanged since last audit)")
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel, issues in pool.map(_check_job, jobs, chunksize=32):
+                files[rel]["issues"] = issues
+
+    report = {
+        "generated": int(time.time()),
+        "root": root,
+        "files": {**outside, **files},
+        "orphans": [os.path.relpath(p, os.path.abspath(config.output_directory)) for p in orphans],
+    }
+    save_json(_report_path(), report)
+    _print_summary(files, report["orphans"])
+    return report
+
+
+def _within(rel: str, prefix: str) -> bool:
+    return prefix in (".", "") or rel == prefix or rel.startswith(prefix + os.sep)
+
+
+def _print_summary(files: dict, orphans: list):
+    counts = {}
+    broken = 0
+    for entry in files.values():
+        issues = entry.get("issues", [])
+        if BROKEN.intersection(issues):
+            broken += 1
+        for issue in issues:
+            counts[issue] = counts.get(issue, 0) + 1
+
+    print(f"[Audit] Broken: {broken} | With issues: {sum(1 for e in files.values() if e.get('issues'))} "
+          f"| Orphaned side files: {len(orphans)}")
+    for issue, count in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"         {issue:<24} {count}")
+    print(f"[Audit] Report written to {_report_path()}")
+
+
+def queue_repairs(report: dict) -> list:
+    """Add broken tracks from a report to the repair queue; returns the queue."""
+    queue = load_json(_repair_queue_path(), []) or []
+    queued = {item["path"] for item in queue}
+    for rel, entry in report.get("files", {}).items():
+        if BROKEN.intersection(entry.get("issues", [])) and entry.get("track_id") and rel not in queued:
+            queue.append({"track_id": entry["track_id"], "path": rel, "issues": entry["issues"]})
+    save_json(_repair_queue_path(), queue)
+    return queue
+
+
+def _backup_path(path: str) -> str:
+    return f"{path}.repair-backup"
+
+
+def _set_aside(path: str):
+    """
+    Move a file out of the way of its re-download, keeping the data until that
+    succeeds. Its store object goes, or the broken audio would just be relinked.
+    """
+    if not os.path.exists(path):
+        return
+    backup = _backup_path(path)
+    try:
+        if os.path.islink(path):
+            raise OSError("symlink")  # would dangle once the object is gone
+        os.link(path, backup)
+    except OSError:
+        shutil.copyfile(path, backup)
+    if store.enabled():
+        store.discard_object(path)
+    os.remove(path)
+
+
+def _restore(path: str):
+    """Put a set-aside file back unless something new took its place."""
+    backup = _backup_path(path)
+    if os.path.exists(backup):
+        if os.path.lexists(path):
+            os.remove(backup)
+        else:
+            os.replace(backup, path)
+
+
+def run_repairs():
+    """
+    Re-download every queued track in place; finished items leave the queue.
+    The broken file is only dropped once its replacement is on disk, and the new
+    file is tagged from the album metadata (with its cover), as retag would.
+    """
+    from downloader import download_track
+    from retag import plan_jobs
+    from search import get_track_metadata_by_id
+    from tagger import tag_audio
+
+    queue = load_json(_repair_queue_path(), []) or []
+    if not queue:
+        print("[Audit] Repair queue is empty.")
+        return
+    print(f"[Audit] Repairing {len(queue)} tracks...")
+
+    remaining = []
+    for item in queue:
+        path = os.path.join(config.output_directory, item["path"])
+        _restore(path)  # left behind by an interrupted repair
+        index, artist, title, _ = parse_track_filename(path)
+        meta = get_track_metadata_by_id(item["track_id"]) or {}
+        # Keep the existing filename: the name parts come from the file itself
+        name_meta = dict(meta, artist=artist or meta.get("artist", "unknown"), title=title or meta.get("title", "untitled"))
+        _set_aside(path)
+        try:
+            new_path = download_track(
+                track_id=item["track_id"],
+                directory=os.path.dirname(path),
+                index=index,
+                track_meta=name_meta,
+            )
+        except BaseException:
+            _restore(path)
+            raise
+        if not new_path or new_path == -1:
+            _restore(path)
+            remaining.append(item)
+            continue
+        if os.path.exists(_backup_path(path)):
+            os.remove(_backup_path(path))
+        # Planned for the final path: the album ID comes from its folder (new_path may be a staged scratch file)
+        jobs, _ = plan_jobs([path])
+        if jobs:
+            _, metadata, cover_path = jobs[0]
+            tag_audio(new_path, metadata, cover_path=cover_path)
+        save_json(_repair_queue_path(), remaining + queue[queue.index(item) + 1:])
+
+    save_json(_repair_queue_path(), remaining)
+    print(f"[Audit] Repaired {len(queue) - len(remaining)} tracks, {len(remaining)} still queued.")
@@ -0,0 +1,85 @@
+# bench_models.py
+"""
+Memory benchmark for models.Track/Album: decodes a synthetic library response
+(50,000 tracks by default, shaped like /libraries/{id}) and compares holding
+the raw dicts against holding Track records.
+
+    python bench_models.py [--tracks N]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+import models
+
+GENRES = ("Rock", "Jazz", "Electronic", "Classical", "Hip-Hop", "Pop", "Metal", "Folk")
+
+
+def synthetic_library(count: int) -> bytes:
+    """A /libraries response body with count tracks spread over ~count/12 albums."""
+    rng = random.Random(46)
+    tracks = []
+    for i in range(count):
+        album = i // 12
+        artist = album // 4
+        tracks.append({
+            "id": 100000000 + i,
+            "title": f"Track {i} of a fairly ordinary length",
+            "artist": f"Artist {artist}",
+            "artistId": 5000 + artist,
+            "albumTitle": f"Album {album}",
+            "albumId": f"{album:08x}",
+            "albumCover": f"https://static.example.com/images/covers/{album:08x}/600x600.jpg",
+            "genre": GENRES[artist % len(GENRES)],
+            "releaseDate": f"{1970 + album % 50}-0{1 + album % 9}-1{album % 10}",
+            "duration": rng.randint(90, 600),
+            # Fields the API sends that dabcli never reads
+            "images": {"small": f"https://static.example.com/{album}/s.jpg",
+                       "large": f"https://static.example.com/{album}/l.jpg"},
+            "audioQuality": {"maximumBitDepth": 24, "maximumSamplingRate": 96, "isHiRes": True},
+            "isrc": f"USRC1{i:07d}",
+            "version": None,
+            "label": f"Label {artist % 40}",
+            "trackNumber": i % 12 + 1,
+            "discNumber": 1,
+            "parental_warning": False,
+            "streamable": True,
+        })
+    body = {"library": {"id": "bench", "name": "Benchmark", "tracks": tracks}}
+    return json.dumps(body).encode("utf-8")
+
+
+def measure(label: str, body: bytes, decode, build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    tracks = build(decode(body)["library"]["tracks"])
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} held {current / 2**20:7.1f} MB   peak {peak / 2**20:7.1f} MB   {elapsed:6.2f}s")
+    del tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare raw dicts and Track records on a synthetic library")
+    parser.add_argument("--tracks", type=int, default=50000, help="Number of tracks (default: 50000)")
+    args = parser.parse_args()
+
+    body = synthetic_library(args.tracks)
+    print(f"{args.tracks} tracks, {len(body) / 2**20:.1f} MB of JSON\n")
+    measure("json + dicts", body, json.loads, lambda tracks: tracks)
+    measure("json + Track", body, json.loads, models.parse_tracks)
+    if models.orjson is not None:
+        measure("orjson + dicts", body, models.orjson.loads, lambda tracks: tracks)
+        measure("orjson + Track", body, models.orjson.loads, models.parse_tracks)
+    else:
+        print("(orjson not installed: install it to compare the fast decoder)")
+
+
+if __name__ == "__main__":
+    main()
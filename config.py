@@ -22,6 +22,32 @@ class Config:
     delete_raw_files: bool = True
     keep_cover_file: bool = False
     get_lyrics: bool = True 
+    use_object_store: bool = False
+    store_link_mode: str = "hardlink"
+    stream_cache: bool = True
+    stream_cache_directory: str = ""
+    stream_cache_size_mb: int = 2048
+    prefetch_tracks: int = 2
+    prefetch_buffer_mb: int = 150
+    segmented_download: bool = False
+    segment_threshold_mb: int = 64
+    segment_connections: int = 4
+    cover_max_dimension: int = 1200
+    cover_max_bytes: int = 512000
+    api_max_concurrency: int = 8
+    api_latency_slo_ms: int = 1500
+    cdn_max_concurrency: int = 6
+    content_dedupe: bool = False
+    play_local_first: bool = True
+    retry_attempts: int = 3
+    retry_backoff_seconds: int = 5
+    staging_directory: str = ""
+    staging_max_mb: int = 2048
+    metrics_port: int = 0
+    metrics_textfile: str = ""
+    inflight_buffer_mb: int = 1
+    cover_memory_mb: int = 32
+    tag_concurrency: int = 2
 
     debug: bool = field(default=False, init=False)
     show_progress: bool = field(default=True, init=False)
@@ -51,6 +77,32 @@ class Config:
         self.delete_raw_files = data.get("delete_raw_files", self.delete_raw_files)
         self.keep_cover_file = data.get("keep_cover_file", self.keep_cover_file)
         self.get_lyrics = data.get("get_lyrics", self.get_lyrics)
+        self.use_object_store = data.get("use_object_store", self.use_object_store)
+        self.store_link_mode = data.get("store_link_mode", self.store_link_mode)
+        self.stream_cache = data.get("stream_cache", self.stream_cache)
+        self.stream_cache_directory = data.get("stream_cache_directory", self.stream_cache_directory)
+        self.stream_cache_size_mb = data.get("stream_cache_size_mb", self.stream_cache_size_mb)
+        self.prefetch_tracks = data.get("prefetch_tracks", self.prefetch_tracks)
+        self.prefetch_buffer_mb = data.get("prefetch_buffer_mb", self.prefetch_buffer_mb)
+        self.segmented_download = data.get("segmented_download", self.segmented_download)
+        self.segment_threshold_mb = data.get("segment_threshold_mb", self.segment_threshold_mb)
+        self.segment_connections = data.get("segment_connections", self.segment_connections)
+        self.cover_max_dimension = data.get("cover_max_dimension", self.cover_max_dimension)
+        self.cover_max_bytes = data.get("cover_max_bytes", self.cover_max_bytes)
+        self.api_max_concurrency = data.get("api_max_concurrency", self.api_max_concurrency)
+        self.api_latency_slo_ms = data.get("api_latency_slo_ms", self.api_latency_slo_ms)
+        self.cdn_max_concurrency = data.get("cdn_max_concurrency", self.cdn_max_concurrency)
+        self.content_dedupe = data.get("content_dedupe", self.content_dedupe)
+        self.play_local_first = data.get("play_local_first", self.play_local_first)
+        self.retry_attempts = data.get("retry_attempts", self.retry_attempts)
+        self.retry_backoff_seconds = data.get("retry_backoff_seconds", self.retry_backoff_seconds)
+        self.staging_directory = data.get("staging_directory", self.staging_directory)
+        self.staging_max_mb = data.get("staging_max_mb", self.staging_max_mb)
+        self.metrics_port = data.get("metrics_port", self.metrics_port)
+        self.metrics_textfile = data.get("metrics_textfile", self.metrics_textfile)
+        self.inflight_buffer_mb = data.get("inflight_buffer_mb", self.inflight_buffer_mb)
+        self.cover_memory_mb = data.get("cover_memory_mb", self.cover_memory_mb)
+        self.tag_concurrency = data.get("tag_concurrency", self.tag_concurrency)
         self.debug = data.get("debug", self.debug)
         self.show_progress = data.get("show_progress", self.show_progress)
 
@@ -108,6 +160,10 @@ class Config:
         else:
             raise Exception("Auto-login failed. Please check credentials in config.json")
 
+    def state_path(self, *parts):
+        """Path inside the hidden .dabcli state folder of the output directory."""
+        return os.path.join(self.output_directory, ".dabcli", *parts)
+
     def get_auth_header(self):
         if not self.token:
             print("No token found, attempting login...")
@@ -1,10 +1,16 @@
 # cover.py
-import requests
+import functools
+import hashlib
+import io
 import os
+import struct
+
+import transport
+from config import config
 
 def download_cover_image(url: str, save_path: str) -> str:
     try:
-        response = requests.get(url, stream=True)
+        response = transport.request("GET", url, stream=True)
         response.raise_for_status()
         with open(save_path, "wb") as f:
             for chunk in response.iter_content(8192):
@@ -12,4 +18,143 @@ def download_cover_image(url: str, save_path: str) -> str:
         return save_path
     except Exception as e:
         print(f"Cover download failed: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# === Embedded artwork ===
+# Image signatures -> (mime, extension)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"GIF87a", "image/gif", "gif"),
+    (b"GIF89a", "image/gif", "gif"),
+)
+
+_warned_no_pillow = False
+
+
+def detect_image_format(data: bytes):
+    """Return (mime, extension) from the image's magic bytes, or (None, None)."""
+    for magic, mime, ext in _SIGNATURES:
+        if data.startswith(magic):
+            return mime, ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return None, None
+
+
+def _shrink(data: bytes, max_dimension: int, max_bytes: int):
+    """
+    Downscale/re-encode with Pillow to fit the limits. Returns JPEG bytes, None
+    without Pillow, or the original bytes if Pillow can't decode the image.
+    """
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return None
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = img.convert("RGB")
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        while True:
+            for quality in (90, 85, 80, 70, 60):
+                buf = io.BytesIO()
+                img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+                if not max_bytes or buf.tell() <= max_bytes:
+                    return buf.getvalue()
+            if max(img.size) <= 200:
+                return buf.getvalue()
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        print(f"[Cover] Could not decode the cover ({e}); embedding it at full size.")
+        return data
+
+
+def embed_cover(cover_path: str, max_dimension: int = 0, max_bytes: int = 0):
+    """
+    Return (data, mime) of the artwork to embed for cover_path, capped to
+    max_dimension pixels and max_bytes (0 = no limit). The capped variant is
+    cached under .dabcli/covers by source hash, so an album's cover is
+    processed once and reused for every track (and every later run).
+    The cover file itself is left untouched.
+    """
+    st = os.stat(cover_path)
+    return _embed_cover(cover_path, st.st_mtime_ns, st.st_size, max_dimension, max_bytes)
+
+
+@functools.lru_cache(maxsize=8)
+def _embed_cover(cover_path: str, mtime_ns: int, size: int, max_dimension: int, max_bytes: int):
+    """embed_cover for one version of a file: an album's tracks reuse the result without re-reading it."""
+    global _warned_no_pillow
+    with open(cover_path, "rb") as f:
+        data = f.read()
+    mime, _ = detect_image_format(data)
+    mime = mime or "image/jpeg"
+
+    if not max_dimension and not max_bytes:
+        return data, mime
+
+    digest = hashlib.sha1(data).hexdigest()
+    variant = config.state_path("covers", f"{digest}-{max_dimension}-{max_bytes}")
+    if os.path.exists(variant):
+        with open(variant, "rb") as f:
+            cached = f.read()
+        return cached, detect_image_format(cached)[0] or mime
+
+    too_large = bool(max_bytes) and len(data) > max_bytes
+    if not too_large and max_dimension:
+        too_large = _too_many_pixels(data, mime, max_dimension)
+
+    result = data
+    if too_large:
+        shrunk = _shrink(data, max_dimension, max_bytes)
+        if shrunk is None:
+            if not _warned_no_pillow:
+                print("[Cover] Install Pillow to downscale large covers; embedding them at full size.")
+                _warned_no_pillow = True
+            return data, mime
+        result = shrunk
+        mime = detect_image_format(result)[0] or mime
+
+    os.makedirs(os.path.dirname(variant), exist_ok=True)
+    tmp_path = f"{variant}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(result)
+    os.replace(tmp_path, variant)
+    return result, mime
+
+
+def _too_many_pixels(data: bytes, mime: str, max_dimension: int) -> bool:
+    size = image_size(data, mime)
+    return bool(size) and max(size) > max_dimension
+
+
+def image_size(data: bytes, mime: str = None):
+    """(width, height) read from a PNG/JPEG/GIF header, or None."""
+    mime = mime or detect_image_format(data)[0]
+    try:
+        if mime == "image/png":
+            return struct.unpack(">II", data[16:24])
+        if mime == "image/gif":
+            return struct.unpack("<HH", data[6:10])
+        if mime == "image/jpeg":
+            pos = 2
+            while pos + 9 < len(data):
+                if data[pos] != 0xFF:
+                    pos += 1
+                    continue
+                marker = data[pos + 1]
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                    pos += 1 if marker == 0xFF else 2
+                    continue
+                length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+                # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC) carry the frame size
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+                    return width, height
+                pos += 2 + length
+    except struct.error:
+        pass
+    return None
@@ -6,6 +6,10 @@ import zipfile
 import requests
 from tabulate import tabulate
 
+import events
+import governor
+import metrics
+import transport
 from api import login
 from config import clear_credentials, config
 from cover import download_cover_image
@@ -13,7 +17,7 @@ from downloader import download_track
 from search import get_track_metadata_by_id, search_and_print
 from streamer import stream_cli_entry
 from tagger import tag_audio
-from utils import require_login
+from utils import remember_listing, require_login
 
 ASCII_ART = r"""
   _____          ____  __  __           _         _____ _      _____       
@@ -45,24 +49,63 @@ Available Commands:
   dabcli.py search "<query>" [--type track|album|artist]
       → Search for tracks, albums, or artists
 
-  dabcli.py discography <artist-id or artist name> [--view-only]
-      → Downloads all albums by a specific artist
+  dabcli.py discography <artist-id or artist name> [--view-only] [--sync] [--plan]
+      → Downloads all albums by a specific artist (--sync: only new or unfinished releases)
 
 dabcli.py track <track-id> [--format mp3|flac] [--title ...] [--artist ...] [--album ...] [--genre ...] [--date ...] [--path ...]
       → Download and tag a single track
 
-  dabcli.py album "<album-id or title>" [--format mp3|flac] [--title ...] [--artist ...] [--album ...] [--genre ...] [--date ...] [--path ...]
-      → Download an entire album by ID or title
+  dabcli.py album "<album-id or title>" [--format mp3|flac] [--title ...] [--artist ...] [--album ...] [--genre ...] [--date ...] [--path ...] [--plan]
+      → Download an entire album by ID or title (--plan: only show what would be fetched)
 
-  dabcli.py play --track-id <id> | --album-id <id> | --queue <ids...> | --library-id <id>
-      → Stream tracks, albums, or libraries
+  dabcli.py play --track-id <id> | --album-id <id> | --queue <ids...> | --library-id <id> [--mode stream|download] [--offline]
+      → Play tracks, albums, or libraries; downloaded tracks play from disk (download mode also saves tagged files)
 
   dabcli.py library <library-id> [--quality ...] [--format mp3|flac] [--title ...] [--artist ...] [--album ...] [--genre ...] [--date ...] [--path ...]
       → Download an entire library by ID
 
+  dabcli.py library <library-id> --plan
+      → Show new/linked/present tracks, bytes to transfer, ETA and free space without downloading
+
+  dabcli.py library <library-id> --sync [--prune | --quarantine]
+      → Download only tracks added since the last sync; optionally delete or quarantine removed ones
+
+  dabcli.py store stats|import|rebuild [--dry-run]
+      → Manage the object store (use_object_store): show usage, adopt existing files, rebuild folder views
+
+  dabcli.py audit [path] [--verify] [--full] [--workers N] [--repair]
+      → Check downloaded files for stubs, corruption, missing tags/covers and orphaned side files
+
+  dabcli.py retag <path | album-id | library-id> [--workers N]
+      → Rewrite tags of downloaded files from cached metadata (no audio is downloaded)
+
+  dabcli.py retry [file]
+      → Try the tracks that still failed after a run's deferred retries again (default: .dabcli/retry.json)
+
+  dabcli.py dedupe [path] [--workers N] [--dry-run]
+      → Share identical audio between files with different track IDs (hardlinks, or reflinks keeping each file's tags)
+
+  dabcli.py queue add album|track|artist <ids...> | queue status
+      → Add jobs to the shared work queue in the output directory, or show its state
+
+  dabcli.py worker [--lease 300] [--once] [--exit-when-idle]
+      → Take jobs from the shared queue; run one per machine (or several) against the same output directory
+
+  dabcli.py shell
+      → Interactive shell: one warm process, cached lookups, row numbers as IDs, downloads in the background
+
   dabcli.py update
       → Update DAB CLI to latest version from GitHub
 
+  dabcli.py --events jsonl <command> ...
+      → Headless mode: one JSON event per line on stdout (started, progress, skipped, linked, completed, failed, tagged)
+
+  dabcli.py --record <dir> <command> ... | --replay <dir> [--latency-scale 0.5] <command> ...
+      → Save every HTTP exchange (with timings) to a folder, or re-run a command offline from such a recording
+
+  dabcli.py --metrics-port 9477 | --metrics-textfile <path> <command> ...
+      → Expose Prometheus metrics (throughput, outcomes, API latency, retries) for long jobs
+
   dabcli.py --version
       → Check version of DABMusic CLI and compare with GitHub
 """
@@ -139,7 +182,8 @@ def update_dabcli():
 
 
 # ===== MAIN =====
-def main():
+def build_parser():
+    """The dabcli argument parser; returns (parser, subparsers)."""
     parser = argparse.ArgumentParser(
         description="DAB CLI — Download and Browse music from DAB Music Player",
         add_help=False,  # we handle help manually
@@ -149,6 +193,15 @@ def main():
     # Global args
     parser.add_argument("--version", action="store_true", help="Show current version")
     parser.add_argument("--help", "-h", action="store_true", help="Show detailed help for a command")
+    parser.add_argument("--events", choices=["human", "jsonl"], default="human",
+                        help="Output format: human-readable (default) or JSON lines on stdout for headless runs")
+    transport_group = parser.add_mutually_exclusive_group()
+    transport_group.add_argument("--record", metavar="DIR", help="Save every HTTP request/response with its timings to DIR")
+    transport_group.add_argument("--replay", metavar="DIR", help="Answer HTTP requests from a recording in DIR (no network)")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="With --replay: multiply recorded latencies (0 = no delays)")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-textfile", metavar="PATH", help="Rewrite Prometheus metrics to PATH (node_exporter textfile)")
     
     # ===== Subparsers =====
     subparsers.add_parser("status", help="Check login/authentication status")
@@ -172,6 +225,8 @@ def main():
     discog_parser.add_argument("--sort-order", choices=["asc", "desc"], default="asc", help="Sort order")
     discog_parser.add_argument("--view-only", action="store_true", help="Only view albums, do not download")
     discog_parser.add_argument("--limit", type=int, help="Limit number of albums to download")
+    discog_parser.add_argument("--sync", action="store_true", help="Only download new releases and unfinished albums")
+    discog_parser.add_argument("--plan", action="store_true", help="Show sizes, ETA and free space without downloading")
     
     # Metadata overrides
     for arg, desc in [
@@ -200,6 +255,7 @@ def main():
     
     album_parser = subparsers.add_parser("album", help="Download an album by ID or title")
     album_parser.add_argument("album_id_or_title", help="Album ID or title")
+    album_parser.add_argument("--plan", action="store_true", help="Show sizes, ETA and free space without downloading")
     
     play_parser = subparsers.add_parser("play", help="Stream tracks, albums, or libraries")
     play_parser.add_argument("--track-id", help="Track ID to play")
@@ -208,16 +264,76 @@ def main():
     play_parser.add_argument("--library-id", help="Library ID to play")
     play_parser.add_argument("--quality", help="Streaming quality")
     play_parser.add_argument("--mode", choices=["stream", "download"], default="stream", help="Mode")
+    play_parser.add_argument("--offline", action="store_true", help="Play only downloaded (or cached) tracks, without the API")
     
     library_parser = subparsers.add_parser("library", help="Download all tracks in a library")
     library_parser.add_argument("library_id", help="Library ID")
     library_parser.add_argument("--quality", help="Preferred quality")
+    library_parser.add_argument("--sync", action="store_true", help="Only download tracks added since the last sync")
+    library_parser.add_argument("--plan", action="store_true", help="Show sizes, ETA and free space without downloading")
+    library_parser.add_argument("--prune", action="store_true", help="With --sync: delete tracks removed from the library")
+    library_parser.add_argument("--quarantine", action="store_true", help="With --sync: move removed tracks to .removed/")
+    
+    store_parser = subparsers.add_parser("store", help="Manage the content-addressed audio store")
+    store_parser.add_argument("action", choices=["stats", "import", "rebuild"], help="Store action")
+    store_parser.add_argument("--dry-run", action="store_true", help="Only show what rebuild would change")
+    
+    audit_parser = subparsers.add_parser("audit", help="Check the integrity of downloaded files")
+    audit_parser.add_argument("path", nargs="?", help="Folder to audit (default: output directory)")
+    audit_parser.add_argument("--verify", action="store_true", help="Fully decode FLACs and check the STREAMINFO MD5 (needs flac)")
+    audit_parser.add_argument("--full", action="store_true", help="Re-check files unchanged since the last audit")
+    audit_parser.add_argument("--workers", type=int, help="Number of worker processes")
+    audit_parser.add_argument("--repair", action="store_true", help="Queue broken tracks and download them again")
+    
+    retag_parser = subparsers.add_parser("retag", help="Re-tag downloaded files without downloading audio")
+    retag_parser.add_argument("target", help="Folder or file, downloaded album ID, or library ID")
+    retag_parser.add_argument("--workers", type=int, help="Number of worker processes")
+    
+    retry_parser = subparsers.add_parser("retry", help="Retry tracks that failed in earlier runs")
+    retry_parser.add_argument("file", nargs="?", help="Retry file (default: .dabcli/retry.json in the output directory)")
+    
+    dedupe_parser = subparsers.add_parser("dedupe", help="Share identical audio stored under different track IDs")
+    dedupe_parser.add_argument("path", nargs="?", help="Folder to deduplicate (default: output directory)")
+    dedupe_parser.add_argument("--workers", type=int, help="Number of hashing processes")
+    dedupe_parser.add_argument("--dry-run", action="store_true", help="Only list duplicates and the space they use")
+    
+    queue_parser = subparsers.add_parser("queue", help="Manage the shared work queue")
+    queue_parser.add_argument("action", choices=["add", "status"], help="Queue action")
+    queue_parser.add_argument("kind", nargs="?", choices=["album", "track", "artist"], help="Job type for add")
+    queue_parser.add_argument("ids", nargs="*", help="Album, track or artist IDs for add")
+    
+    worker_parser = subparsers.add_parser("worker", help="Process jobs from the shared work queue")
+    worker_parser.add_argument("--lease", type=int, default=300, help="Lease time in seconds before a silent worker's job is reclaimed")
+    worker_parser.add_argument("--once", action="store_true", help="Run a single job and exit")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="Exit when no jobs are left instead of polling")
+    
+    subparsers.add_parser("shell", help="Interactive shell: run commands in one warm process")
     
     help_parser = subparsers.add_parser("help", help="Show help for a specific command")
     help_parser.add_argument("command_name", nargs="?", help="Command to get help for")
+    return parser, subparsers
+
+
+def main():
+    parser, subparsers = build_parser()
     
     # ===== Parse args =====
     args = parser.parse_args()
+    if args.events != "human":
+        events.configure(args.events)
+    if args.record or args.replay:
+        transport.configure(record=args.record, replay=args.replay, latency_scale=args.latency_scale)
+    metrics.start(args.metrics_port or config.metrics_port, args.metrics_textfile or config.metrics_textfile)
+    
+    if args.command == "shell":
+        from shell import run_shell
+        run_shell(parser, subparsers, run)
+        return
+    run(args, subparsers)
+
+
+def run(args, subparsers):
+    """Execute one parsed command (also used by the shell for every line)."""
     if getattr(args, "format", None):
         config.output_format = args.format  # fixme
     
@@ -246,6 +362,10 @@ def main():
         print(COMMANDS_HELP)
         return
     
+    # Download, sync and play runs always end with the resource report
+    if args.command in ("track", "album", "discography", "library", "play", "retry", "worker"):
+        governor.schedule_report()
+    
     # ===== COMMAND HANDLERS =====
     if args.command == "update":
         update_dabcli()
@@ -293,6 +413,8 @@ def main():
             view_only=args.view_only,
             limit=args.limit,
             cli_args=args,  # pass args for metadata overrides
+            sync=args.sync,
+            plan=args.plan,
         )
     
     elif args.command == "track":
@@ -349,11 +471,14 @@ def main():
     elif args.command == "album":
         if not require_login(config): return
         from album import download_album, find_album_by_title
+        fetch_album = download_album
+        if args.plan:
+            from planner import plan_album as fetch_album
         inp = args.album_id_or_title.strip()
         
         if inp.startswith("al") and len(inp) > 5:
             print(f"Fetching album by ID: {inp}")
-            download_album(inp, cli_args=args)
+            fetch_album(inp, cli_args=args)
             return
         
         print(f"Searching for album titled '{inp}'...")
@@ -366,7 +491,7 @@ def main():
         if len(matches) == 1:
             album = matches[0]
             print(f"Selected: {album['title']} by {album['artist']} (ID: {album['id']})")
-            download_album(album["id"], cli_args=args)
+            fetch_album(album["id"], cli_args=args)
             return
         
         table = [
@@ -374,20 +499,81 @@ def main():
             for i, a in enumerate(matches, 1)
         ]
         print(tabulate(table, headers=["No", "Title", "Artist", "Year", "Album ID"], tablefmt="fancy_grid"))
+        remember_listing("album", [a["id"] for a in matches])
         try:
             choice = int(input("\nEnter the number of the album to download: "))
-            download_album(matches[choice - 1]["id"], cli_args=args)
+            fetch_album(matches[choice - 1]["id"], cli_args=args)
         except:
             print("Invalid selection.")
     
     elif args.command == "play":
-        if not require_login(config): return
+        if not args.offline and not require_login(config): return
         stream_cli_entry(args)
     
     elif args.command == "library":
         if not require_login(config): return
-        from library import download_library
-        download_library(args.library_id, quality=args.quality, cli_args=args)
+        from library import download_library, sync_library
+        if args.plan:
+            from planner import plan_library
+            plan_library(args.library_id, cli_args=args)
+        elif args.sync:
+            sync_library(args.library_id, quality=args.quality, cli_args=args,
+                         prune=args.prune, quarantine=args.quarantine)
+        else:
+            download_library(args.library_id, quality=args.quality, cli_args=args)
+    
+    elif args.command == "audit":
+        from audit import audit_collection, queue_repairs, run_repairs
+        report = audit_collection(args.path, verify=args.verify, workers=args.workers, full=args.full)
+        if args.repair:
+            if not require_login(config): return
+            queue_repairs(report)
+            run_repairs()
+    
+    elif args.command == "retag":
+        if not require_login(config): return
+        from retag import retag
+        retag(args.target, workers=args.workers)
+    
+    elif args.command == "retry":
+        if not require_login(config): return
+        from retryqueue import run_retry_file
+        run_retry_file(args.file)
+    
+    elif args.command == "dedupe":
+        from dedupe import dedupe_collection
+        dedupe_collection(args.path, workers=args.workers, dry_run=args.dry_run)
+    
+    elif args.command == "queue":
+        import workqueue
+        if args.action == "add":
+            if not args.kind or not args.ids:
+                print("Usage: dabcli.py queue add album|track|artist <ids...>")
+                return
+            added = sum(workqueue.add_job(args.kind, job_id) for job_id in args.ids)
+            print(f"[Queue] Added {added} jobs ({len(args.ids) - added} already queued or done)")
+        else:
+            counts = workqueue.status()
+            print(f"[Queue] Pending: {counts['jobs']} | Leased: {counts['leased']} | "
+                  f"Done: {counts['done']} | Failed: {counts['failed']}")
+    
+    elif args.command == "worker":
+        if not require_login(config): return
+        from workqueue import run_worker
+        run_worker(cli_args=args, lease_seconds=args.lease, once=args.once, idle_exit=args.exit_when_idle)
+    
+    elif args.command == "store":
+        import store
+        if args.action == "import":
+            adopted, linked, reclaimed = store.import_existing()
+            print(f"[Store] Adopted {adopted} files, replaced {linked} copies with links "
+                  f"({reclaimed / 1024 / 1024:.1f} MB reclaimed)")
+        elif args.action == "rebuild":
+            created, renamed, unchanged = store.rebuild_views(dry_run=args.dry_run)
+            print(f"[Store] Views: {created} linked, {renamed} renamed, {unchanged} unchanged")
+        else:
+            objects, size, views = store.stats()
+            print(f"[Store] {objects} objects, {size / 1024 / 1024:.1f} MB unique audio, {views} views")
     
     else:
         print("Unknown command.\n")
@@ -0,0 +1,402 @@
+# dedupe.py
+"""
+Content-hash deduplication across track IDs.
+
+The same recording often ships under several track IDs (editions, compilations,
+reissues), so the filename-based dedupe in download_track never sees it. Each
+file's audio payload is keyed independently of its tags:
+
+  FLAC  STREAMINFO MD5 of the decoded audio (+ sample count); a hash of the
+        audio frames when the encoder left the MD5 empty
+  MP3   SHA-1 of the frame data between the ID3v2 header and ID3v1/APE trailer
+
+Keys live in .dabcli/dedupe/<xx>.jsonl, sharded by a hash of the key so the
+check after each download reads and appends to one small shard instead of
+rewriting an index of the whole collection. Later lines for a path replace
+earlier ones; `dedupe` compacts the shards (files are re-hashed only when
+their size or mtime changes).
+Duplicates are replaced by:
+  - a hardlink, when the two files are byte-identical (tags included);
+  - a reflink clone of the first copy with the duplicate's own tags written
+    back, when only the tags differ (needs a copy-on-write filesystem such as
+    btrfs or XFS; elsewhere such files are reported and left alone).
+"""
+import filecmp
+import hashlib
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import config
+from utils import load_json
+
+AUDIO_EXTS = {".flac", ".mp3"}
+FICLONE = 0x40049409  # linux/fs.h
+SHARD_CHARS = 2  # 256 shards
+
+_index_lock = threading.Lock()
+
+
+def _legacy_index_path() -> str:
+    return config.state_path("dedupe.json")  # single-file index of earlier versions
+
+
+def _shard_path(key: str) -> str:
+    shard = hashlib.sha1(key.encode("utf-8")).hexdigest()[:SHARD_CHARS]
+    return config.state_path("dedupe", f"{shard}.jsonl")
+
+
+# === Payload keys ===
+def _flac_key(f, size: int):
+    if f.read(4) != b"fLaC":
+        return None
+    md5 = samples = None
+    last = False
+    while not last:
+        header = f.read(4)
+        if len(header) < 4:
+            return None
+        last = bool(header[0] & 0x80)
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:], "big")
+        block = f.read(length)
+        if block_type == 0 and length >= 34:
+            # 8 bytes of rate/channels/bps/total samples end in the 36-bit sample count
+            samples = struct.unpack(">Q", block[10:18])[0] & 0xFFFFFFFFF
+            md5 = block[18:34]
+    offset = f.tell()
+    if md5 and any(md5):
+        return f"flac:{md5.hex()}:{samples}", size - offset
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        digest.update(chunk)
+    return f"flac-frames:{digest.hexdigest()}", size - offset
+
+
+def _mp3_key(f, size: int):
+    start = 0
+    head = f.read(10)
+    if head[:3] == b"ID3" and len(head) == 10:
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[5] & 0x10 else 0)  # footer flag
+    end = size
+    if size >= 128:
+        f.seek(size - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+    if end >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b"APETAGEX":
+            end -= struct.unpack("<I", footer[12:16])[0] + (32 if footer[23] & 0x80 else 0)
+    if end <= start:
+        return None
+    digest = hashlib.sha1()
+    f.seek(start)
+    remaining = end - start
+    while remaining:
+        chunk = f.read(min(1 << 20, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return f"mp3:{digest.hexdigest()}", end - start
+
+
+def payload_key(path: str):
+    """(key, payload_bytes) identifying the audio independent of its tags, or None."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if ext == ".flac":
+                return _flac_key(f, size)
+            if ext == ".mp3":
+                return _mp3_key(f, size)
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def _key_job(job):
+    rel, path = job
+    return rel, payload_key(path)
+
+
+# === Linking ===
+def _copy_tags(src: str, dst: str):
+    """Replace dst's tags (and pictures) with src's."""
+    ext = os.path.splitext(src)[1].lower()
+    if ext == ".flac":
+        from mutagen.flac import FLAC
+        source, target = FLAC(src), FLAC(dst)
+        target.clear()
+        target.clear_pictures()
+        if source.tags:
+            for key, values in source.tags.as_dict().items():
+                target[key] = values
+        for picture in source.pictures:
+            target.add_picture(picture)
+        target.save()
+    else:
+        from mutagen.id3 import ID3, ID3NoHeaderError
+        from mutagen.id3 import delete as delete_id3
+        delete_id3(dst)
+        try:
+            ID3(src).save(dst)
+        except ID3NoHeaderError:
+            pass
+
+
+def _tmp_path(path: str) -> str:
+    base, ext = os.path.splitext(path)
+    return f"{base}.dedupe{ext}"  # keeps the extension, which decides the tag format
+
+
+def _reflink(src: str, dst: str) -> bool:
+    import fcntl
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except (OSError, AttributeError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def share_payload(original: str, duplicate: str):
+    """
+    Make duplicate share original's data. Returns "hardlink", "reflink", or
+    None if it could not be done (no CoW support, or the result did not verify).
+    """
+    tmp = _tmp_path(duplicate)
+    if filecmp.cmp(original, duplicate, shallow=False):
+        try:
+            os.link(original, tmp)
+            os.replace(tmp, duplicate)
+            return "hardlink"
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+    if not _reflink(original, tmp):
+        return None
+    try:
+        _copy_tags(duplicate, tmp)
+        st = os.stat(duplicate)
+        if payload_key(tmp) != payload_key(duplicate):
+            raise OSError("payload changed while copying tags")
+        os.replace(tmp, duplicate)
+        os.utime(duplicate, ns=(st.st_atime_ns, st.st_mtime_ns))
+        return "reflink"
+    except Exception as e:
+        print(f"[Dedupe] Could not share {os.path.basename(duplicate)}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+
+
+# === Index ===
+def _scan(root: str) -> list:
+    state_root = os.path.abspath(config.state_path())
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if os.path.abspath(dirpath).startswith(state_root):
+            dirnames[:] = []
+            continue
+        dirnames[:] = [d for d in dirnames if d not in (".removed", ".excluded")]
+        files.extend(os.path.join(dirpath, n) for n in filenames
+                     if os.path.splitext(n)[1].lower() in AUDIO_EXTS)
+    return sorted(files)
+
+
+def _rel(path: str) -> str:
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(config.output_directory))
+
+
+def _entry(path: str, key_info) -> dict:
+    st = os.stat(path)
+    key, payload = key_info
+    return {"size": st.st_size, "mtime": int(st.st_mtime), "key": key, "payload": payload}
+
+
+def _read_shard(path: str, files: dict):
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    files[entry.pop("path")] = entry
+                except (ValueError, KeyError):
+                    continue  # a line cut short by a crash
+    except OSError:
+        pass
+
+
+def _load_index() -> dict:
+    """Every indexed file: relative path -> entry."""
+    files = dict((load_json(_legacy_index_path(), {}) or {}).get("files", {}))
+    folder = config.state_path("dedupe")
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".jsonl"):
+                _read_shard(os.path.join(folder, name), files)
+    return files
+
+
+def _line(rel: str, entry: dict) -> str:
+    return json.dumps({"path": rel, **entry}, ensure_ascii=False) + "\n"
+
+
+def _append(rel: str, entry: dict):
+    path = _shard_path(entry["key"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _index_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(_line(rel, entry))  # one write per line: appends from other processes do not interleave
+
+
+def _compact(files: dict):
+    """Rewrite the shards from files (dropping superseded lines) and retire the legacy index."""
+    shards = {}
+    for rel, entry in sorted(files.items()):
+        shards.setdefault(_shard_path(entry["key"]), []).append(_line(rel, entry))
+    folder = config.state_path("dedupe")
+    os.makedirs(folder, exist_ok=True)
+    with _index_lock:
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.endswith(".jsonl") and path not in shards:
+                os.remove(path)
+        for path, lines in shards.items():
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        if os.path.exists(_legacy_index_path()):
+            os.remove(_legacy_index_path())
+
+
+def record(path: str):
+    """Hash one new file into the index and return its key info (or None)."""
+    key_info = payload_key(path)
+    if not key_info:
+        return None
+    _append(_rel(path), _entry(path, key_info))
+    return key_info
+
+
+def check_new(path: str):
+    """
+    Inline check after a download: if the same audio already exists under
+    another name, turn the new file into a reflink of it (tags are written
+    afterwards as usual). Only reflinks are used here, because the new file's
+    tags are about to differ from the original's.
+    """
+    key_info = record(path)
+    if not key_info:
+        return None
+    files = {}
+    _read_shard(_shard_path(key_info[0]), files)  # every file with this key is in this shard
+    me = _rel(path)
+    root = os.path.abspath(config.output_directory)
+    for rel, entry in files.items():
+        if rel == me or entry.get("key") != key_info[0]:
+            continue
+        original = os.path.join(root, rel)
+        if not os.path.isfile(original) or os.path.samefile(original, path):
+            continue
+        st = os.stat(original)
+        if entry.get("size") != st.st_size or entry.get("mtime") != int(st.st_mtime):
+            # Changed since it was indexed (e.g. re-tagged, or replaced): hash it again
+            fresh = record(original)
+            if not fresh or fresh[0] != key_info[0]:
+                continue
+        tmp = _tmp_path(path)
+        if not _reflink(original, tmp):
+            return None  # filesystem without reflinks: nothing to gain
+        try:
+            _copy_tags(path, tmp)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        print(f"[Dedupe] Same audio as {rel}; sharing its data ({key_info[1] / 1024 / 1024:.1f} MB)")
+        return original
+    return None
+
+
+def dedupe_collection(path: str = None, workers: int = None, dry_run: bool = False):
+    """Hash every audio file under path, then share identical payloads. Returns bytes reclaimed."""
+    root = os.path.abspath(path or config.output_directory)
+    known = _load_index()
+
+    files = {}
+    jobs = []
+    for file_path in _scan(root):
+        rel = _rel(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        old = known.get(rel)
+        if old and old.get("size") == st.st_size and old.get("mtime") == int(st.st_mtime):
+            files[rel] = old
+        else:
+            jobs.append((rel, file_path))
+
+    print(f"[Dedupe] {len(files) + len(jobs)} audio files, {len(jobs)} to hash")
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel, key_info in pool.map(_key_job, jobs, chunksize=32):
+                if key_info:
+                    files[rel] = _entry(os.path.join(os.path.abspath(config.output_directory), rel), key_info)
+
+    groups = {}
+    for rel, entry in sorted(files.items()):
+        groups.setdefault(entry["key"], []).append(rel)
+
+    base = os.path.abspath(config.output_directory)
+    reclaimed = shared = unsupported = 0
+    for key, members in groups.items():
+        if len(members) < 2:
+            continue
+        original = os.path.join(base, members[0])
+        for rel in members[1:]:
+            duplicate = os.path.join(base, rel)
+            try:
+                if os.path.samefile(original, duplicate):
+                    continue
+                if os.stat(duplicate).st_nlink > 1:
+                    continue  # already a link (e.g. an object-store view); leave it
+            except OSError:
+                continue
+            if dry_run:
+                print(f"[Dedupe] {rel} duplicates {members[0]}")
+                reclaimed += files[rel]["payload"]
+                shared += 1
+                continue
+            how = share_payload(original, duplicate)
+            if how == "hardlink":
+                reclaimed += files[rel]["size"]
+            elif how == "reflink":
+                reclaimed += files[rel]["payload"]
+            else:
+                unsupported += 1
+                continue
+            shared += 1
+            files[rel] = _entry(duplicate, (key, files[rel]["payload"]))
+
+    # Entries outside a deduped subtree are carried over while their files exist
+    outside = {k: v for k, v in known.items() if k not in files and os.path.exists(os.path.join(base, k))}
+    _compact({**outside, **files})
+
+    verb = "Would share" if dry_run else "Shared"
+    print(f"[Dedupe] {verb} {shared} duplicate files, {reclaimed / 1024 / 1024:.1f} MB reclaimed")
+    if unsupported:
+        print(f"[Dedupe] {unsupported} duplicates with different tags were left alone "
+              f"(this filesystem does not support reflinks)")
+    return reclaimed
@@ -7,15 +7,24 @@ import time
 import requests
 from tqdm import tqdm
 
+import dedupe
+import events
+import governor
+import limiter
+import staging
+import store
 from api import get
 from config import config
+from segmented import RangeIgnored, SegmentError, SegmentedDownload, probe
 from tagger import tag_audio
-from utils import require_login, sanitize_filename
+from utils import load_json, require_login, sanitize_filename, save_json
+
+CHUNK_SIZE = 64 * 1024
 
 # --- State flags ---
 _PAUSED = False
 _STOPPED = False
-_CURRENT_PBAR = None
+_HELD = False  # the shell's pause: unlike _PAUSED it is not reset by the next track
 
 
 # --- Keyboard listener (cross-platform) ---
@@ -31,8 +40,8 @@ def _keypress_listener():
                 if key == "p":
                     _PAUSED = not _PAUSED
                     tqdm.write("[Downloader] Paused" if _PAUSED else "[Downloader] Resumed")
-                    if _CURRENT_PBAR and not _PAUSED:
-                        _CURRENT_PBAR.refresh()
+                    if not _PAUSED:
+                        events.refresh_progress()
                 elif key == "q":
                     _STOPPED = True
                     tqdm.write("[Downloader] Stopped by user")
@@ -50,8 +59,8 @@ def _keypress_listener():
                     if key == "p":
                         _PAUSED = not _PAUSED
                         tqdm.write("[Downloader] Paused" if _PAUSED else "[Downloader] Resumed")
-                        if _CURRENT_PBAR and not _PAUSED:
-                            _CURRENT_PBAR.refresh()
+                        if not _PAUSED:
+                            events.refresh_progress()
                     elif key == "q":
                         _STOPPED = True
                         tqdm.write("[Downloader] Stopped by user")
@@ -59,20 +68,30 @@ def _keypress_listener():
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
 
+_CONTROLS_STARTED = False
+
+
 def _start_controls():
+    """Launch the keyboard thread once, on the first download (and only on a real terminal)."""
+    global _CONTROLS_STARTED
+    if _CONTROLS_STARTED or not sys.stdin or not sys.stdin.isatty():
+        return
+    _CONTROLS_STARTED = True
     t = threading.Thread(target=_keypress_listener, daemon=True)
     t.start()
 
 
-_start_controls()  # launch keyboard thread
-
-
 def _wait_if_paused():
     global _PAUSED, _STOPPED
-    while _PAUSED and not _STOPPED:
+    while (_PAUSED or _HELD) and not _STOPPED:
         time.sleep(0.2)
 
 
+def stopped_by_user() -> bool:
+    """True if the last download returned None because 'q' was pressed: not a failure, so never retried."""
+    return _STOPPED
+
+
 def _format_filename(track: dict, track_id: str, output_format: str, index: int = None) -> str:
     filename = ' - '.join([
         track.get("artist", "unknown")[:64],
@@ -93,6 +112,11 @@ def get_stream_url(track_id: str, quality: str = "27"):
     return result.get("url")
 
 
+# Set by worker mode: a context manager factory that keeps other processes
+# (and hosts sharing the output directory) off a track while it is handled here
+TRACK_GUARD = None
+
+
 # --- Main download ---
 def download_track(
     track_id: str,
@@ -101,14 +125,23 @@ def download_track(
     index: int = None,
     track_meta: dict = None,
 ):
-    global _CURRENT_PBAR, _PAUSED, _STOPPED
+    if TRACK_GUARD is not None:
+        with TRACK_GUARD(track_id):
+            return _download_track(track_id, quality, directory, index, track_meta)
+    return _download_track(track_id, quality, directory, index, track_meta)
+
+
+def _download_track(track_id, quality, directory, index, track_meta):
+    global _PAUSED, _STOPPED
     _PAUSED = False
     _STOPPED = False
-    _CURRENT_PBAR = None
     
     if not require_login(config):
         return None
     
+    _start_controls()  # launch keyboard thread
+    _wait_if_paused()  # held by the shell: do not start the next track
+    
     quality = quality or ("27" if config.output_format == "flac" else "5")
     
     directory = directory or config.output_directory
@@ -119,20 +152,34 @@ def download_track(
     filepath = os.path.join(directory, filename)
     suffix = f" - {track_id}.{config.output_format}"
     
-    # Skip any existing file
-    if os.path.exists(filepath):
-        tqdm.write(f"[Downloader] ⏭️ Skipped (exists): {filepath}\n")
+    # Skip any existing file (or one still waiting in the staging area)
+    if os.path.exists(filepath) or (staging.enabled() and staging.is_pending(os.path.abspath(filepath))):
+        if store.enabled() and os.path.exists(store.object_path(track_id, quality)):
+            store.record_view(store.object_path(track_id, quality), track_id, track_meta, directory, index)
+        events.emit("skipped", track_id=str(track_id), path=filepath, reason="exists")
         return -1
     
+    # Object store: audio lives once in .dabcli/store, folders only hold links to it
+    obj_path = None
+    if store.enabled():
+        obj_path = store.object_path(track_id, quality)
+        if os.path.exists(obj_path):
+            for src_path in glob.glob(os.path.join(glob.escape(directory), f"*{glob.escape(suffix)}")):
+                os.remove(src_path)  # stale view under an old name
+            kind = store.link_view(obj_path, filepath)
+            store.record_view(obj_path, track_id, track_meta, directory, index)
+            events.emit("linked", track_id=str(track_id), path=filepath, source="store", kind=kind)
+            return filepath
+    
     pattern = os.path.join(directory, f"*{suffix}")
     matches = glob.glob(pattern, recursive=False)
     for src_path in matches:
         os.rename(src_path, filepath)
-        tqdm.write(f"[Downloader] ✏️ Renamed (exists): {filepath}\n")
+        events.emit("skipped", track_id=str(track_id), path=filepath, reason="renamed", source=src_path)
         return -1
     
     pattern = os.path.join(config.output_directory, "**", f"*{suffix}")
-    matches = glob.glob(pattern, recursive=True)
+    matches = [] if obj_path else glob.glob(pattern, recursive=True)
     for src_path in matches:
         # Only real files, skip links
         if not os.path.isfile(src_path) or os.path.islink(src_path):
@@ -140,74 +187,180 @@ def download_track(
         
         try:
             os.link(src_path, filepath)
-            tqdm.write(f"[Downloader] 🔗 Linked existing file → {filepath}\n"
-                       f"             (hardlink from {src_path})\n")
+            events.emit("linked", track_id=str(track_id), path=filepath, source=src_path, kind="hardlink")
             return filepath
         except OSError:
             try:
                 os.symlink(src_path, filepath)
-                tqdm.write(f"[Downloader] ↗️ Linked existing file → {filepath}\n"
-                           f"             (symlink to {src_path})\n")
+                events.emit("linked", track_id=str(track_id), path=filepath, source=src_path, kind="symlink")
                 return filepath
             except OSError as e2:
-                tqdm.write(f"[Downloader] ❌ Failed to create link to existing file: {e2}")
+                events.emit("failed", scope="link", track_id=str(track_id), path=filepath, error=str(e2))
                 break
     
+    # Where the audio is written: a partial store object, a scratch file, or the view file itself
+    staged = staging.enabled() and not obj_path
+    if staged:
+        staging.wait_for_space()
+        target = staging.stage(filepath)
+    else:
+        target = f"{obj_path}.part" if obj_path else filepath
+    if obj_path:
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+    
     if config.test_mode:
-        tqdm.write(f"[TEST MODE] Would download track {track_id} → {filepath}")
-        with open(filepath, "wb") as f:
+        with open(target, "wb") as f:
             f.write(b"PHANTOM DATA")
-        return filepath
+        events.emit("completed", track_id=str(track_id), path=filepath, bytes=12, duration=0, test_mode=True)
+        if staged:
+            staging.downloaded(target)
+            return target
+        return _finish_store_view(obj_path, target, filepath, track_id, track_meta, directory, index)
     
     stream_url = get_stream_url(track_id, quality)
     if not stream_url:
+        if staged:
+            staging.discard(target)
+        events.emit("failed", track_id=str(track_id), path=filepath, reason="no_stream_url")
         return None
     
-    tqdm.write(f"[Downloader] Downloading: {filepath}")
     # tqdm.write("[Controls] Press 'p' = Pause/Resume | 'q' = Stop")
     
+    segment_size = _segmented_size(stream_url)
+    
+    started = time.monotonic()
     completed = False
+    failure = None
     try:
-        with requests.get(stream_url, stream=True, timeout=30) as r:
-            r.raise_for_status()
-            total = int(r.headers.get("content-length", 0))
-            with open(filepath, "wb") as f, tqdm(
-                total=total,
-                unit="B",
-                unit_scale=True,
-                unit_divisor=1024,
-                desc="Downloading",
-                ncols=70,
-                leave=False,
-                disable=not getattr(config, "show_progress", True),
-                position=0,
-            ) as pbar:
-                _CURRENT_PBAR = pbar
-                for chunk in r.iter_content(chunk_size=8192):
-                    if _STOPPED:
-                        tqdm.write("[Downloader] ❌ Download stopped before completion.")
-                        os.remove(filepath)
-                        _CURRENT_PBAR = None
-                        return None
-                    _wait_if_paused()
-                    if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-            
-            tqdm.write("[Downloader] ✅ Download completed.")
-            completed = True
+        if segment_size:
+            try:
+                completed = _download_segmented(stream_url, target, segment_size, track_id, filepath)
+                if not completed:
+                    failure = ("stopped", None)
+            except RangeIgnored as e:
+                # The probe said ranges work, the segments got whole bodies: start over in one stream
+                if config.debug:
+                    print(f"[Download] {e}; retrying {track_id} as a single stream")
+                segment_size = None
+        if not segment_size:
+            failure = _download_single(stream_url, target, track_id, filepath)
+            completed = failure is None
     
-    except requests.RequestException as e:
-        tqdm.write(f"[Downloader] ❌ Download failed: {e}")
+    except (requests.RequestException, SegmentError) as e:
+        failure = ("http", e)
     except OSError as e:
-        tqdm.write(f"[Downloader] ❌ File write error: {e}")
+        failure = ("write", e)
     except KeyboardInterrupt as e:
-        tqdm.write(f"[Downloader] ❌ Session stopped by user")
-        os.remove(filepath)
+        failure = ("interrupted", None)
+        if staged:
+            staging.discard(target)
+        elif os.path.exists(target):
+            os.remove(target)
         exit(0)
     finally:
-        tqdm.write("")
         if completed:
-            return filepath
-        os.remove(filepath)
+            elapsed = time.monotonic() - started
+            events.emit("completed", track_id=str(track_id), path=filepath,
+                        bytes=os.path.getsize(target), duration=round(elapsed, 3))
+            _record_throughput(target, elapsed)
+            if staged:
+                # Tagged on scratch; tag_audio hands it to the mover (which also runs the dedupe check)
+                staging.downloaded(target)
+                return target
+            if config.content_dedupe and not obj_path:
+                dedupe.check_new(target)
+            return _finish_store_view(obj_path, target, filepath, track_id, track_meta, directory, index)
+        reason, error = failure or ("http", None)
+        events.emit("failed", track_id=str(track_id), path=filepath, reason=reason,
+                    error=str(error) if error else None, duration=round(time.monotonic() - started, 3))
+        if staged:
+            staging.discard(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        return None
+
+
+def _download_single(stream_url: str, target: str, track_id, filepath: str):
+    """Fetch the whole file over one connection. Returns None when done, or ("stopped", None)."""
+    with governor.NETWORK.hold(governor.stream_buffer(CHUNK_SIZE)), limiter.cdn_stream(stream_url, timeout=30) as r:
+        r.raise_for_status()
+        total = int(r.headers.get("content-length", 0))
+        events.emit("started", track_id=str(track_id), path=filepath, total_bytes=total, connections=1)
+        progress = events.Progress(track_id, total)
+        try:
+            with open(target, "wb") as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if _STOPPED:
+                        return ("stopped", None)
+                    _wait_if_paused()
+                    if chunk:
+                        f.write(chunk)
+                        progress.add(len(chunk))
+        finally:
+            progress.flush()
+    return None
+
+
+def _throughput_path() -> str:
+    return config.state_path("throughput.json")
+
+
+def _record_throughput(path: str, seconds: float):
+    """Fold a finished download into the moving average used for plan ETAs."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if seconds <= 0 or size < 1024 * 1024:
+        return  # too small to say anything about bandwidth
+    rate = size / seconds
+    previous = measured_throughput()
+    save_json(_throughput_path(), {
+        "bytes_per_sec": rate if previous is None else 0.7 * previous + 0.3 * rate,
+        "updated": int(time.time()),
+    })
+
+
+def measured_throughput():
+    """Average download rate in bytes/s from past downloads, or None."""
+    return (load_json(_throughput_path(), {}) or {}).get("bytes_per_sec")
+
+
+def _segmented_size(stream_url: str):
+    """Size of the file if it should be fetched in segments, else None (single stream)."""
+    if not config.segmented_download:
+        return None
+    try:
+        size, ranged = probe(stream_url)
+    except requests.RequestException:
         return None
+    if not ranged or not size or size < int(config.segment_threshold_mb) * 1024 * 1024:
+        return None
+    return size
+
+
+def _download_segmented(stream_url: str, target: str, size: int, track_id, filepath: str) -> bool:
+    # Each connection holds a CDN slot: more connections than free slots would only queue
+    free_slots = limiter.CDN.limit - limiter.CDN.in_flight
+    connections = max(1, min(int(config.segment_connections), free_slots))
+    events.emit("started", track_id=str(track_id), path=filepath, total_bytes=size, connections=connections)
+    progress = events.Progress(track_id, size, connections)
+    ok = SegmentedDownload(
+        stream_url, target, size,
+        connections=connections,
+        progress=progress.add,
+        should_stop=lambda: _STOPPED,
+        wait_if_paused=_wait_if_paused,
+    ).run()
+    progress.flush()
+    return ok
+
+
+def _finish_store_view(obj_path, target, filepath, track_id, track_meta, directory, index):
+    """Publish a freshly stored object and link it into its view folder; no-op without the store."""
+    if not obj_path:
+        return filepath
+    os.replace(target, obj_path)
+    store.link_view(obj_path, filepath)
+    store.record_view(obj_path, track_id, track_meta, directory, index)
+    return filepath
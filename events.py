@@ -0,0 +1,287 @@
+# events.py
+"""
+Event bus for download, tagging and collection progress.
+
+Producers call emit(event, scope=..., **fields). Events are:
+  queued, started, progress, skipped, linked, completed, failed, tagged, deferred
+and scope says what they are about: track, link, tag, album, library, discography
+or retry (a round of deferred retries).
+
+By default the human renderer turns events into the usual console lines and
+drives the progress bar. With `--events jsonl` every event is written as one
+JSON object per line to stdout instead; the human renderer is off and any other
+output is moved to stderr so stdout stays machine-readable.
+"""
+import json
+import sys
+import threading
+import time
+
+from tqdm import tqdm
+
+import limiter
+from config import config
+from models import jsonable
+
+PROGRESS_INTERVAL = 0.25  # seconds between progress events for one transfer
+
+_lock = threading.Lock()
+_sinks = []
+_mode = "human"
+
+
+def emit(event: str, scope: str = "track", **fields):
+    record = {"event": event, "scope": scope, "ts": round(time.time(), 3)}
+    record.update(fields)
+    for sink in list(_sinks):
+        sink(record)
+
+
+def headless() -> bool:
+    return _mode == "jsonl"
+
+
+def configure(mode: str):
+    """Select "human" (default) or "jsonl" output for the rest of the run."""
+    global _mode
+    _mode = mode
+    # Swap the renderer; subscribers (metrics) stay
+    _sinks[:] = [sink for sink in _sinks if not isinstance(sink, (_Human, _JsonLines))]
+    if mode == "jsonl":
+        _sinks.append(_JsonLines(sys.stdout))
+        sys.stdout = sys.stderr  # stray prints must not corrupt the event stream
+        config.show_progress = False
+    else:
+        _sinks.append(_HUMAN)
+
+
+def subscribe(sink):
+    """Add a callable receiving every event dict (e.g. a metrics collector)."""
+    _sinks.append(sink)
+
+
+def refresh_progress():
+    """Redraw the progress bar (after a resume)."""
+    if _HUMAN.bar is not None:
+        _HUMAN.bar.refresh()
+
+
+class Progress:
+    """Accumulates transferred bytes and emits a progress event at most every PROGRESS_INTERVAL."""
+
+    def __init__(self, track_id, total: int, connections: int = 1):
+        self.track_id = track_id
+        self.total = total
+        self.connections = connections
+        self.done = 0
+        self.started = time.monotonic()
+        self._reported = 0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, n: int):
+        with self._lock:
+            self.done += n
+            now = time.monotonic()
+            if now - self._last < PROGRESS_INTERVAL:
+                return
+            self._last = now
+            self._emit(now)
+
+    def flush(self):
+        with self._lock:
+            if self.done != self._reported:
+                self._emit(time.monotonic())
+
+    def _emit(self, now: float):
+        elapsed = now - self.started
+        delta = self.done - self._reported
+        self._reported = self.done
+        emit(
+            "progress",
+            track_id=str(self.track_id),
+            bytes=self.done,
+            delta=delta,
+            total_bytes=self.total,
+            rate=round(self.done / elapsed) if elapsed > 0 else None,
+            connections=self.connections,
+            api_limit=limiter.API.limit,
+            cdn_limit=limiter.CDN.limit,
+        )
+
+
+class _JsonLines:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=jsonable)
+        with _lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class _Human:
+    """Renders events as the classic console output."""
+
+    def __init__(self):
+        self.bar = None
+
+    def __call__(self, record: dict):
+        handler = getattr(self, f"_{record['scope']}_{record['event']}", None)
+        if handler:
+            handler(record)
+
+    # --- tracks ---
+    def _track_queued(self, r):
+        tqdm.write(f"[{r['position']}/{r['count']}] {r.get('label', r['track_id'])}")
+
+    def _track_started(self, r):
+        tqdm.write(f"[Downloader] Downloading: {r['path']}")
+        connections = r.get("connections", 1)
+        self.bar = tqdm(
+            total=r.get("total_bytes") or 0,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            desc=f"Downloading x{connections}" if connections > 1 else "Downloading",
+            ncols=70,
+            leave=False,
+            disable=not getattr(config, "show_progress", True),
+            position=0,
+        )
+
+    def _track_progress(self, r):
+        if self.bar is None:
+            return
+        self.bar.update(r["delta"])
+        limits = f"api≤{r['api_limit']} cdn≤{r['cdn_limit']}"
+        self.bar.set_postfix_str(f"{r['connections']} conn, {limits}" if r["connections"] > 1 else limits, refresh=False)
+
+    def _close_bar(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+    def _track_skipped(self, r):
+        if r.get("reason") == "renamed":
+            tqdm.write(f"[Downloader] ✏️ Renamed (exists): {r['path']}\n")
+        else:
+            tqdm.write(f"[Downloader] ⏭️ Skipped (exists): {r['path']}\n")
+
+    def _track_linked(self, r):
+        kind = r.get("kind")
+        if r.get("source") == "store":
+            tqdm.write(f"[Downloader] 🔗 Linked from store ({kind}) → {r['path']}\n")
+        elif kind == "symlink":
+            tqdm.write(f"[Downloader] ↗️ Linked existing file → {r['path']}\n"
+                       f"             (symlink to {r['source']})\n")
+        else:
+            tqdm.write(f"[Downloader] 🔗 Linked existing file → {r['path']}\n"
+                       f"             (hardlink from {r['source']})\n")
+
+    def _track_completed(self, r):
+        self._close_bar()
+        if r.get("test_mode"):
+            tqdm.write(f"[TEST MODE] Would download track {r['track_id']} → {r['path']}")
+            return
+        tqdm.write("[Downloader] ✅ Download completed.")
+        tqdm.write("")
+
+    def _track_failed(self, r):
+        self._close_bar()
+        reason = r.get("reason")
+        if reason == "stopped":
+            tqdm.write("[Downloader] ❌ Download stopped before completion.")
+        elif reason == "interrupted":
+            tqdm.write("[Downloader] ❌ Session stopped by user")
+        elif reason == "write":
+            tqdm.write(f"[Downloader] ❌ File write error: {r.get('error')}")
+        elif reason == "no_stream_url":
+            tqdm.write(f"[Downloader] ❌ No stream URL for track {r['track_id']}")
+            return
+        else:
+            tqdm.write(f"[Downloader] ❌ Download failed: {r.get('error')}")
+        tqdm.write("")
+
+    def _track_deferred(self, r):
+        tqdm.write(f"[Retry] Deferred: {r.get('label') or r['track_id']} (retried at the end)\n")
+
+    def _link_failed(self, r):
+        tqdm.write(f"[Downloader] ❌ Failed to create link to existing file: {r.get('error')}")
+
+    # --- tagging ---
+    def _tag_tagged(self, r):
+        if config.debug and not r.get("changed"):
+            print(f"[tagger] Up to date, not rewritten: {r['path']}")
+
+    def _tag_failed(self, r):
+        if config.debug:
+            print(f"[tagger] Tagging failed for {r['path']}: {r.get('error')}")
+
+    # --- retries ---
+    def _retry_started(self, r):
+        wait = f" in {r['delay']:.0f}s" if r["delay"] else ""
+        print(f"\n[Retry] Round {r['attempt']}/{r['attempts']}: {r['tracks']} failed tracks{wait}...")
+
+    def _retry_failed(self, r):
+        print(f"[Retry] {r['track_id']}: {r.get('error')}")
+
+    def _retry_completed(self, r):
+        print(f"[Retry] Recovered {r['recovered']}, {r['remaining']} still failing")
+        if r.get("file"):
+            print(f"[Retry] Saved to {r['file']} — run `dabcli.py retry` to try them again")
+
+    # --- collections ---
+    @staticmethod
+    def _print_tag_summary(r):
+        if "tags_written" in r:
+            print(f"[Tagger] {r['tags_written']} files tagged, {r['tags_unchanged']} already up to date (write skipped)")
+
+    def _album_queued(self, r):
+        print(f"\n[Discography] ({r['position']}/{r['count']}) {r.get('title', r['album_id'])} — {r.get('year', '')}")
+
+    def _album_started(self, r):
+        print(f"Downloading Album: {r['title']} ({r['tracks']} tracks)")
+
+    def _album_skipped(self, r):
+        print(f"Album {r['album_id']} is excluded.")
+
+    def _album_failed(self, r):
+        if r.get("reason") == "metadata":
+            print("Could not fetch album details.")
+        elif r.get("reason") == "no_tracks":
+            print("Album has no tracks or failed to load.")
+        else:
+            print(f"[Discography] Failed: {r.get('error')}")
+
+    def _album_completed(self, r):
+        self._print_tag_summary(r)
+
+    def _library_started(self, r):
+        tqdm.write(f"[Library] Downloading: {r['title']} ({r['tracks']} tracks)")
+
+    def _library_failed(self, r):
+        print("[Library] No tracks found." if r.get("reason") == "no_tracks" else "[Library] Failed to load library.")
+
+    def _library_completed(self, r):
+        if r.get("sync"):
+            print(f"[Library] Sync finished: {r['downloaded']} downloaded, {r['failed']} failed")
+        else:
+            print(f"[Library] Finished: {r['saved']} tracks saved to {r['folder']}")
+        self._print_tag_summary(r)
+
+    def _discography_started(self, r):
+        if r.get("sync"):
+            return  # sync prints its own summary line first
+        print(f"[Discography] Starting download for {r['albums']} albums by {r['artist']} ({r['artist_id']})...\n")
+
+    def _discography_completed(self, r):
+        if r.get("sync"):
+            print(f"\n[Discography] Sync finished. Complete: {r['completed']} | Incomplete: {r['incomplete']}")
+        else:
+            print(f"\n[Discography] Finished. Completed: {r['completed']} | Failed: {r['failed']}")
+
+
+_HUMAN = _Human()
+_sinks.append(_HUMAN)
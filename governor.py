@@ -0,0 +1,160 @@
+# governor.py
+"""
+Process-wide resource budgets, so concurrent work waits instead of
+overcommitting memory on small machines.
+
+  NETWORK  buffers of open transfers: downloads (single and segmented) and
+           playback cache fills and passthroughs (inflight_buffer_mb)
+  COVERS   cover art bytes held in memory while tagging (cover_memory_mb)
+  TAGGING  concurrent tag operations (tag_concurrency)
+
+A transfer reserves what it really holds while open: its read chunk plus the
+socket's receive buffer (see stream_buffer), about 192 KB for a download
+stream and 384 KB per segmented connection on Linux defaults. It reserves
+before taking a CDN slot, so a stream waiting for memory never blocks others.
+
+A budget of 0 means unlimited. A single request larger than the whole budget
+is let through when nothing else holds any, so it can never deadlock.
+
+Download, sync and play runs print a peak-RSS report when they end (other
+runs once they use a budget), to help size workers.
+"""
+import atexit
+import functools
+import sys
+import threading
+from contextlib import contextmanager
+
+from config import config
+
+MB = 1024 * 1024
+
+_scheduled = False
+
+
+class ByteBudget:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(0, int(limit))
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int):
+        _touch()
+        with self._cond:
+            if self.limit and self.used and self.used + n > self.limit:
+                self.waits += 1
+                while self.used and self.used + n > self.limit:
+                    self._cond.wait()
+            self.used += n
+            self.peak = max(self.peak, self.used)
+
+    def release(self, n: int):
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+    @contextmanager
+    def hold(self, n: int):
+        self.acquire(n)
+        try:
+            yield
+        finally:
+            self.release(n)
+
+
+class Slots:
+    """A counting semaphore that records how often callers had to wait."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(0, int(limit))
+        self.active = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        _touch()
+        with self._cond:
+            if self.limit and self.active >= self.limit:
+                self.waits += 1
+                while self.active >= self.limit:
+                    self._cond.wait()
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+NETWORK = ByteBudget("network", int(config.inflight_buffer_mb) * MB)
+COVERS = ByteBudget("covers", int(config.cover_memory_mb) * MB)
+TAGGING = Slots("tagging", config.tag_concurrency)
+
+DEFAULT_SOCKET_BUFFER = 128 * 1024
+
+
+@functools.lru_cache(maxsize=1)
+def _socket_buffer() -> int:
+    """Default TCP receive buffer of a new connection (tcp_rmem on Linux)."""
+    try:
+        with open("/proc/sys/net/ipv4/tcp_rmem") as f:
+            return int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return DEFAULT_SOCKET_BUFFER
+
+
+def stream_buffer(chunk_size: int) -> int:
+    """Bytes one open transfer holds: the chunk it reads into plus its socket's receive buffer."""
+    return chunk_size + _socket_buffer()
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (and of finished child processes), or None."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+def _budget_text(budget: ByteBudget) -> str:
+    limit = f" of {budget.limit / MB:.0f} MB" if budget.limit else ""
+    return f"{budget.name} peak {budget.peak / MB:.1f} MB{limit} ({budget.waits} waits)"
+
+
+def report():
+    own, children = peak_rss()
+    parts = []
+    if own is not None:
+        rss = f"Peak RSS {own / MB:.1f} MB"
+        if children:
+            rss += f" (child processes {children / MB:.1f} MB)"
+        parts.append(rss)
+    parts.append(_budget_text(NETWORK))
+    parts.append(_budget_text(COVERS))
+    limit = f" of {TAGGING.limit}" if TAGGING.limit else ""
+    parts.append(f"tagging peak {TAGGING.peak}{limit} at once ({TAGGING.waits} waits)")
+    print("[Resources] " + " | ".join(parts))
+
+
+def schedule_report():
+    """Print the report when the process exits (once, however often this is called)."""
+    global _scheduled
+    if not _scheduled:
+        _scheduled = True
+        atexit.register(report)
+
+
+def _touch():
+    """Schedule the end-of-run report the first time a budget is used."""
+    schedule_report()
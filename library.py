@@ -1,95 +1,130 @@
+import bisect
 import os
+import shutil
+import time
 
 from tqdm import tqdm
 
+import events
+import metacache
+import store
 from api import get
 from config import config
 from cover import download_cover_image
-from downloader import download_track
-from tagger import tag_audio
-from utils import require_login
+from downloader import _format_filename, download_track, stopped_by_user
+from models import parse_tracks
+from retryqueue import RetryQueue
+from tagger import reset_tag_stats, tag_audio, tag_stats_fields
+from utils import load_json, require_login, sanitize_filename, save_json
+
+
+def track_metadata(track: dict, cli_args=None) -> dict:
+    """Tags written for a standalone (library) track, with CLI overrides applied."""
+    return {
+        "title": getattr(cli_args, "title", None) or track.get("title", ""),
+        "artist": getattr(cli_args, "artist", None) or track.get("artist", ""),
+        "album": getattr(cli_args, "album", None) or track.get("albumTitle", ""),
+        "genre": getattr(cli_args, "genre", None) or track.get("genre", ""),
+        "date": getattr(cli_args, "date", None) or (track.get("releaseDate") or "")[:4],
+    }
+
+
+def _download_library_track(track: dict, lib_folder: str, quality: str, cli_args=None):
+    """Download and tag one library track. Returns its path, -1 if it already existed, or None."""
+    raw_path = download_track(
+        track_id=track["id"],
+        quality=quality,
+        directory=lib_folder,
+        track_meta=track,
+    )
+    metacache.remember_track(track)
+    if raw_path == -1:
+        return -1
+    if not raw_path:
+        return None
+    
+    converted_path = raw_path  # same format assumption
+    # converted_path = convert_audio(raw_path, output_format)
+    
+    # Build metadata with CLI overrides
+    metadata = track_metadata(track, cli_args)
+    
+    # Download a cover file for this track (named via song title)
+    cover_url = track.get("albumCover")
+    cover_path = None
+    if cover_url:
+        clean_title = sanitize_filename(track.get("title", "cover"))
+        cover_path = download_cover_image(
+            cover_url, os.path.join(lib_folder, f"{clean_title}.jpg"),
+        )
+    
+    # Tag the converted audio
+    tag_audio(converted_path, metadata, cover_path=cover_path)
+    
+    # Delete the cover file unless user wants to keep it
+    if cover_path and os.path.exists(cover_path) and not config.keep_cover_file:
+        try:
+            os.remove(cover_path)
+        except Exception:
+            pass
+    
+    # Remove raw file if needed
+    if config.delete_raw_files and raw_path != converted_path:
+        try:
+            os.remove(raw_path)
+        except Exception as e:
+            tqdm.write(f"[Library] Could not delete raw file: {e}")
+    
+    return converted_path
+
+
+def _retry_entry(library_id, track: dict, lib_folder: str, quality: str) -> dict:
+    return {"kind": "library", "library_id": str(library_id), "track_id": str(track["id"]), "track": track,
+            "folder": lib_folder, "quality": quality, "label": f"{track['artist']} — {track['title']}"}
 
 
 def download_library(library_id: str, quality: str = None, cli_args=None):
     if not require_login(config):
         return
     
+    started = time.monotonic()
     result = get(f"/libraries/{library_id}?limit=9999&page=1")
     if not result or "library" not in result:
-        print("[Library] Failed to load library.")
+        events.emit("failed", scope="library", library_id=str(library_id), reason="metadata")
         return
     
     library = result["library"]
-    tracks = library.get("tracks", [])
+    tracks = parse_tracks(library.pop("tracks", None))
+    del result
     if not tracks:
-        print("[Library] No tracks found.")
+        events.emit("failed", scope="library", library_id=str(library_id), reason="no_tracks")
         return
     
-    from utils import sanitize_filename
     title = sanitize_filename(library.get("name", f"library_{library_id}"))
     quality = "27" if config.output_format == "flac" else "5"
     
     lib_folder = os.path.join(config.output_directory, "libraries", title)
     os.makedirs(lib_folder, exist_ok=True)
     
-    tqdm.write(f"[Library] Downloading: {title} ({len(tracks)} tracks)")
+    events.emit("started", scope="library", library_id=str(library_id), title=title, tracks=len(tracks), path=lib_folder)
+    reset_tag_stats()
     
     playlist_paths = []
-    pbar = tqdm(tracks, position=1, dynamic_ncols=True)
+    
+    def fetch(track):
+        path = _download_library_track(track, lib_folder, quality, cli_args)
+        if path and path != -1:
+            playlist_paths.append(os.path.basename(path))
+        return path
+    
+    retries = RetryQueue("library")
+    pbar = tqdm(tracks, position=1, dynamic_ncols=True, disable=not getattr(config, "show_progress", True))
     for idx, track in enumerate(pbar, 1):
-        tqdm.write(f"[{idx}/{len(tracks)}] {track['artist']} — {track['title']}")
-        raw_path = download_track(
-            track_id=track["id"],
-            quality=quality,
-            directory=lib_folder,
-            track_meta=track,
-        )
-        if raw_path == -1:
-            continue
-        if not raw_path:
-            tqdm.write("[Library] Skipping: download failed.")
-            continue
-        
-        converted_path = raw_path  # same format assumption
-        # converted_path = convert_audio(raw_path, output_format)
-        
-        # Build metadata with CLI overrides
-        metadata = {
-            "title": getattr(cli_args, "title", None) or track.get("title", ""),
-            "artist": getattr(cli_args, "artist", None) or track.get("artist", ""),
-            "album": getattr(cli_args, "album", None) or track.get("albumTitle", ""),
-            "genre": getattr(cli_args, "genre", None) or track.get("genre", ""),
-            "date": getattr(cli_args, "date", None) or track.get("releaseDate", "")[:4],
-        }
-        
-        # Download a cover file for this track (named via song title)
-        from utils import sanitize_filename
-        cover_url = track.get("albumCover")
-        cover_path = None
-        if cover_url:
-            clean_title = sanitize_filename(track.get("title", "cover"))
-            cover_path = download_cover_image(
-                cover_url, os.path.join(lib_folder, f"{clean_title}.jpg"),
-            )
-        
-        # Tag the converted audio
-        tag_audio(converted_path, metadata, cover_path=cover_path)
-        
-        # Delete the cover file unless user wants to keep it
-        if cover_path and os.path.exists(cover_path) and not config.keep_cover_file:
-            try:
-                os.remove(cover_path)
-            except Exception:
-                pass
-        
-        # Remove raw file if needed
-        if config.delete_raw_files and raw_path != converted_path:
-            try:
-                os.remove(raw_path)
-            except Exception as e:
-                tqdm.write(f"[Library] Could not delete raw file: {e}")
-        
-        playlist_paths.append(os.path.basename(converted_path))
+        events.emit("queued", track_id=str(track["id"]), position=idx, count=len(tracks),
+                    label=f"{track['artist']} — {track['title']}")
+        if not fetch(track) and not stopped_by_user():
+            retries.defer(_retry_entry(library_id, track, lib_folder, quality), lambda track=track: fetch(track))
+    failed = retries.run()
     
     # Write playlist
     # m3u_path = os.path.join(lib_folder, "library.m3u8")
@@ -97,5 +132,154 @@ def download_library(library_id: str, quality: str = None, cli_args=None):
     #     for filename in playlist_paths:
     #         m3u.write(filename + "\n")
     
-    print(f"[Library] Finished: {len(playlist_paths)} tracks saved to {lib_folder}")
+    events.emit("completed", scope="library", library_id=str(library_id), folder=lib_folder,
+                saved=len(playlist_paths), failed=len(failed), duration=round(time.monotonic() - started, 3), **tag_stats_fields())
     # print(f"[Library] Playlist written to: {m3u_path}")
+
+
+
+def _snapshot_path(library_id: str) -> str:
+    return config.state_path("sync", "libraries", f"{sanitize_filename(str(library_id))}.json")
+
+
+def _track_filename(track: dict) -> str:
+    return sanitize_filename(_format_filename(track, str(track["id"]), config.output_format))
+
+
+def diff_tracks(previous: list, current: list):
+    """
+    Compare two ordered track lists by ID.
+    Returns (added, removed, reordered): added/removed are track dicts,
+    reordered is the fewest kept tracks that must move to turn the old order
+    into the new one (those outside the longest common subsequence), so moving
+    one track to the top counts as one.
+    """
+    prev_ids = [str(t["id"]) for t in previous]
+    cur_ids = [str(t["id"]) for t in current]
+    prev_set, cur_set = set(prev_ids), set(cur_ids)
+    
+    added = [t for t in current if str(t["id"]) not in prev_set]
+    removed = [t for t in previous if str(t["id"]) not in cur_set]
+    
+    kept_prev = {track_id: pos for pos, track_id in enumerate(i for i in prev_ids if i in cur_set)}
+    kept_cur = [i for i in cur_ids if i in prev_set]
+    # Both lists hold the same IDs, so their LCS is the longest increasing run of old positions
+    tails = []
+    for pos in (kept_prev[i] for i in kept_cur):
+        at = bisect.bisect_left(tails, pos)
+        tails[at:at + 1] = [pos]
+    return added, removed, len(kept_cur) - len(tails)
+
+
+def _write_playlist(lib_folder: str, filenames: list) -> str:
+    m3u_path = os.path.join(lib_folder, "library.m3u8")
+    with open(m3u_path, "w", encoding="utf-8") as m3u:
+        for filename in filenames:
+            m3u.write(filename + "\n")
+    return m3u_path
+
+
+def _remove_track_files(lib_folder: str, track: dict, quality: str, quarantine: bool):
+    filename = track.get("file") or _track_filename(track)
+    if store.enabled():
+        store.forget_view(store.object_path(track["id"], quality), lib_folder)
+    base = os.path.splitext(filename)[0]
+    for name in (filename, base + ".lrc", base + ".jpg"):
+        path = os.path.join(lib_folder, name)
+        if not os.path.lexists(path):
+            continue
+        if quarantine:
+            removed_dir = os.path.join(lib_folder, ".removed")
+            os.makedirs(removed_dir, exist_ok=True)
+            shutil.move(path, os.path.join(removed_dir, name))
+        else:
+            os.remove(path)
+
+
+def sync_library(library_id: str, quality: str = None, cli_args=None, prune: bool = False, quarantine: bool = False):
+    """
+    Bring a downloaded library in line with the remote one.
+    Only tracks that are new (or missing on disk) since the last sync are downloaded;
+    tracks dropped remotely are reported, and deleted (prune) or moved to .removed (quarantine).
+    """
+    if not require_login(config):
+        return
+    
+    started = time.monotonic()
+    result = get(f"/libraries/{library_id}?limit=9999&page=1")
+    if not result or "library" not in result:
+        events.emit("failed", scope="library", library_id=str(library_id), reason="metadata")
+        return
+    
+    library = result["library"]
+    # Track records keep just enough to name, tag and diff a track
+    tracks = parse_tracks(library.pop("tracks", None))
+    del result
+    
+    title = sanitize_filename(library.get("name", f"library_{library_id}"))
+    quality = "27" if config.output_format == "flac" else "5"
+    lib_folder = os.path.join(config.output_directory, "libraries", title)
+    
+    snapshot_path = _snapshot_path(library_id)
+    snapshot = load_json(snapshot_path, {}) or {}
+    previous = snapshot.get("tracks", [])
+    
+    # Follow a remote rename instead of starting the library over
+    old_folder = snapshot.get("folder")
+    if old_folder and old_folder != lib_folder and os.path.isdir(old_folder) and not os.path.exists(lib_folder):
+        os.rename(old_folder, lib_folder)
+        print(f"[Library] Renamed folder → {lib_folder}")
+    os.makedirs(lib_folder, exist_ok=True)
+    
+    added, removed, reordered = diff_tracks(previous, tracks)
+    
+    # Tracks we think we have but which are gone from disk are downloaded again
+    added_ids = {str(t["id"]) for t in added}
+    missing = [
+        t for t in tracks
+        if str(t["id"]) not in added_ids and not os.path.lexists(os.path.join(lib_folder, _track_filename(t)))
+    ]
+    to_fetch = added + missing
+    
+    print(f"[Library] Sync: {title} — {len(tracks)} tracks | "
+          f"+{len(added)} added, -{len(removed)} removed, {reordered} reordered, {len(missing)} missing on disk")
+    
+    retries = RetryQueue("library")
+    reset_tag_stats()
+    stopped = set()
+    for idx, track in enumerate(to_fetch, 1):
+        events.emit("queued", track_id=str(track["id"]), position=idx, count=len(to_fetch),
+                    label=f"{track['artist']} — {track['title']}")
+        if not _download_library_track(track, lib_folder, quality, cli_args):
+            if stopped_by_user():
+                stopped.add(str(track["id"]))  # skipped with 'q': fetched by the next sync, not retried
+                continue
+            retries.defer(_retry_entry(library_id, track, lib_folder, quality),
+                          lambda track=track: _download_library_track(track, lib_folder, quality, cli_args))
+    failed = {entry["track_id"] for entry in retries.run()}
+    
+    if removed:
+        if prune or quarantine:
+            for track in removed:
+                _remove_track_files(lib_folder, track, quality, quarantine)
+            print(f"[Library] {'Quarantined' if quarantine else 'Pruned'} {len(removed)} removed tracks")
+        else:
+            for track in removed:
+                print(f"[Library] Removed remotely (kept locally): {track.get('artist')} — {track.get('title')}")
+    
+    # Failed additions stay out of the snapshot so the next sync retries them
+    # The snapshot also records each file name, so a later prune finds files named under an old format
+    synced = [dict(t, file=_track_filename(t)) for t in tracks if str(t["id"]) not in failed | stopped]
+    m3u_path = _write_playlist(lib_folder, [t["file"] for t in synced])
+    
+    save_json(snapshot_path, {
+        "library_id": str(library_id),
+        "name": title,
+        "folder": lib_folder,
+        "tracks": synced,
+    })
+    
+    events.emit("completed", scope="library", library_id=str(library_id), folder=lib_folder, sync=True,
+                downloaded=len(to_fetch) - len(failed) - len(stopped), failed=len(failed), stopped=len(stopped), added=len(added), removed=len(removed),
+                duration=round(time.monotonic() - started, 3), **(tag_stats_fields() if to_fetch else {}))
+    print(f"[Library] Playlist written to: {m3u_path}")
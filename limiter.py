@@ -0,0 +1,216 @@
+# limiter.py
+"""
+Adaptive concurrency limits for the API host and the CDN.
+
+Each host gets an AIMD controller: every successful request adds 1/limit to
+the limit (about +1 per round of requests), a 429/503 or timeout halves it,
+and a Retry-After pauses new requests to that host until it has passed.
+For the API a latency target applies too: replies slower than
+api_latency_slo_ms shrink the limit gently before the server starts refusing.
+"""
+import email.utils
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from tqdm import tqdm
+
+import transport
+from config import config
+
+THROTTLE_STATUSES = (429, 503)
+MAX_RETRIES = 4
+DEFAULT_BACKOFF = 2.0  # seconds, when the server gives no Retry-After
+MAX_BACKOFF = 120.0
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, maximum: int, initial: int = None, minimum: int = 1, latency_target: float = None):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.latency_target = latency_target
+        self._limit = float(min(self.maximum, initial or self.maximum))
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.retries = {}  # reason -> requests retried
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "throttled": self.throttled,
+            "retries": dict(self.retries),
+            "paused_for": max(0.0, self._blocked_until - time.monotonic()),
+        }
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait <= 0 and self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                self._cond.wait(wait if wait > 0 else None)
+
+    def release(self, outcome: str = "ok", latency: float = None, retry_after: float = None):
+        """outcome: "ok", "throttled", "timeout" or "error" (no change to the limit)."""
+        with self._cond:
+            self._in_flight -= 1
+            old = self.limit
+            if outcome in ("throttled", "timeout"):
+                self.throttled += 1
+                self._decrease(0.5)
+                pause = retry_after if retry_after is not None else DEFAULT_BACKOFF
+                self._blocked_until = max(self._blocked_until, time.monotonic() + min(pause, MAX_BACKOFF))
+            elif outcome == "ok":
+                if self.latency_target and latency is not None and latency > self.latency_target:
+                    self._decrease(0.9)
+                else:
+                    self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+        if self.limit != old and (config.debug or outcome != "ok"):
+            tqdm.write(f"[Limiter] {self.name}: {outcome} → concurrency {old} → {self.limit}")
+
+    def count_retry(self, reason: str):
+        with self._cond:
+            self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def _decrease(self, factor: float):
+        # One cut per round trip: a burst of 429s from the same window counts once
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.minimum), self._limit * factor)
+
+
+def retry_after_seconds(resp) -> float:
+    """Parse a Retry-After header (seconds or HTTP date); None if absent."""
+    value = (resp.headers.get("Retry-After") or "").strip() if resp is not None else ""
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _outcome(resp) -> str:
+    return "throttled" if resp.status_code in THROTTLE_STATUSES else "ok"
+
+
+API = AdaptiveLimiter(
+    "api",
+    maximum=int(config.api_max_concurrency),
+    initial=min(4, int(config.api_max_concurrency)),
+    latency_target=int(config.api_latency_slo_ms) / 1000 if config.api_latency_slo_ms else None,
+)
+CDN = AdaptiveLimiter("cdn", maximum=int(config.cdn_max_concurrency), initial=min(2, int(config.cdn_max_concurrency)))
+
+
+def status() -> str:
+    """Short form of the current limits for progress bars."""
+    return f"api≤{API.limit} cdn≤{CDN.limit}"
+
+
+def api_request(method: str, url: str, **kwargs):
+    """
+    requests.request through the API limiter. 429/503 and timeouts are retried
+    after Retry-After (or a default backoff) up to MAX_RETRIES times; the last
+    response is returned, or the last exception re-raised.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        API.acquire()
+        started = time.monotonic()
+        try:
+            resp = transport.request(method, url, **kwargs)
+        except requests.Timeout:
+            API.release("timeout")
+            if attempt == MAX_RETRIES:
+                raise
+            API.count_retry("timeout")
+            continue
+        except requests.RequestException:
+            API.release("error")
+            raise
+        outcome = _outcome(resp)
+        API.release(outcome, time.monotonic() - started, retry_after_seconds(resp))
+        if outcome == "ok" or attempt == MAX_RETRIES:
+            return resp
+        API.count_retry("throttled")
+    return None
+
+
+def cdn_head(url: str, **kwargs):
+    """HEAD request through the CDN limiter (no retries; a 429 still slows the CDN down)."""
+    CDN.acquire()
+    started = time.monotonic()
+    try:
+        resp = transport.request("HEAD", url, **kwargs)
+    except requests.Timeout:
+        CDN.release("timeout")
+        raise
+    except requests.RequestException:
+        CDN.release("error")
+        raise
+    CDN.release(_outcome(resp), time.monotonic() - started, retry_after_seconds(resp))
+    return resp
+
+
+@contextmanager
+def cdn_stream(url: str, **kwargs):
+    """
+    Streaming GET through the CDN limiter; the slot is held for the whole
+    transfer. Throttling before the body starts is retried like api_request.
+    """
+    kwargs.setdefault("stream", True)
+    for attempt in range(MAX_RETRIES + 1):
+        CDN.acquire()
+        started = time.monotonic()
+        try:
+            resp = transport.request("GET", url, **kwargs)
+        except requests.Timeout:
+            CDN.release("timeout")
+            if attempt == MAX_RETRIES:
+                raise
+            CDN.count_retry("timeout")
+            continue
+        except requests.RequestException:
+            CDN.release("error")
+            raise
+        if _outcome(resp) == "throttled" and attempt < MAX_RETRIES:
+            resp.close()
+            CDN.release("throttled", retry_after=retry_after_seconds(resp))
+            CDN.count_retry("throttled")
+            continue
+        outcome = "ok"
+        try:
+            with resp:
+                yield resp
+        except requests.Timeout:
+            outcome = "timeout"
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if outcome == "ok":
+                outcome = _outcome(resp)
+            CDN.release(outcome, time.monotonic() - started, retry_after_seconds(resp))
+        return
@@ -0,0 +1,79 @@
+# localfiles.py
+"""
+Track ID → downloaded file lookup.
+
+Every downloaded file ends in '- <track_id>.<ext>', so the output tree can be
+mapped back to track IDs. The map is kept in .dabcli/local-index.json; lookups
+check that the recorded file still exists, and a miss triggers at most one
+rescan of the tree per run. Object-store objects are found by path directly.
+"""
+import os
+import threading
+import time
+
+import store
+from config import config
+from utils import load_json, save_json, track_id_from_filename
+
+AUDIO_EXTS = (".flac", ".mp3")
+
+_lock = threading.Lock()
+_index = None
+_rescanned = False
+
+
+def _index_path() -> str:
+    return config.state_path("local-index.json")
+
+
+def scan(root: str = None, include_links: bool = True) -> dict:
+    """track_id -> audio files under root (default: output directory), hidden folders excluded."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root or config.output_directory):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if not name.lower().endswith(AUDIO_EXTS):
+                continue
+            path = os.path.join(dirpath, name)
+            if not include_links and os.path.islink(path):
+                continue
+            track_id = track_id_from_filename(name)
+            if track_id:
+                found.setdefault(track_id, []).append(path)
+    return found
+
+
+def _rescan():
+    global _index, _rescanned
+    _rescanned = True
+    _index = {track_id: sorted(paths) for track_id, paths in scan().items()}
+    save_json(_index_path(), {"updated": int(time.time()), "tracks": _index})
+
+
+def _preferred(paths: list):
+    """The existing file in the preferred output format, else any existing file."""
+    existing = [p for p in paths if os.path.isfile(p)]
+    for path in existing:
+        if path.endswith(f".{config.output_format}"):
+            return path
+    return existing[0] if existing else None
+
+
+def find(track_id):
+    """Path of a downloaded copy of track_id, or None."""
+    global _index
+    track_id = str(track_id)
+    if store.enabled():
+        for quality, fmt in (("27", "flac"), ("7", "flac"), ("6", "flac"), ("5", "mp3")):
+            path = store.object_path(track_id, quality, fmt)
+            if os.path.isfile(path):
+                return path
+
+    with _lock:
+        if _index is None:
+            _index = (load_json(_index_path(), {}) or {}).get("tracks", {})
+        path = _preferred(_index.get(track_id, []))
+        if path is None and not _rescanned:
+            _rescan()
+            path = _preferred(_index.get(track_id, []))
+    return path
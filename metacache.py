@@ -0,0 +1,52 @@
+# metacache.py
+"""
+Local copies of the album and track metadata seen during downloads, kept in
+.dabcli/meta/ so files can be re-tagged later without asking the API again.
+"""
+import glob
+
+from config import config
+from models import Album, Track
+from utils import load_json, save_json
+
+
+def _album_path(album_id) -> str:
+    return config.state_path("meta", "albums", f"{album_id}.json")
+
+
+def _track_path(track_id) -> str:
+    return config.state_path("meta", "tracks", f"{track_id}.json")
+
+
+def remember_album(album: dict):
+    if album and album.get("id") is not None:
+        save_json(_album_path(album["id"]), album)
+
+
+def remember_track(track: dict):
+    if track and track.get("id") is not None:
+        save_json(_track_path(track["id"]), track)
+
+
+def cached_album(album_id):
+    return Album.from_api(load_json(_album_path(album_id)))
+
+
+def cached_track(track_id):
+    return Track.from_api(load_json(_track_path(track_id)))
+
+
+def snapshot_tracks() -> dict:
+    """Track ID -> track dict for every track in the library sync snapshots."""
+    tracks = {}
+    for path in glob.glob(config.state_path("sync", "libraries", "*.json")):
+        for track in (load_json(path, {}) or {}).get("tracks", []):
+            tracks[str(track.get("id"))] = track
+    return tracks
+
+
+def album_track(album: dict, track_id):
+    for track in album.get("tracks", []):
+        if str(track.get("id")) == str(track_id):
+            return track
+    return None
@@ -0,0 +1,250 @@
+# metrics.py
+"""
+Prometheus metrics for long-running jobs.
+
+Counters and histograms are fed by the event bus (tracks, bytes, transfers,
+tagging, deferred retries) and by direct instrumentation in api.py (requests
+by endpoint and status, latency) and tagger.py (tag write time). Limiter
+state (concurrency limits, throttling, request retries) is read at scrape time.
+
+Two ways to expose them, both off by default:
+  metrics_port      serve GET /metrics on 127.0.0.1:<port>
+  metrics_textfile  rewrite <path> every METRICS_INTERVAL seconds (and at exit)
+                    for node_exporter's textfile collector
+"""
+import atexit
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import events
+import governor
+import limiter
+
+METRICS_INTERVAL = 15  # seconds between textfile rewrites
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+API_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TRANSFER_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+TAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_lock = threading.Lock()
+_metrics = []
+_started = time.time()
+_server = None
+_writer = None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}  # sorted label pairs -> value
+        _metrics.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def _samples(self, labels, value) -> list:
+        return [f"{self.name}{_labels(labels)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """For totals counted elsewhere (the limiters), copied in at scrape time."""
+        with _lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    set = Counter.set
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, labels, value) -> list:
+        counts, total = value
+        lines = [f"{self.name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}"
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_sum{_labels(labels)} {round(total, 6)}")
+        lines.append(f"{self.name}_count{_labels(labels)} {counts[-1]}")
+        return lines
+
+
+# === Metrics ===
+TRACKS = Counter("dabcli_tracks_total", "Tracks handled, by outcome (completed, skipped, linked, failed, deferred)")
+BYTES = Counter("dabcli_downloaded_bytes_total", "Audio bytes downloaded")
+TRANSFER_SECONDS = Histogram("dabcli_transfer_duration_seconds", "Duration of completed track transfers",
+                             TRANSFER_BUCKETS)
+COLLECTIONS = Counter("dabcli_collections_total", "Albums, libraries and discographies, by scope and outcome")
+API_REQUESTS = Counter("dabcli_api_requests_total", "API requests, by endpoint and HTTP status")
+API_SECONDS = Histogram("dabcli_api_request_duration_seconds", "API request latency (retries included), by endpoint",
+                        API_BUCKETS)
+RETRIES = Counter("dabcli_request_retries_total", "Requests retried after throttling or a timeout, by host and reason")
+DEFERRED_RETRIES = Counter("dabcli_deferred_retries_total",
+                           "Deferred track retries at the end of a run, by result (attempted, recovered, failed)")
+TAGS = Counter("dabcli_tags_total", "Tagging results (written, unchanged, failed)")
+TAG_SECONDS = Histogram("dabcli_tag_duration_seconds", "Time spent tagging one file", TAG_BUCKETS)
+CONCURRENCY = Gauge("dabcli_concurrency_limit", "Current adaptive concurrency limit, by host")
+IN_FLIGHT = Gauge("dabcli_in_flight_requests", "Requests in flight, by host")
+THROTTLED = Counter("dabcli_throttled_total", "429/503 responses and timeouts seen, by host")
+START_TIME = Gauge("dabcli_start_time_seconds", "Unix time the run started")
+PEAK_RSS = Gauge("dabcli_peak_rss_bytes", "Peak resident set size of the process")
+BUDGET_USED = Gauge("dabcli_budget_used_bytes", "Bytes currently held against a resource budget, by budget")
+
+
+def endpoint_label(endpoint: str) -> str:
+    """'/album?albumId=1' → '/album', '/libraries/42?page=1' → '/libraries/{id}' (bounded label values)."""
+    path = endpoint.split("?", 1)[0]
+    parts = [p for p in path.split("/") if p]
+    if not parts:
+        return "/"
+    return "/" + "/".join([parts[0]] + ["{id}"] * (len(parts) - 1))
+
+
+def _on_event(r: dict):
+    scope, event = r["scope"], r["event"]
+    if scope == "track":
+        if event == "progress":
+            BYTES.inc(r.get("delta") or 0)
+        elif event in ("completed", "skipped", "linked", "failed", "deferred"):
+            TRACKS.inc(outcome=event)
+            if event == "completed" and r.get("duration"):
+                TRANSFER_SECONDS.observe(r["duration"])
+    elif scope == "tag":
+        if event == "tagged":
+            TAGS.inc(result="written" if r.get("changed") else "unchanged")
+        elif event == "failed":
+            TAGS.inc(result="failed")
+    elif scope == "retry":
+        if event == "started":
+            DEFERRED_RETRIES.inc(r.get("tracks", 0), result="attempted")
+        elif event == "completed":
+            DEFERRED_RETRIES.inc(r.get("recovered", 0), result="recovered")
+            DEFERRED_RETRIES.inc(r.get("remaining", 0), result="failed")
+    elif scope in ("album", "library", "discography") and event in ("completed", "failed", "skipped"):
+        COLLECTIONS.inc(scope=scope, outcome=event)
+
+
+events.subscribe(_on_event)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    for host in (limiter.API, limiter.CDN):
+        snap = host.snapshot()
+        CONCURRENCY.set(snap["limit"], host=host.name)
+        IN_FLIGHT.set(snap["in_flight"], host=host.name)
+        THROTTLED.set(snap["throttled"], host=host.name)
+        for reason, count in snap["retries"].items():
+            RETRIES.set(count, host=host.name, reason=reason)
+    START_TIME.set(int(_started))
+    own, _ = governor.peak_rss()
+    if own is not None:
+        PEAK_RSS.set(own)
+    for budget in (governor.NETWORK, governor.COVERS):
+        BUDGET_USED.set(budget.used, budget=budget.name)
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === Exposition ===
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def write_textfile(path: str):
+    """Atomically rewrite path (node_exporter must never read a half-written file)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def _write_loop(path: str):
+    while True:
+        try:
+            write_textfile(path)
+        except OSError as e:
+            print(f"[Metrics] Could not write {path}: {e}")
+        time.sleep(METRICS_INTERVAL)
+
+
+def start(port: int = 0, textfile: str = ""):
+    """Expose metrics on 127.0.0.1:port and/or in a textfile; no-op when both are unset."""
+    global _server, _writer
+    if port and _server is None:
+        try:
+            _server = ThreadingHTTPServer(("127.0.0.1", int(port)), _Handler)
+        except OSError as e:
+            print(f"[Metrics] Could not listen on 127.0.0.1:{port}: {e}")
+        else:
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"[Metrics] Serving http://127.0.0.1:{port}/metrics")
+    if textfile and _writer is None:
+        _writer = threading.Thread(target=_write_loop, args=(textfile,), name="metrics-textfile", daemon=True)
+        _writer.start()
+        atexit.register(write_textfile, textfile)  # final numbers after the job ends
+        print(f"[Metrics] Writing {textfile} every {METRICS_INTERVAL}s")
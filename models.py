@@ -0,0 +1,124 @@
+# models.py
+"""
+Compact Track and Album records.
+
+API responses used to travel through dabcli as the raw JSON dicts, every field
+the API sends included, and a 9,999-track library stayed in memory like that
+for the whole run. Track and Album keep only the fields dabcli reads, in
+__slots__ (no per-object __dict__), and intern the strings that repeat across a
+collection (artist, album title, genre, cover URL, release date).
+
+They behave like the dicts they replace — track["id"], track.get("title", ""),
+setdefault, dict(track), `"x" in track` — so code written against the JSON
+keeps working. An unknown field reads as missing; writing one is a KeyError.
+save_json writes them as plain JSON objects.
+
+loads() is the JSON decoder for API responses: orjson when it is installed,
+the json module otherwise.
+"""
+import json
+import sys
+from collections.abc import MutableMapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Decode a JSON response body (bytes or str)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class _Record(MutableMapping):
+    __slots__ = ()
+    _INTERNED = frozenset()
+
+    def __init__(self, data=None, **fields):
+        if data:
+            fields = {**data, **fields} if fields else data
+        for key in self.__slots__:
+            if key in fields:
+                self[key] = fields[key]
+
+    @classmethod
+    def from_api(cls, data):
+        """Build a record from an API dict (None and existing records pass through)."""
+        if data is None or isinstance(data, cls):
+            return data
+        return cls(data)
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field {key!r}")
+        if key in self._INTERNED and type(value) is str:
+            value = sys.intern(value)
+        object.__setattr__(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            object.__delattr__(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for name in self.__slots__:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        return type(self), (self.to_dict(),)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        return dict(self)
+
+
+class Track(_Record):
+    __slots__ = ("id", "title", "artist", "artistId", "albumTitle", "albumId", "albumCover",
+                 "genre", "releaseDate", "duration")
+    _INTERNED = frozenset(("artist", "albumTitle", "albumCover", "genre", "releaseDate"))
+
+
+class Album(_Record):
+    __slots__ = ("id", "title", "artist", "artistId", "cover", "genre", "releaseDate",
+                 "trackCount", "label", "tracks")
+    _INTERNED = frozenset(("artist", "cover", "genre", "releaseDate", "label"))
+
+    def __setitem__(self, key, value):
+        if key == "tracks" and value is not None:
+            value = parse_tracks(value)
+        super().__setitem__(key, value)
+
+
+def parse_tracks(items) -> list:
+    return [Track.from_api(t) for t in items or []]
+
+
+def parse_albums(items) -> list:
+    return [Album.from_api(a) for a in items or []]
+
+
+def jsonable(obj):
+    """json.dump default= hook: records are written as plain objects."""
+    if isinstance(obj, _Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,217 @@
+# mpvipc.py
+"""
+Event-driven controller for an mpv process over its JSON IPC socket.
+
+One reader thread blocks in a selector on the socket (no polling, no idle
+wakeups) and frames messages on newlines, so JSON split across reads is
+reassembled. Commands are correlated with replies by request_id; property
+changes and other events are dispatched to registered callbacks. Every
+instance gets its own socket path, so concurrent players never collide.
+"""
+import itertools
+import json
+import os
+import selectors
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+
+class MpvError(Exception):
+    pass
+
+
+class MpvController:
+    def __init__(self, args: list = None, mpv_path: str = "mpv"):
+        self.args = list(args or [])
+        self.mpv_path = mpv_path
+        self.proc = None
+        self._sock = None
+        self._sock_dir = None
+        self._reader = None
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._observers = {}
+        self._handlers = {}
+        self.closed = threading.Event()
+
+    @property
+    def supported(self) -> bool:
+        return hasattr(socket, "AF_UNIX")
+
+    # --- lifecycle ---
+    def start(self, urls: list = None, connect_timeout: float = 10.0):
+        """Spawn mpv and connect to its IPC socket. Raises MpvError if either fails."""
+        if not self.supported:
+            raise MpvError("mpv IPC needs Unix domain sockets")
+
+        self._sock_dir = tempfile.mkdtemp(prefix="dabcli-mpv-")
+        sock_path = os.path.join(self._sock_dir, "mpv.sock")
+        cmd = [self.mpv_path] + self.args + [f"--input-ipc-server={sock_path}"] + list(urls or [])
+        try:
+            self.proc = subprocess.Popen(cmd)
+        except FileNotFoundError:
+            self._cleanup()
+            raise MpvError("mpv not found. Please install it.")
+
+        # mpv creates the socket shortly after startup; this is the only wait-and-retry
+        deadline = time.monotonic() + connect_timeout
+        delay = 0.01
+        while True:
+            if self.proc.poll() is not None:
+                self._cleanup()
+                raise MpvError(f"mpv exited during startup (code {self.proc.returncode})")
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(sock_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() > deadline:
+                    self.proc.terminate()
+                    self._cleanup()
+                    raise MpvError("Timed out connecting to mpv IPC socket")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+
+        self._sock = sock
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        return self
+
+    def wait(self):
+        """Block until mpv exits, then release the socket."""
+        if self.proc:
+            try:
+                self.proc.wait()
+            except KeyboardInterrupt:
+                self.proc.terminate()
+                self.proc.wait()
+        self.closed.wait(2)
+        self._cleanup()
+        return self.proc.returncode if self.proc else None
+
+    def quit(self):
+        try:
+            self.command("quit", wait=False)
+        except MpvError:
+            pass
+
+    def _cleanup(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        if self._sock_dir:
+            shutil.rmtree(self._sock_dir, ignore_errors=True)
+            self._sock_dir = None
+
+    # --- commands ---
+    def command(self, *args, wait: bool = True, timeout: float = 5.0):
+        """Send a command; with wait=True return its data or raise MpvError."""
+        if self._sock is None or self.closed.is_set():
+            raise MpvError("mpv is not running")
+        request_id = next(self._ids)
+        slot = None
+        if wait:
+            slot = {"event": threading.Event(), "reply": None}
+            self._pending[request_id] = slot
+        payload = json.dumps({"command": list(args), "request_id": request_id}).encode() + b"\n"
+        try:
+            with self._send_lock:
+                self._sock.sendall(payload)
+        except OSError as e:
+            self._pending.pop(request_id, None)
+            raise MpvError(f"IPC send failed: {e}")
+        if not wait:
+            return None
+        if not slot["event"].wait(timeout):
+            self._pending.pop(request_id, None)
+            raise MpvError(f"No reply to {args[0]}")
+        reply = slot["reply"]
+        if reply is None:
+            raise MpvError(f"mpv closed before replying to {args[0]}")
+        if reply.get("error") not in (None, "success"):
+            raise MpvError(f"{args[0]}: {reply.get('error')}")
+        return reply.get("data")
+
+    def get_property(self, name: str):
+        return self.command("get_property", name)
+
+    def set_property(self, name: str, value):
+        return self.command("set_property", name, value)
+
+    def observe(self, name: str, callback):
+        """
+        Call callback(value) whenever the property changes.
+        Callbacks run on the reader thread and must not send commands with wait=True.
+        """
+        observer_id = next(self._ids)
+        self._observers.setdefault(name, []).append(callback)
+        self.command("observe_property", observer_id, name)
+        return observer_id
+
+    def on(self, event: str, callback):
+        """Call callback(message) for an mpv event such as 'end-file' (same rules as observe)."""
+        self._handlers.setdefault(event, []).append(callback)
+
+    # --- reader ---
+    def _read_loop(self):
+        sel = selectors.DefaultSelector()
+        sel.register(self._sock, selectors.EVENT_READ)
+        buf = b""
+        try:
+            while True:
+                sel.select()  # blocks until mpv writes or closes the socket
+                try:
+                    data = self._sock.recv(65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                buf += data
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        self._dispatch(line)
+        finally:
+            sel.close()
+            self.closed.set()
+            for slot in list(self._pending.values()):
+                slot["event"].set()
+            self._pending.clear()
+            for callback in self._handlers.get("shutdown", []):
+                callback({"event": "shutdown"})
+
+    def _dispatch(self, line: bytes):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return
+
+        if "request_id" in msg and "event" not in msg:
+            slot = self._pending.pop(msg["request_id"], None)
+            if slot:
+                slot["reply"] = msg
+                slot["event"].set()
+            return
+
+        event = msg.get("event")
+        if event == "property-change":
+            for callback in self._observers.get(msg.get("name"), []):
+                self._safe_call(callback, msg.get("data"))
+        elif event and event != "shutdown":
+            for callback in self._handlers.get(event, []):
+                self._safe_call(callback, msg)
+
+    @staticmethod
+    def _safe_call(callback, arg):
+        try:
+            callback(arg)
+        except Exception as e:
+            print(f"[Player] Event handler error: {e}")
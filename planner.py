@@ -0,0 +1,235 @@
+# planner.py
+"""
+Dry-run planner for album, library and discography downloads (--plan).
+
+Resolves metadata and stream URLs, checks what is already on disk (present,
+or satisfiable by a link to another copy or a store object), asks the CDN for
+the exact size of everything else with concurrent HEAD / zero-length Range
+requests, and prints the bytes to transfer, an ETA and a free-space check.
+No audio is written.
+"""
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import limiter
+import localfiles
+import store
+from album import album_excluded, album_folder_path, track_selected
+from api import get
+from config import config
+from downloader import _format_filename, get_stream_url, measured_throughput
+from models import Album
+from segmented import probe
+from utils import sanitize_filename
+
+PROBE_WORKERS = 8
+SAMPLE_BYTES = 4 * 1024 * 1024  # fetched once to estimate bandwidth when there is no history
+
+
+def _quality() -> str:
+    return "5" if config.output_format == "mp3" else "27"
+
+
+def _local_index() -> dict:
+    """track_id -> real audio files in the output format anywhere under the output directory."""
+    suffix = f".{config.output_format}"
+    return {
+        track_id: [p for p in paths if p.endswith(suffix)]
+        for track_id, paths in localfiles.scan(include_links=False).items()
+    }
+
+
+def _item(track: dict, directory: str, index: int = None) -> dict:
+    filename = sanitize_filename(_format_filename(track, str(track["id"]), config.output_format, index))
+    return {
+        "track_id": str(track["id"]),
+        "label": f"{track.get('artist', '?')} — {track.get('title', '?')}",
+        "directory": directory,
+        "path": os.path.join(directory, filename),
+        "state": None,
+        "size": None,
+    }
+
+
+def _classify(items: list, quality: str):
+    """Mark each item present / link / download, mirroring download_track's checks."""
+    local = _local_index()
+    planned = set()
+    for item in items:
+        track_id = item["track_id"]
+        in_folder = [p for p in local.get(track_id, []) if os.path.dirname(p) == item["directory"]]
+        if os.path.exists(item["path"]) or in_folder:
+            item["state"] = "present"
+        elif store.enabled() and os.path.exists(store.object_path(track_id, quality)):
+            item["state"] = "link"
+        elif local.get(track_id) or track_id in planned:
+            item["state"] = "link"  # another copy exists (or will, earlier in this plan)
+        else:
+            item["state"] = "download"
+            planned.add(track_id)
+
+
+def _size_of(url: str):
+    try:
+        r = limiter.cdn_head(url, allow_redirects=True, timeout=15)
+        length = r.headers.get("content-length")
+        if r.ok and length and length.isdigit() and int(length) > 0:
+            return int(length)
+        return probe(url)[0]
+    except requests.RequestException:
+        return None
+
+
+def _probe_item(job):
+    item, quality = job
+    url = get_stream_url(item["track_id"], quality)
+    if url:
+        item["url"] = url
+        item["size"] = _size_of(url)
+    return item
+
+
+def _sample_throughput(url: str):
+    """Time a short ranged read to estimate bandwidth (bytes/s)."""
+    try:
+        started = time.monotonic()
+        received = 0
+        with limiter.cdn_stream(url, headers={"Range": f"bytes=0-{SAMPLE_BYTES - 1}"}, timeout=15) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(65536):
+                received += len(chunk)
+                if received >= SAMPLE_BYTES:
+                    break
+        elapsed = time.monotonic() - started
+        return received / elapsed if elapsed > 0 and received else None
+    except requests.RequestException:
+        return None
+
+
+def _free_space(path: str):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _fmt_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def build_plan(items: list) -> dict:
+    """Classify items, size the downloads concurrently and estimate the transfer."""
+    quality = _quality()
+    _classify(items, quality)
+    downloads = [i for i in items if i["state"] == "download"]
+
+    if downloads:
+        print(f"[Plan] Probing {len(downloads)} stream sizes...")
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            list(pool.map(_probe_item, [(i, quality) for i in downloads]))
+
+    total = sum(i["size"] or 0 for i in downloads)
+    rate, source = measured_throughput(), "past downloads"
+    if rate is None:
+        sample = next((i["url"] for i in downloads if i.get("url")), None)
+        rate, source = (_sample_throughput(sample) if sample else None), "sample"
+
+    return {
+        "tracks": len(items),
+        "present": sum(1 for i in items if i["state"] == "present"),
+        "link": sum(1 for i in items if i["state"] == "link"),
+        "download": len(downloads),
+        "unresolved": sum(1 for i in downloads if not i.get("url")),
+        "unknown_size": sum(1 for i in downloads if i.get("url") and not i["size"]),
+        "bytes": total,
+        "rate": rate,
+        "rate_source": source,
+        "free": _free_space(config.output_directory),
+        "items": items,
+    }
+
+
+def print_plan(title: str, plan: dict):
+    print(f"\n[Plan] {title}")
+    print(f"       Tracks          : {plan['tracks']}")
+    print(f"       Already present : {plan['present']}")
+    print(f"       Via links       : {plan['link']} (no transfer)")
+    print(f"       To download     : {plan['download']} ({_fmt_bytes(plan['bytes'])})")
+    if plan["unknown_size"] or plan["unresolved"]:
+        print(f"       Size unknown    : {plan['unknown_size']} | No stream URL: {plan['unresolved']}")
+    if plan["download"]:
+        if plan["rate"]:
+            print(f"       ETA             : ~{_fmt_duration(plan['bytes'] / plan['rate'])} "
+                  f"at {_fmt_bytes(plan['rate'])}/s ({plan['rate_source']})")
+        else:
+            print("       ETA             : unknown (no throughput measurement)")
+    if plan["free"] is not None:
+        verdict = "OK" if plan["free"] >= plan["bytes"] else "NOT ENOUGH SPACE"
+        print(f"       Free space      : {_fmt_bytes(plan['free'])} on {config.output_directory} → {verdict}")
+    print(f"       Concurrency     : {limiter.status()}")
+
+
+# === Sources ===
+def _album_items(album_id: str, directory: str = None, discography_artist: str = None) -> list:
+    album_data = get(f"/album?albumId={album_id}")
+    if not album_data or "album" not in album_data:
+        print(f"[Plan] Could not fetch album {album_id}.")
+        return []
+    album = Album.from_api(album_data["album"])
+    output_directory, album_folder = album_folder_path(album, album_id, directory)
+    if album_excluded(output_directory, album_id):
+        return []
+    return [
+        _item(track, album_folder, idx)
+        for idx, track in enumerate(album.get("tracks", []), 1)
+        if track_selected(album, track, discography_artist)
+    ]
+
+
+def plan_album(album_id: str, cli_args=None) -> dict:
+    plan = build_plan(_album_items(album_id))
+    print_plan(f"Album {album_id}", plan)
+    return plan
+
+
+def plan_library(library_id: str, cli_args=None) -> dict:
+    result = get(f"/libraries/{library_id}?limit=9999&page=1")
+    if not result or "library" not in result:
+        print("[Plan] Failed to load library.")
+        return None
+    library = result["library"]
+    title = sanitize_filename(library.get("name", f"library_{library_id}"))
+    lib_folder = os.path.join(config.output_directory, "libraries", title)
+    plan = build_plan([_item(track, lib_folder) for track in library.get("tracks", [])])
+    print_plan(f"Library: {title}", plan)
+    return plan
+
+
+def plan_discography(data: dict, artist_id: str, cli_args=None) -> dict:
+    artist = data["artist"].get("name", "Unknown Artist")
+    directory = os.path.join(config.output_directory, "discographies", sanitize_filename(f"{artist} - {artist_id}"))
+    albums = data.get("albums", [])
+    print(f"[Plan] Resolving {len(albums)} albums by {artist}...")
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        per_album = list(pool.map(lambda alb: _album_items(alb["id"], directory, artist), albums))
+    plan = build_plan([item for items in per_album for item in items])
+    print_plan(f"Discography: {artist} ({len(albums)} albums)", plan)
+    return plan
@@ -0,0 +1,203 @@
+# retag.py
+"""
+Re-tag already downloaded files without transferring any audio.
+
+Files are mapped back to their track ID through the '- <track_id>.<ext>'
+filename suffix and, inside album folders ('... - <album_id>'), to their album.
+Metadata comes from the local cache (.dabcli/meta) and library sync snapshots;
+only what is missing there is fetched, once per album or track. Tagging runs in
+a process pool, and tag_audio writes each file at most once.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metacache
+from album import album_track_metadata
+from api import get
+from config import config
+from cover import download_cover_image
+from library import track_metadata
+from models import Album
+from utils import load_json, sanitize_filename, track_id_from_filename
+
+AUDIO_EXTS = {".flac", ".mp3"}
+FETCH_WORKERS = 8
+
+
+def resolve_target(target: str):
+    """Turn a path, album ID or library ID into a folder (or file) to re-tag."""
+    if os.path.exists(target):
+        return os.path.abspath(target)
+
+    pattern = f"* - {glob.escape(target)}"
+    for base in ("albums", os.path.join("discographies", "*")):
+        matches = glob.glob(os.path.join(glob.escape(config.output_directory), base, pattern))
+        if matches:
+            return matches[0] if len(matches) == 1 else matches
+
+    snapshot = load_json(config.state_path("sync", "libraries", f"{target}.json"))
+    if snapshot and os.path.isdir(snapshot.get("folder", "")):
+        return snapshot["folder"]
+
+    result = get(f"/libraries/{target}?limit=9999&page=1")
+    if result and "library" in result:
+        folder = os.path.join(config.output_directory, "libraries",
+                              sanitize_filename(result["library"].get("name", f"library_{target}")))
+        for track in result["library"].get("tracks", []):
+            metacache.remember_track(track)
+        if os.path.isdir(folder):
+            return folder
+    return None
+
+
+def _album_id_from_folder(folder: str):
+    """'<year> - <artist> - <title> - <album_id>' → album_id, else None."""
+    name = os.path.basename(folder.rstrip(os.sep))
+    if name.count(" - ") < 3:
+        return None
+    return name.rsplit(" - ", 1)[1].strip() or None
+
+
+def _collect_files(paths: list) -> list:
+    files = []
+    state_root = os.path.abspath(config.state_path())
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            if os.path.abspath(dirpath).startswith(state_root):
+                dirnames[:] = []
+                continue
+            dirnames[:] = [d for d in dirnames if d not in (".removed", ".excluded")]
+            files.extend(os.path.join(dirpath, n) for n in filenames
+                         if os.path.splitext(n)[1].lower() in AUDIO_EXTS)
+    return sorted(files)
+
+
+def _fetch_album(album_id):
+    album = metacache.cached_album(album_id)
+    if album:
+        return album_id, album
+    result = get(f"/album?albumId={album_id}")
+    if result and "album" in result:
+        album = Album.from_api(result["album"])
+        metacache.remember_album(album)
+        return album_id, album
+    return album_id, None
+
+
+def _fetch_track(track_id):
+    from search import get_track_metadata_by_id
+    track = get_track_metadata_by_id(track_id)
+    if track:
+        metacache.remember_track(track)
+    return track_id, track or None
+
+
+def _cover_for(key: str, url: str, folder: str):
+    """Prefer a kept cover.jpg next to the files, else a cached copy of the URL."""
+    kept = os.path.join(folder, "cover.jpg")
+    if os.path.exists(kept):
+        return kept
+    if not url:
+        return None
+    path = config.state_path("meta", "covers", f"{key}.jpg")
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return download_cover_image(url, path)
+
+
+def _retag_job(job):
+    from tagger import TAG_STATS, tag_audio
+    path, metadata, cover_path = job
+    before = TAG_STATS["written"]
+    ok = tag_audio(path, metadata, cover_path=cover_path)
+    return path, ok, TAG_STATS["written"] > before
+
+
+def plan_jobs(files: list):
+    """Resolve metadata and covers for every file. Returns (jobs, unresolved)."""
+    entries = []
+    unresolved = []
+    album_ids = set()
+    for path in files:
+        track_id = track_id_from_filename(path)
+        if not track_id:
+            unresolved.append(path)
+            continue
+        album_id = _album_id_from_folder(os.path.dirname(path))
+        entries.append((path, track_id, album_id))
+        if album_id:
+            album_ids.add(album_id)
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        albums = {k: v for k, v in pool.map(_fetch_album, sorted(album_ids)) if v}
+
+    snapshots = metacache.snapshot_tracks()
+    tracks = {}
+    missing = set()
+    for path, track_id, album_id in entries:
+        if album_id in albums and metacache.album_track(albums[album_id], track_id):
+            continue
+        track = metacache.cached_track(track_id) or snapshots.get(str(track_id))
+        if track:
+            tracks[track_id] = track
+        else:
+            missing.add(track_id)
+
+    if missing:
+        print(f"[Retag] Fetching metadata for {len(missing)} uncached tracks...")
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            tracks.update({k: v for k, v in pool.map(_fetch_track, sorted(missing)) if v})
+
+    jobs = []
+    covers = {}
+    for path, track_id, album_id in entries:
+        folder = os.path.dirname(path)
+        album = albums.get(album_id)
+        album_entry = metacache.album_track(album, track_id) if album else None
+        if album_entry:
+            metadata = album_track_metadata(album, album_entry)
+            key, url = f"album-{album_id}", album.get("cover")
+        elif track_id in tracks:
+            track = tracks[track_id]
+            metadata = track_metadata(track)
+            key, url = f"album-{track.get('albumId') or 'track-' + str(track_id)}", track.get("albumCover")
+        else:
+            unresolved.append(path)
+            continue
+        if (key, folder) not in covers:
+            covers[(key, folder)] = _cover_for(key, url, folder)
+        jobs.append((path, metadata, covers[(key, folder)]))
+    return jobs, unresolved
+
+
+def retag(target: str, workers: int = None):
+    """Re-tag every audio file under target (a path, album ID or library ID)."""
+    resolved = resolve_target(target)
+    if not resolved:
+        print(f"[Retag] Nothing found for {target!r} (not a path, downloaded album or library).")
+        return
+    paths = resolved if isinstance(resolved, list) else [resolved]
+
+    files = _collect_files(paths)
+    jobs, unresolved = plan_jobs(files)
+    print(f"[Retag] {len(files)} files, {len(jobs)} with metadata, {len(unresolved)} unresolved")
+
+    written = skipped = failed = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, ok, changed in pool.map(_retag_job, jobs, chunksize=16):
+                if not ok:
+                    failed += 1
+                elif changed:
+                    written += 1
+                else:
+                    skipped += 1
+
+    for path in unresolved:
+        print(f"[Retag] No metadata for {os.path.relpath(path, config.output_directory)}")
+    print(f"[Retag] {written} files tagged, {skipped} already up to date, {failed} failed")
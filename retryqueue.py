@@ -0,0 +1,148 @@
+# retryqueue.py
+"""
+Deferred retries for tracks whose download failed.
+
+Album, library and discography downloads hand failed tracks to a RetryQueue
+instead of dropping them. At the end of the run the queue retries them with
+exponential backoff (retry_backoff_seconds, doubled per round) up to
+retry_attempts rounds; every attempt asks for a fresh stream URL. Tracks that
+still fail are written to .dabcli/retry.json, which `dabcli.py retry` reads back.
+
+Each entry is a plain dict describing how to fetch the track again:
+  {"kind": "album", "album_id", "track_id", "index", "folder", "quality", "label"}
+  {"kind": "library", "library_id", "track", "track_id", "folder", "quality", "label"}
+"""
+import time
+
+import events
+from config import config
+from downloader import stopped_by_user
+from models import Album
+from utils import load_json, save_json
+
+MAX_DELAY = 300  # seconds
+
+
+def retry_file() -> str:
+    return config.state_path("retry.json")
+
+
+def _key(entry: dict):
+    return entry["kind"], str(entry["track_id"]), entry.get("folder")
+
+
+def save_failures(entries: list, path: str = None):
+    """Merge entries into the retry file (one entry per track and folder)."""
+    path = path or retry_file()
+    existing = {_key(e): e for e in load_json(path, []) or []}
+    for entry in entries:
+        existing[_key(entry)] = dict(entry, failed_at=int(time.time()))
+    save_json(path, list(existing.values()))
+
+
+class RetryQueue:
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.pending = []  # (entry, callable returning a truthy value on success)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def defer(self, entry: dict, job):
+        self.pending.append((entry, job))
+        events.emit("deferred", track_id=str(entry["track_id"]), label=entry.get("label"))
+
+    def save(self) -> list:
+        """Write everything deferred to the retry file without retrying (e.g. after Ctrl+C)."""
+        entries = [entry for entry, _ in self.pending]
+        if entries:
+            save_failures(entries)
+        return entries
+
+    def run(self, immediate: bool = False, path: str = None, merge: bool = True) -> list:
+        """
+        Retry everything deferred. Returns the entries that still failed, which
+        are also added to the retry file (or replace its contents, merge=False).
+        immediate skips the first backoff.
+        """
+        if not self.pending:
+            return []
+        attempts = max(1, int(config.retry_attempts))
+        total = len(self.pending)
+        stopped = 0
+        try:
+            for attempt in range(1, attempts + 1):
+                if not self.pending:
+                    break
+                delay = 0 if immediate and attempt == 1 else min(
+                    MAX_DELAY, float(config.retry_backoff_seconds) * 2 ** (attempt - 1))
+                events.emit("started", scope="retry", of=self.scope, attempt=attempt, attempts=attempts,
+                            tracks=len(self.pending), delay=delay)
+                time.sleep(delay)
+                still_failing = []
+                for entry, job in self.pending:
+                    try:
+                        ok = job()
+                    except Exception as e:
+                        events.emit("failed", scope="retry", track_id=str(entry["track_id"]), error=str(e))
+                        still_failing.append((entry, job))
+                        continue
+                    if ok:
+                        continue
+                    if stopped_by_user():
+                        stopped += 1  # stopped with 'q': dropped, not a failure
+                    else:
+                        still_failing.append((entry, job))
+                self.pending = still_failing
+        finally:
+            # Also on Ctrl+C: whatever has not been recovered goes to the retry file
+            remaining = [entry for entry, _ in self.pending]
+            if not merge:
+                save_json(path or retry_file(), remaining)
+            elif remaining:
+                save_failures(remaining, path)
+            events.emit("completed", scope="retry", of=self.scope, recovered=total - len(remaining) - stopped,
+                        remaining=len(remaining), stopped=stopped, file=(path or retry_file()) if remaining else None)
+        return remaining
+
+
+def run_retry_file(path: str = None):
+    """Feed the retry file back in: every entry is attempted again, recovered ones are removed."""
+    import metacache
+    from album import retry_album_track
+    from api import get
+    from library import _download_library_track
+
+    path = path or retry_file()
+    entries = load_json(path, []) or []
+    if not entries:
+        print("[Retry] Nothing to retry.")
+        return
+    print(f"[Retry] {len(entries)} tracks from {path}")
+
+    albums = {}
+
+    def album_job(entry):
+        def job():
+            album_id = str(entry["album_id"])
+            if album_id not in albums:
+                album = metacache.cached_album(album_id)
+                if not album:
+                    result = get(f"/album?albumId={album_id}")
+                    album = Album.from_api(result.get("album")) if result else None
+                albums[album_id] = album
+            album = albums[album_id]
+            track = metacache.album_track(album, entry["track_id"]) if album else None
+            if not track:
+                return False
+            return retry_album_track(album, track, entry.get("index"), entry["folder"], entry["quality"])
+        return job
+
+    def library_job(entry):
+        return lambda: _download_library_track(entry["track"], entry["folder"], entry["quality"])
+
+    queue = RetryQueue("file")
+    for entry in entries:
+        job = album_job(entry) if entry.get("kind") == "album" else library_job(entry)
+        queue.pending.append((entry, job))
+    queue.run(immediate=True, path=path, merge=False)
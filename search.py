@@ -2,7 +2,8 @@
   
 from api import get  
 from config import config  
-from utils import require_login  
+from models import Album, parse_albums, parse_tracks  
+from utils import remember_listing, require_login  
 from tabulate import tabulate  
   
 def debug_print(msg: str):  
@@ -42,15 +43,19 @@ def search_and_return(query: str, filter_type: str = None):
                 seen = {}  
                 for t in result["tracks"]:  
                     if t["albumId"] not in seen:  
-                        seen[t["albumId"]] = {  
-                            "id": t["albumId"],  
-                            "title": t["albumTitle"],  
-                            "artist": t["artist"],  
-                            "artistId": t["artistId"],  
-                            "releaseDate": t.get("releaseDate", "")  
-                        }  
+                        seen[t["albumId"]] = Album(  
+                            id=t["albumId"],  
+                            title=t["albumTitle"],  
+                            artist=t["artist"],  
+                            artistId=t["artistId"],  
+                            releaseDate=t.get("releaseDate", "")  
+                        )  
                 data = list(seen.values())  
   
+        if filter_type == "track":  
+            return parse_tracks(data)  
+        if filter_type == "album":  
+            return parse_albums(data)  
         return data  
   
     return result  
@@ -73,29 +78,30 @@ def search_and_print(query: str, filter_type: str = None):
             _print_table(results, t)  
   
 def _print_table(results, result_type: str):  
+    remember_listing(result_type, [r["id"] for r in results])  
     if result_type == "track":  
         print(f"\nFound {len(results)} track(s):\n")  
         table = [  
-            [track["id"], track["title"], f"{track['artist']} ({track.get('artistId', '—')})", track.get("albumTitle", "—")]  
-            for track in results  
+            [idx, track["id"], track["title"], f"{track['artist']} ({track.get('artistId', '—')})", track.get("albumTitle", "—")]  
+            for idx, track in enumerate(results, 1)  
         ]  
-        print(tabulate(table, headers=["ID", "Title", "Artist (ID)", "Album"], tablefmt="fancy_grid"))  
+        print(tabulate(table, headers=["#", "ID", "Title", "Artist (ID)", "Album"], tablefmt="fancy_grid"))  
   
     elif result_type == "album":  
         print(f"\nFound {len(results)} album(s):\n")  
         table = [  
-            [album["id"], album["title"], f"{album['artist']} ({album.get('artistId', '—')})", album.get("releaseDate", "")[:4]]  
-            for album in results  
+            [idx, album["id"], album["title"], f"{album['artist']} ({album.get('artistId', '—')})", album.get("releaseDate", "")[:4]]  
+            for idx, album in enumerate(results, 1)  
         ]  
-        print(tabulate(table, headers=["ID", "Title", "Artist (ID)", "Year"], tablefmt="fancy_grid"))  
+        print(tabulate(table, headers=["#", "ID", "Title", "Artist (ID)", "Year"], tablefmt="fancy_grid"))  
   
     elif result_type == "artist":  
         print(f"\nFound {len(results)} artist(s):\n")  
         table = [  
-            [artist["id"], f"{artist['name']} ({artist['id']})"]  
-            for artist in results  
+            [idx, artist["id"], f"{artist['name']} ({artist['id']})"]  
+            for idx, artist in enumerate(results, 1)  
         ]  
-        print(tabulate(table, headers=["ID", "Name (ID)"], tablefmt="fancy_grid"))  
+        print(tabulate(table, headers=["#", "ID", "Name (ID)"], tablefmt="fancy_grid"))  
   
 def get_artist_discography(artist_id: str):  
     """  
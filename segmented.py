@@ -0,0 +1,176 @@
+# segmented.py
+"""
+Segmented multi-connection download for large files.
+
+The body is split into byte ranges fetched over several connections and written
+at their offsets in a preallocated file. Whenever a connection runs out of work
+it takes over the back half of the largest remaining range, so a slow or stalled
+segment is rebalanced across the idle connections. A segment whose connection
+stalls past the read timeout is reopened from where it stopped.
+
+Every open range holds a CDN limiter slot, and that limit starts at 2, so
+callers size `connections` by the slots currently free (see
+downloader._download_segmented); more connections would only queue.
+"""
+import os
+import threading
+
+import requests
+
+import governor
+import limiter
+
+CHUNK_SIZE = 256 * 1024
+MIN_SPLIT = 2 * 1024 * 1024  # never split off less than this
+MAX_RETRIES = 5
+
+
+class SegmentError(Exception):
+    pass
+
+
+class RangeIgnored(SegmentError):
+    """The server answered a range request with the whole body; use a single stream instead."""
+
+
+def probe(url: str, timeout: int = 30):
+    """
+    Ask for the first byte only. Returns (size, supports_range);
+    size is None when the server reports no length.
+    """
+    with limiter.cdn_stream(url, headers={"Range": "bytes=0-0"}, timeout=timeout) as r:
+        r.raise_for_status()
+        content_range = r.headers.get("content-range", "")
+        if r.status_code == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                return int(total), True
+        length = r.headers.get("content-length")
+        return (int(length) if length and length.isdigit() else None), False
+
+
+class _Segment:
+    def __init__(self, start: int, end: int):
+        self.pos = start  # next byte to write
+        self.end = end  # inclusive; may shrink when the tail is handed to another worker
+        self.busy = False
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.pos + 1
+
+
+class SegmentedDownload:
+    def __init__(self, url: str, path: str, size: int, connections: int = 4,
+                 stall_timeout: int = 15, progress=None, should_stop=None, wait_if_paused=None):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.connections = max(1, connections)
+        self.stall_timeout = stall_timeout
+        self.progress = progress or (lambda n: None)
+        self.should_stop = should_stop or (lambda: False)
+        self.wait_if_paused = wait_if_paused or (lambda: None)
+        self._lock = threading.Lock()
+        self._segments = []
+        self._error = None
+
+    def run(self) -> bool:
+        """Download the whole file. Returns False if stopped; raises SegmentError on failure."""
+        self._preallocate()
+        step = -(-self.size // self.connections)
+        self._segments = [
+            _Segment(start, min(start + step, self.size) - 1)
+            for start in range(0, self.size, step)
+        ]
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in self._segments]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        if isinstance(self._error, SegmentError):
+            raise self._error
+        if self._error:
+            raise SegmentError(str(self._error))
+        if self.should_stop():
+            return False
+        if any(seg.remaining > 0 for seg in self._segments):
+            raise SegmentError("incomplete download")
+        return True
+
+    def _preallocate(self):
+        with open(self.path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, self.size)
+                    return
+                except OSError:
+                    pass
+            f.truncate(self.size)
+
+    def _next_segment(self):
+        """Claim an idle segment, or split the largest busy one and take its tail."""
+        with self._lock:
+            for seg in self._segments:
+                if not seg.busy and seg.remaining > 0:
+                    seg.busy = True
+                    return seg
+            busy = [seg for seg in self._segments if seg.busy and seg.remaining >= 2 * MIN_SPLIT]
+            if not busy:
+                return None
+            victim = max(busy, key=lambda s: s.remaining)
+            mid = victim.pos + victim.remaining // 2
+            tail = _Segment(mid, victim.end)
+            tail.busy = True
+            victim.end = mid - 1
+            self._segments.append(tail)
+            return tail
+
+    def _worker(self):
+        with open(self.path, "r+b") as f:
+            while not self._error and not self.should_stop():
+                seg = self._next_segment()
+                if seg is None:
+                    return
+                try:
+                    self._fetch(seg, f)
+                except Exception as e:
+                    with self._lock:
+                        self._error = self._error or e
+                    return
+                finally:
+                    with self._lock:
+                        seg.busy = False
+
+    def _fetch(self, seg: _Segment, f):
+        retries = 0
+        while seg.remaining > 0 and not self.should_stop():
+            headers = {"Range": f"bytes={seg.pos}-{seg.end}"}
+            try:
+                # Each open range holds a CDN slot, so the connection count follows its limit
+                with governor.NETWORK.hold(governor.stream_buffer(CHUNK_SIZE)), \
+                        limiter.cdn_stream(self.url, headers=headers, timeout=(10, self.stall_timeout)) as r:
+                    if r.status_code != 206:
+                        r.raise_for_status()
+                        raise RangeIgnored(f"server ignored Range (HTTP {r.status_code})")
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        if self.should_stop():
+                            return
+                        self.wait_if_paused()
+                        with self._lock:
+                            # The tail may have been handed to another worker meanwhile
+                            chunk = chunk[:max(0, seg.end - seg.pos + 1)]
+                            offset = seg.pos
+                            seg.pos += len(chunk)
+                        if chunk:
+                            f.seek(offset)
+                            f.write(chunk)
+                            self.progress(len(chunk))
+                        if seg.remaining <= 0:
+                            break
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Stalled or dropped: reopen the remaining range
+                retries += 1
+                if retries > MAX_RETRIES:
+                    raise SegmentError(f"segment at {seg.pos} kept failing: {e}")
@@ -0,0 +1,279 @@
+# shell.py
+"""
+Interactive shell (`dabcli.py shell`).
+
+Every line is parsed with the normal dabcli parser and run inside one process,
+so imports, the login, pooled HTTP connections and recent search, discography
+and album lookups (api.enable_cache) carry over from one command to the next.
+
+A number in place of an ID (right after the command, or after --album-id /
+--track-id) picks a row from the last table of that kind: after
+`search radiohead`, `discography 1 --view-only` lists the first artist's
+albums and `album 3` downloads the third. `#3` always means a row number, a
+bare 3 only when the last table has that many rows.
+
+Downloads (album, track, library, discography, retry) are queued and run one
+after another in the background while browsing continues; their output goes to
+.dabcli/shell/job-N.log. `jobs` lists them, `pause` / `resume` control them.
+"""
+import cmd
+import os
+import queue
+import shlex
+import sys
+import threading
+
+import api
+import downloader
+import events
+import transport
+from config import config
+from search import _print_table, search_and_return
+from utils import LISTINGS
+
+DOWNLOADS = ("album", "track", "library", "discography", "retry")
+ARGUMENT_KINDS = {"album": "album", "track": "track", "discography": "artist"}
+OPTION_KINDS = {"--album-id": "album", "--track-id": "track"}
+
+SHELL_HELP = """
+Shell commands:
+  jobs              → List background downloads
+  pause | resume    → Pause or resume background downloads
+  exit | quit       → Leave the shell (waits for queued downloads)
+
+A row number from the last table can be used in place of an ID, e.g. `album 3`.
+"""
+
+
+class _ThreadOutput:
+    """sys.stdout/stderr stand-in: background jobs write to their log, everything else to the terminal."""
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.routes = {}  # thread ident -> log file
+
+    def write(self, text):
+        return self.routes.get(threading.get_ident(), self.terminal).write(text)
+
+    def flush(self):
+        self.routes.get(threading.get_ident(), self.terminal).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.terminal, name)
+
+
+class Job:
+    def __init__(self, number: int, line: str, args):
+        self.number = number
+        self.line = line
+        self.args = args
+        self.state = "queued"
+        self.log = config.state_path("shell", f"job-{number}.log")
+
+
+class Shell(cmd.Cmd):
+    intro = "DAB CLI shell — type `help` for commands, `exit` to leave."
+    prompt = "dabcli> "
+
+    def __init__(self, parser, subparsers, run):
+        super().__init__()
+        self.parser = parser
+        self.subparsers = subparsers
+        self.run_command = run
+        self.jobs = []
+        self.pending = queue.Queue()
+        self.stdout_proxy = _ThreadOutput(sys.stdout)
+        self.stderr_proxy = _ThreadOutput(sys.stderr)
+        self.worker = threading.Thread(target=self._work, name="shell-downloads", daemon=True)
+
+    # === Lifecycle ===
+    def start(self):
+        api.enable_cache()
+        transport.keep_alive()
+        config.show_progress = False  # bars would draw over the prompt; jobs report when done
+        downloader._CONTROLS_STARTED = True  # the shell owns the keyboard (see pause/resume)
+        sys.stdout, sys.stderr = self.stdout_proxy, self.stderr_proxy
+        self.worker.start()
+        try:
+            while True:
+                try:
+                    self.cmdloop()
+                    break
+                except KeyboardInterrupt:
+                    print("^C")
+                    self.intro = None
+        finally:
+            sys.stdout, sys.stderr = self.stdout_proxy.terminal, self.stderr_proxy.terminal
+
+    def emptyline(self):
+        pass
+
+    def do_exit(self, arg):
+        waiting = sum(1 for job in self.jobs if job.state in ("queued", "running"))
+        if waiting and downloader._HELD:
+            downloader._HELD = False
+            print("[Downloader] Resumed")
+        if waiting:
+            print(f"[Shell] Waiting for {waiting} downloads (Ctrl+C to abandon them)...")
+            try:
+                self.pending.join()
+            except KeyboardInterrupt:
+                pass
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, arg):
+        print()
+        return self.do_exit(arg)
+
+    def do_help(self, arg):
+        self.default(f"help {arg}".strip())
+        if not arg:
+            print(SHELL_HELP)
+
+    def do_jobs(self, arg):
+        if not self.jobs:
+            print("[Shell] No downloads yet.")
+        for job in self.jobs:
+            print(f"  {job.number:>3}  {job.state:<8}  {job.line}  ({job.log})")
+
+    def do_pause(self, arg):
+        downloader._HELD = True
+        print("[Downloader] Paused")
+
+    def do_resume(self, arg):
+        downloader._HELD = False
+        events.refresh_progress()
+        print("[Downloader] Resumed")
+
+    # === Commands ===
+    def default(self, line):
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            print(f"[Shell] {e}")
+            return
+        words = self._resolve_numbers(words)
+        if words is None:
+            return
+        try:
+            args = self.parser.parse_args(words)
+        except SystemExit:
+            return  # argparse has printed the problem
+        if args.command == "shell":
+            print("[Shell] Already in the shell.")
+            return
+        if self._is_download(args):
+            if self._resolve_names(args):
+                self._queue(" ".join(words), args)
+            return
+        self._run(args)
+
+    def _run(self, args):
+        try:
+            self.run_command(args, self.subparsers)
+        except SystemExit:
+            pass
+        except KeyboardInterrupt:
+            print("^C")
+        except Exception as e:
+            print(f"[Shell] {args.command} failed: {e}")
+
+    def _resolve_numbers(self, words):
+        """Replace row numbers (from the last table of the expected kind) with IDs."""
+        if not words:
+            return words
+        words = list(words)
+        for i in range(1, len(words)):
+            if words[i - 1] in OPTION_KINDS:
+                wanted = OPTION_KINDS[words[i - 1]]
+            elif i == 1 and words[0] in ARGUMENT_KINDS:
+                wanted = ARGUMENT_KINDS[words[0]]  # the ID right after the command
+            else:
+                continue
+            value = words[i]
+            explicit = value.startswith("#")
+            number = value[1:] if explicit else value
+            rows = LISTINGS.get(wanted, [])
+            if not number.isdigit() or not (explicit or int(number) <= len(rows)):
+                continue
+            if not 1 <= int(number) <= len(rows):
+                print(f"[Shell] No {wanted} #{number} in the last listing.")
+                return None
+            words[i] = rows[int(number) - 1]
+        return words
+
+    @staticmethod
+    def _is_download(args) -> bool:
+        if args.command not in DOWNLOADS or getattr(args, "plan", False):
+            return False
+        return not (args.command == "discography" and args.view_only)
+
+    def _resolve_names(self, args) -> bool:
+        """
+        Downloads run in the background, where they cannot ask which match was
+        meant: names are looked up here first. Returns False when the user has
+        to pick from a listing.
+        """
+        if args.command == "album":
+            value = args.album_id_or_title.strip()
+            if value.startswith("al") and len(value) > 5:
+                return True
+            from album import find_album_by_title
+            matches = find_album_by_title(value)
+            kind = "album"
+        elif args.command == "discography":
+            value = args.artist
+            if value.isdigit() or value.lower().startswith("ar"):
+                return True
+            matches = search_and_return(value, filter_type="artist")
+            kind = "artist"
+        else:
+            return True
+        if not matches:
+            print(f"[Shell] No {kind} found for '{value}'.")
+            return False
+        if len(matches) == 1:
+            setattr(args, "album_id_or_title" if kind == "album" else "artist", str(matches[0]["id"]))
+            return True
+        _print_table(matches, kind)
+        print(f"\nPick one with: {args.command} <#>")
+        return False
+
+    # === Background downloads ===
+    def _queue(self, line: str, args):
+        job = Job(len(self.jobs) + 1, line, args)
+        self.jobs.append(job)
+        self.pending.put(job)
+        print(f"[Shell] Job {job.number} queued: {line} (log: {job.log})")
+
+    def _work(self):
+        while True:
+            job = self.pending.get()
+            job.state = "running"
+            os.makedirs(os.path.dirname(job.log), exist_ok=True)
+            with open(job.log, "a", encoding="utf-8", buffering=1) as log:
+                ident = threading.get_ident()
+                self.stdout_proxy.routes[ident] = self.stderr_proxy.routes[ident] = log
+                try:
+                    self.run_command(job.args, self.subparsers)
+                    job.state = "done"
+                except SystemExit as e:  # exit() inside a command must not end the worker
+                    job.state = "failed" if e.code else "done"
+                except Exception as e:
+                    job.state = "failed"
+                    print(f"[Shell] Failed: {e!r}")
+                finally:
+                    del self.stdout_proxy.routes[ident], self.stderr_proxy.routes[ident]
+            self.stdout_proxy.terminal.write(f"\n[Shell] Job {job.number} {job.state}: {job.line}\n")
+            self.stdout_proxy.terminal.flush()
+            self.pending.task_done()
+
+
+def run_shell(parser, subparsers, run):
+    if not config.is_logged_in():
+        print("[Shell] Not logged in: use `login <email> <password>` first.")
+    # Warm the heavier modules now rather than on the first command
+    import album, artist, library  # noqa: F401
+    Shell(parser, subparsers, run).start()
@@ -0,0 +1,269 @@
+# staging.py
+"""
+Scratch staging for downloads (staging_directory).
+
+With a fast local scratch path configured, download_track writes the audio
+there and returns the staged path; tagging (and lyrics) happen on the scratch
+copy too. Once tag_audio is done with a file it is handed to a background
+mover that puts it at its final place in the output directory: a rename when
+scratch and destination share a filesystem, else one large sequential copy
+(sendfile) followed by an atomic rename. Slow storage only sees finished files.
+
+Every staged file has a manifest next to it recording its final path and state
+(downloading → downloaded → ready). After a crash, files still marked
+downloading are deleted; complete ones are moved on the next start.
+
+Downloads wait while the scratch space holds more than staging_max_mb or is
+nearly out of free space, so a slow destination throttles the transfers.
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+from config import config
+
+MIN_FREE_BYTES = 256 * 1024 * 1024
+BATCH_SIZE = 16
+SIDE_EXTS = (".lrc",)
+
+_lock = threading.Lock()
+_space = threading.Condition(_lock)
+_pending = {}  # final path -> staged path
+_released = set()  # final paths handed to the mover
+_queue = queue.Queue()
+_mover = None
+
+
+def enabled() -> bool:
+    return bool(getattr(config, "staging_directory", ""))
+
+
+def _root() -> str:
+    return os.path.abspath(os.path.expanduser(config.staging_directory))
+
+
+def _manifest(staged: str) -> str:
+    return os.path.dirname(staged) + ".json"
+
+
+def _write_manifest(staged: str, final: str, state: str):
+    tmp = _manifest(staged) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"final": final, "staged": staged, "state": state, "pid": os.getpid()}, f)
+    os.replace(tmp, _manifest(staged))
+
+
+def _used_bytes() -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(_root()):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _has_room() -> bool:
+    if _used_bytes() > int(config.staging_max_mb) * 1024 * 1024:
+        return False
+    return shutil.disk_usage(_root()).free > MIN_FREE_BYTES
+
+
+def wait_for_space():
+    """Block (backpressure) until the scratch space has room for another transfer."""
+    _start()
+    if _has_room():
+        return
+    print("[Staging] Scratch space full, waiting for the mover...")
+    with _space:
+        while not _has_room():
+            if not _pending:
+                break  # nothing in flight will free space; let the download try anyway
+            _space.wait(5)
+
+
+def is_pending(final: str) -> bool:
+    with _lock:
+        return final in _pending
+
+
+def stage(final: str) -> str:
+    """Return the scratch path a download for final should be written to."""
+    _start()
+    token = hashlib.sha1(os.path.abspath(final).encode("utf-8")).hexdigest()[:16]
+    folder = os.path.join(_root(), token)
+    os.makedirs(folder, exist_ok=True)
+    staged = os.path.join(folder, os.path.basename(final))
+    _write_manifest(staged, os.path.abspath(final), "downloading")
+    with _lock:
+        _pending[os.path.abspath(final)] = staged
+    return staged
+
+
+def _final_for(staged: str):
+    try:
+        with open(_manifest(staged), encoding="utf-8") as f:
+            return json.load(f).get("final")
+    except (OSError, ValueError):
+        return None
+
+
+def is_staged(path) -> bool:
+    return enabled() and isinstance(path, str) and os.path.abspath(path).startswith(_root() + os.sep)
+
+
+def downloaded(staged: str):
+    _write_manifest(staged, _final_for(staged), "downloaded")
+
+
+def _forget(final: str):
+    with _space:
+        _pending.pop(final, None)
+        _released.discard(final)
+        _space.notify_all()
+
+
+def discard(staged: str):
+    """Drop a failed or interrupted transfer (or the leftovers of a moved one)."""
+    final = _final_for(staged)
+    shutil.rmtree(os.path.dirname(staged), ignore_errors=True)
+    try:
+        os.remove(_manifest(staged))
+    except OSError:
+        pass
+    _forget(final)
+
+
+def release(path: str):
+    """The caller is done with a staged file (tagged): queue it for the mover."""
+    if not is_staged(path):
+        return
+    final = _final_for(path)
+    if not final:
+        return
+    _write_manifest(path, final, "ready")
+    with _lock:
+        _released.add(final)
+    _queue.put((path, final))
+
+
+# === Mover ===
+def _same_device(a: str, b: str) -> bool:
+    try:
+        return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError:
+        return False
+
+
+def _move(staged: str, final: str):
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    sources = [staged] + [os.path.splitext(staged)[0] + ext for ext in SIDE_EXTS]
+    targets = [final] + [os.path.splitext(final)[0] + ext for ext in SIDE_EXTS]
+    for src, dst in zip(sources, targets):
+        if not os.path.exists(src):
+            continue
+        if _same_device(src, os.path.dirname(dst)):
+            os.replace(src, dst)
+            continue
+        part = dst + ".part"
+        shutil.copyfile(src, part)  # sendfile(): one large sequential write
+        shutil.copystat(src, part)
+        os.replace(part, dst)
+        os.remove(src)
+    if getattr(config, "content_dedupe", False):
+        import dedupe
+        dedupe.check_new(final)
+
+
+def _run():
+    while True:
+        batch = [_queue.get()]
+        # Take whatever else is ready so the destination sees one burst of writes
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        for staged, final in batch:
+            try:
+                _move(staged, final)
+                discard(staged)
+            except OSError as e:
+                print(f"[Staging] Could not move {os.path.basename(final)}: {e} (kept in {os.path.dirname(staged)})")
+                _forget(final)
+            _queue.task_done()
+
+
+def _alive(pid) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+def _recover():
+    """Finish what a previous (crashed) run left in the scratch directory."""
+    root = _root()
+    for name in os.listdir(root):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if _alive(manifest.get("pid")):
+            continue  # another dabcli process sharing the scratch directory
+        staged, final, state = manifest.get("staged"), manifest.get("final"), manifest.get("state")
+        if state == "downloading" or not staged or not os.path.exists(staged):
+            shutil.rmtree(os.path.join(root, name[:-5]), ignore_errors=True)
+            os.remove(os.path.join(root, name))
+            continue
+        if state == "downloaded":
+            print(f"[Staging] Recovered an untagged download: {final} (run `dabcli.py retag` on it)")
+        with _lock:
+            _pending[final] = staged
+            _released.add(final)
+        _queue.put((staged, final))
+
+
+def _start():
+    global _mover
+    with _lock:
+        if _mover is not None:
+            return
+        os.makedirs(_root(), exist_ok=True)
+        _mover = threading.Thread(target=_run, name="staging-mover", daemon=True)
+        _mover.start()
+    _recover()
+    atexit.register(drain)
+
+
+def drain():
+    """Hand everything still staged (tagged or not) to the mover and wait for it."""
+    if _mover is None:
+        return
+    with _lock:
+        leftovers = [(staged, final) for final, staged in _pending.items() if final not in _released]
+        _released.update(final for _, final in leftovers)
+    for staged, final in leftovers:
+        if os.path.exists(staged):
+            _queue.put((staged, final))
+    waiting = _queue.unfinished_tasks
+    started = time.monotonic()
+    if waiting:
+        print(f"[Staging] Moving {waiting} files to {config.output_directory}...")
+    _queue.join()
+    if waiting and config.debug:
+        print(f"[Staging] Mover finished in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,267 @@
+# store.py
+"""
+Content-addressed audio store.
+
+Every track is kept exactly once under .dabcli/store/objects, keyed by track ID
+and quality. Album, library and discography folders are "views": hardlinks (or
+reflinks) to those objects. Each object has a small JSON sidecar recording the
+track fields needed to name it and every view that points at it, so views can
+be rebuilt or renamed without touching the network or copying audio.
+
+Hardlinked (and symlinked) views share one set of tags. The first view to tag
+an object owns its tags ("tagged_by" in the sidecar); the other views are left
+as they are, so a track in both its album and a compilation keeps the album's
+tags everywhere instead of being rewritten by each. Reflinked views are
+separate files and are tagged individually.
+"""
+import glob
+import os
+import shutil
+
+from config import config
+from utils import load_json, parse_track_filename, sanitize_filename, save_json, track_id_from_filename
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+# Formats and the quality they are stored under when adopting loose files
+_IMPORT_QUALITY = {"flac": "27", "mp3": "5"}
+
+
+def enabled() -> bool:
+    return bool(getattr(config, "use_object_store", False))
+
+
+def object_path(track_id: str, quality: str, output_format: str = None) -> str:
+    output_format = output_format or config.output_format
+    track_id = str(track_id)
+    shard = track_id[-2:].rjust(2, "0")
+    return config.state_path("store", "objects", f"q{quality}", shard, f"{track_id}.{output_format}")
+
+
+def _sidecar_path(obj_path: str) -> str:
+    return obj_path + ".json"
+
+
+def _load_sidecar(obj_path: str) -> dict:
+    return load_json(_sidecar_path(obj_path), {}) or {}
+
+
+def _reflink(src: str, dst: str):
+    import fcntl
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def link_view(obj_path: str, view_path: str) -> str:
+    """
+    Materialise view_path from obj_path without copying audio.
+    Returns the link type used ("hardlink", "reflink" or "symlink").
+    """
+    os.makedirs(os.path.dirname(view_path) or ".", exist_ok=True)
+    if config.store_link_mode == "reflink" and os.name != "nt":
+        try:
+            _reflink(obj_path, view_path)
+            return "reflink"
+        except OSError:
+            pass
+    try:
+        os.link(obj_path, view_path)
+        return "hardlink"
+    except OSError:
+        os.symlink(os.path.abspath(obj_path), view_path)
+        return "symlink"
+
+
+def record_view(obj_path: str, track_id: str, track_meta: dict, directory: str, index: int = None):
+    """Remember that `directory` holds a view of this object (idempotent)."""
+    sidecar = _load_sidecar(obj_path)
+    sidecar["track_id"] = str(track_id)
+    sidecar["track"] = {
+        "artist": (track_meta or {}).get("artist", "unknown"),
+        "title": (track_meta or {}).get("title", "untitled"),
+    }
+    rel_dir = os.path.relpath(os.path.abspath(directory), os.path.abspath(config.output_directory))
+    view = {"directory": rel_dir, "index": index}
+    views = sidecar.setdefault("views", [])
+    views[:] = [v for v in views if v.get("directory") != rel_dir]
+    views.append(view)
+    save_json(_sidecar_path(obj_path), sidecar)
+
+
+def forget_view(obj_path: str, directory: str):
+    """Drop the record of a view that was deleted on purpose, so rebuild won't restore it."""
+    sidecar = _load_sidecar(obj_path)
+    if not sidecar:
+        return
+    rel_dir = os.path.relpath(os.path.abspath(directory), os.path.abspath(config.output_directory))
+    sidecar["views"] = [v for v in sidecar.get("views", []) if v.get("directory") != rel_dir]
+    if sidecar.get("tagged_by") == rel_dir:
+        del sidecar["tagged_by"]  # the next view to be tagged takes over
+    save_json(_sidecar_path(obj_path), sidecar)
+
+
+def _object_for_view(view_path: str):
+    """The store object view_path shares its data with, or None."""
+    ext = os.path.splitext(view_path)[1].lstrip(".").lower()
+    track_id = track_id_from_filename(view_path)
+    if ext not in _IMPORT_QUALITY or not track_id:
+        return None
+    for quality in set(_IMPORT_QUALITY.values()) | {"6", "7", "27"}:
+        obj_path = object_path(track_id, quality, ext)
+        if os.path.exists(obj_path) and _is_view_of(view_path, obj_path):
+            return obj_path
+    return None
+
+
+def may_tag(view_path: str) -> bool:
+    """
+    False when view_path shares its tags with a view in another folder that
+    tagged the object first; the caller should leave its tags alone.
+    """
+    if not enabled():
+        return True
+    obj_path = _object_for_view(view_path)
+    if not obj_path:
+        return True  # not in the store, or a reflink with its own tags
+    sidecar = _load_sidecar(obj_path)
+    rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(view_path)), os.path.abspath(config.output_directory))
+    owner = sidecar.get("tagged_by")
+    if owner is None:
+        sidecar["tagged_by"] = rel_dir
+        save_json(_sidecar_path(obj_path), sidecar)
+        return True
+    return owner == rel_dir
+
+
+def discard_object(view_path: str):
+    """Delete the store object behind a view (e.g. when its audio is corrupt)."""
+    obj_path = _object_for_view(view_path)
+    if obj_path:
+        os.remove(obj_path)
+
+
+def _iter_objects():
+    root = config.state_path("store", "objects")
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".json") or ".part" in name:
+                continue
+            yield os.path.join(dirpath, name)
+
+
+def _is_view_of(path: str, obj_path: str) -> bool:
+    try:
+        if os.path.islink(path):
+            return os.path.realpath(path) == os.path.realpath(obj_path)
+        return os.path.samefile(path, obj_path)
+    except OSError:
+        return False
+
+
+def rebuild_views(dry_run: bool = False):
+    """
+    Re-materialise every recorded view with the current filename format.
+    Stale names pointing at the same object are renamed, missing views relinked.
+    Returns (created, renamed, unchanged).
+    """
+    from downloader import _format_filename
+
+    created = renamed = unchanged = 0
+    for obj_path in _iter_objects():
+        sidecar = _load_sidecar(obj_path)
+        track_id = sidecar.get("track_id") or os.path.splitext(os.path.basename(obj_path))[0]
+        output_format = os.path.splitext(obj_path)[1].lstrip(".")
+        suffix = f" - {track_id}.{output_format}"
+        for view in sidecar.get("views", []):
+            directory = os.path.join(config.output_directory, view["directory"])
+            filename = sanitize_filename(
+                _format_filename(sidecar.get("track", {}), track_id, output_format, view.get("index"))
+            )
+            view_path = os.path.join(directory, filename)
+            if os.path.lexists(view_path):
+                unchanged += 1
+                continue
+
+            stale = [
+                p for p in glob.glob(os.path.join(glob.escape(directory), f"*{glob.escape(suffix)}"))
+                if _is_view_of(p, obj_path)
+            ]
+            if dry_run:
+                print(f"[Store] {'Rename' if stale else 'Link'}: {view_path}")
+            elif stale:
+                os.rename(stale[0], view_path)
+                for extra in stale[1:]:
+                    os.remove(extra)
+            else:
+                link_view(obj_path, view_path)
+
+            if stale:
+                renamed += 1
+            else:
+                created += 1
+    return created, renamed, unchanged
+
+
+def import_existing(directory: str = None):
+    """
+    Adopt already-downloaded files into the store: the first copy of each track
+    becomes the object, every other copy is replaced by a link to it.
+    Returns (adopted, linked, reclaimed_bytes).
+    """
+    directory = directory or config.output_directory
+    state_root = os.path.abspath(config.state_path())
+    adopted = linked = reclaimed = 0
+
+    for dirpath, dirnames, filenames in os.walk(directory):
+        if os.path.abspath(dirpath).startswith(state_root):
+            dirnames[:] = []
+            continue
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1].lstrip(".").lower()
+            track_id = track_id_from_filename(name)
+            path = os.path.join(dirpath, name)
+            if ext not in _IMPORT_QUALITY or not track_id or os.path.islink(path):
+                continue
+
+            obj_path = object_path(track_id, _IMPORT_QUALITY[ext], ext)
+            if not os.path.exists(obj_path):
+                os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                if _same_device(path, obj_path):
+                    os.link(path, obj_path)
+                else:
+                    shutil.copy2(path, obj_path)
+                adopted += 1
+            elif not _is_view_of(path, obj_path):
+                size = os.path.getsize(path)
+                os.remove(path)
+                link_view(obj_path, path)
+                linked += 1
+                reclaimed += size
+
+            index, artist, title, _ = parse_track_filename(name)
+            meta = {"artist": artist or "unknown", "title": title or "untitled"}
+            record_view(obj_path, track_id, meta, dirpath, index)
+
+    return adopted, linked, reclaimed
+
+
+def _same_device(path: str, obj_path: str) -> bool:
+    try:
+        return os.stat(path).st_dev == os.stat(os.path.dirname(obj_path)).st_dev
+    except OSError:
+        return False
+
+
+def stats():
+    """Return (objects, unique_bytes, views)."""
+    objects = size = views = 0
+    for obj_path in _iter_objects():
+        objects += 1
+        size += os.path.getsize(obj_path)
+        views += len(_load_sidecar(obj_path).get("views", []))
+    return objects, size, views
@@ -1,13 +1,16 @@
 import subprocess  
+import sys  
 import time  
-import tempfile  
-import os  
-import socket  
-import json  
 import threading  
+import localfiles  
+import metacache  
 from api import get  
+from audiocache import AudioCache, CacheProxy, export_track  
 from config import config  
-from utils import require_login  
+from models import Album, Track, parse_tracks  
+from mpvipc import MpvController, MpvError  
+from search import get_track_metadata_by_id  
+from utils import load_json, require_login  
   
 def get_stream_url(track_id: str, quality: str = None) -> str:  
     if not require_login(config):  
@@ -30,8 +33,18 @@ def _print_metadata(track):
     print(f"   Year  : {track.get('releaseDate', '')[:4]}")  
     print(f"   Genre : {track.get('genre', '—')}\n")  
   
+def _mpv_buffer_args():  
+    """mpv options that open the next playlist entry early and read well ahead of playback."""  
+    return [  
+        "--prefetch-playlist=yes",  
+        "--gapless-audio=weak",  
+        "--cache=yes",  
+        f"--demuxer-max-bytes={int(config.prefetch_buffer_mb)}MiB",  
+        "--demuxer-readahead-secs=60",  
+    ]  
+  
 def _launch_mpv(stream_url: str, title: str = None):  
-    cmd = ["mpv", "--no-video", "--force-window=no", "--audio-display=no"]  
+    cmd = ["mpv", "--no-video", "--force-window=no", "--audio-display=no"] + _mpv_buffer_args()  
     if title:  
         cmd.append(f"--term-playing-msg=Now Playing: {title}")  
     cmd.append(stream_url)  
@@ -43,26 +56,35 @@ def _launch_mpv(stream_url: str, title: str = None):
     except Exception as e:  
         print(f"Playback error: {e}")  
   
-def play_single(track_id: str, quality: str = None):  
-    if not require_login(config):  
-        return  
-  
-    stream_url = get_stream_url(track_id, quality)  
-    if not stream_url:  
-        return  
-    print("Now Playing: Track ID", track_id)  
-    _launch_mpv(stream_url, title=f"Track ID {track_id}")  
-  
-def play_queue(track_ids: list, quality: str = None):  
-    if not require_login(config):  
-        return  
+def _start_cache_proxy(tracks, mode: str = "stream"):  
+    """  
+    Start the local read-through cache proxy, or return None when it is disabled.  
+    In download mode every fully cached track is also exported, named and tagged,  
+    to the output directory, so playback and download share one fetch.  
+    """  
+    if not config.stream_cache and mode != "download":  
+        return None  
   
-    for idx, track_id in enumerate(track_ids):  
-        print(f"\nTrack {idx + 1} of {len(track_ids)} — ID: {track_id}")  
-        play_single(track_id, quality=quality)  
-        time.sleep(1)  
+    by_id = {str(t["id"]): t for t in tracks}  
+    export_lock = threading.Lock()  
   
-def get_library_tracks(library_id: str):  
+    def on_ready(track_id, quality, path):  
+        if mode != "download":  
+            return  
+        track = by_id.get(str(track_id)) or {"id": track_id}  
+        if "albumTitle" not in track:  # queue entries only carry placeholders  
+            track = get_track_metadata_by_id(track_id) or track  
+        with export_lock:  
+            dest = export_track(track, path, quality)  
+        print(f"\n[Download] Saved: {dest}")  
+  
+    return CacheProxy(get_stream_url, on_ready=on_ready).start()  
+  
+def get_library_tracks(library_id: str, offline: bool = False):  
+    if offline:  
+        # Only what the last `library --sync` saw is known without the API  
+        snapshot = load_json(config.state_path("sync", "libraries", f"{library_id}.json"), {}) or {}  
+        return parse_tracks(snapshot.get("tracks"))  
     if not require_login(config):  
         return []  
   
@@ -70,7 +92,7 @@ def get_library_tracks(library_id: str):
     if not result or "library" not in result:  
         print("Could not load library.")  
         return []  
-    return result["library"].get("tracks", [])  
+    return parse_tracks(result["library"].get("tracks"))  
   
 def get_album_track_ids(album_id: str):  
     if not require_login(config):  
@@ -82,178 +104,222 @@ def get_album_track_ids(album_id: str):
     album = result.get("album", result)  
     return [t["id"] for t in album.get("tracks", [])]  
   
-def play_queue_with_metadata(tracks: list, quality: str = None):  
-    if not require_login(config):  
-        return  
-  
-    for idx, track in enumerate(tracks):  
-        print(f"\nTrack {idx + 1} of {len(tracks)} — ID: {track['id']}")  
-        stream_url = get_stream_url(track["id"], quality)  
-        if not stream_url:  
-            continue  
-        _print_metadata(track)  
-        _launch_mpv(stream_url, title=track.get("title", None))  
-        time.sleep(1)  
+def _album_for_playback(album_id: str, offline: bool = False):  
+    if offline:  
+        return metacache.cached_album(album_id)  
+    result = get("/album", params={"albumId": album_id})  
+    if not result or "album" not in result:  
+        return None  
+    album = Album.from_api(result["album"])  
+    metacache.remember_album(album)  # so it can be played offline later  
+    return album  
   
 def stream_cli_entry(args):  
+    mode = getattr(args, "mode", "stream")  
+    offline = getattr(args, "offline", False)  
     if getattr(args, "track_id", None):  
-        play_single(args.track_id, quality=args.quality)  
+        proxy = None if offline else _start_cache_proxy([Track(id=args.track_id)], mode)  
+        play_single(args.track_id, quality=args.quality, proxy=proxy, offline=offline)  
+        if proxy:  
+            proxy.stop()  
   
     elif getattr(args, "album_id", None):  
         # Fetch album metadata including track list  
-        result = get("/album", params={"albumId": args.album_id})  
-        if not result or "album" not in result:  
-            print("Album has no tracks or failed to load.")  
+        album = _album_for_playback(args.album_id, offline)  
+        if not album:  
+            print("Album is not cached for offline play." if offline else "Album has no tracks or failed to load.")  
             return  
-        full_tracks = result["album"].get("tracks", [])  
+        full_tracks = album.get("tracks", [])  
+        for t in full_tracks:  
+            t.setdefault("albumTitle", album.get("title", ""))  
+            t.setdefault("albumCover", album.get("cover"))  
+            t.setdefault("genre", album.get("genre", ""))  
+            t.setdefault("releaseDate", album.get("releaseDate", ""))  
         if not full_tracks:  
             print("Album has no tracks or failed to load.")  
             return  
-        play_ipc_queue(full_tracks, quality=args.quality)  
+        _play_with_cache(full_tracks, args.quality, mode, offline)  
   
     elif getattr(args, "queue", None):  
-        full_tracks = [{"id": tid, "title": f"Track {i+1}", "artist": "Unknown"}  
+        full_tracks = [Track(id=tid, title=f"Track {i+1}", artist="Unknown")  
                        for i, tid in enumerate(args.queue)]  
-        play_ipc_queue(full_tracks, quality=args.quality)  
+        _play_with_cache(full_tracks, args.quality, mode, offline)  
   
     elif getattr(args, "library_id", None):  
-        tracks = get_library_tracks(args.library_id)  
+        tracks = get_library_tracks(args.library_id, offline)  
         if not tracks:  
             print("Library has no tracks or failed to load.")  
             return  
-        play_ipc_queue(tracks, quality=args.quality)  
-  
-def play_ipc_queue(tracks, quality=None):  
-    import itertools, sys, time  
-  
-    print("\n============ DAB CLI Player ============")  
-    print("Loading playlist...", end="", flush=True)  
-  
-    spinner_running = True  
-    def spinner():  
-        for frame in itertools.cycle([".", "..", "...", " ..", "  .", "   "]):  
-            if not spinner_running:  
-                break  
-            print(f"\rLoading playlist{frame}", end="", flush=True)  
-            time.sleep(0.4)  
-  
-    spin_t = threading.Thread(target=spinner)  
-    spin_t.start()  
-  
-    urls = []  
-    for t in tracks:  
-        url = get_stream_url(t['id'], quality=quality)  
-        if url:  
-            urls.append(url)  
-  
-    spinner_running = False  
-    spin_t.join()  
-  
-    if not urls:  
-        print("\rNo playable stream URLs.")  
-        return  
-  
-    print("\rLoading playlist... Done.     ")  
-    print("=========================================")  
+        _play_with_cache(tracks, args.quality, mode, offline)  
   
-    sock_path = os.path.join(tempfile.gettempdir(), "dab_mpv.sock")  
+def _play_with_cache(tracks, quality, mode, offline=False):  
+    proxy = None if offline else _start_cache_proxy(tracks, mode)  
     try:  
-        os.remove(sock_path)  
-    except FileNotFoundError:  
-        pass  
-  
-    cmd = [  
-        "mpv",  
-        "--no-video",  
-        "--force-window=no",  
-        "--audio-display=no",  
-        "--msg-level=all=no",  
-        "--term-playing-msg=",  
-        f"--input-ipc-server={sock_path}"  
-    ] + urls  
-  
-    print("\n[SPACE]=Play/Pause | > Next | < Prev | q Quit")  
-  
-    # State for timer  
-    state = {"elapsed": 0, "paused": False, "started": False}  
-  
-    # IPC listener thread  
-    def ipc_listener():  
-        # Connect socket  
-        time.sleep(0.4)  
-        attempts = 0  
-        while attempts < 10:  
-            try:  
-                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  
-                s.connect(sock_path)  
-                break  
-            except FileNotFoundError:  
-                attempts += 1  
-                time.sleep(0.3)  
+        play_ipc_queue(tracks, quality=quality, proxy=proxy, offline=offline)  
+    finally:  
+        if proxy:  
+            proxy.stop()  
+  
+class Player:  
+    """  
+    One long-lived mpv instance for a whole play session.  
+    Tracks are appended with `loadfile <url> append-play`, so there is no per-track  
+    process spawn or delay; now-playing output comes from mpv property changes.  
+    Downloaded tracks are played from disk; offline, nothing else is fetched.  
+    """  
+  
+    def __init__(self, quality: str = None, proxy: CacheProxy = None, show_metadata: bool = False,  
+                 offline: bool = False):  
+        self.quality = quality or config.stream_quality  
+        self.proxy = proxy  
+        self.show_metadata = show_metadata  
+        self.offline = offline  
+        self.local_ids = set()  
+        self.tracks = []  
+        self._enqueue_done = False  
+        self._pos = None  
+        self._second = None  
+        self._paused = False  
+        self.mpv = MpvController([  
+            "--no-video",  
+            "--force-window=no",  
+            "--audio-display=no",  
+            "--msg-level=all=no",  
+            "--term-playing-msg=",  
+            "--idle=yes",  
+        ] + _mpv_buffer_args())  
+  
+    def start(self):  
+        self.mpv.start()  
+        self.mpv.observe("playlist-pos", self._on_playlist_pos)  
+        self.mpv.observe("playback-time", self._on_playback_time)  
+        self.mpv.observe("pause", self._on_pause)  
+        self.mpv.observe("idle-active", self._on_idle)  
+        return self  
+  
+    def stream_url(self, track):  
+        if config.play_local_first or self.offline:  
+            local = localfiles.find(track["id"])  
+            if local:  
+                self.local_ids.add(str(track["id"]))  
+                return local  
+        if self.offline:  
+            cached = AudioCache().lookup(track["id"], self.quality) if config.stream_cache else None  
+            if not cached:  
+                print(f"[Offline] Not downloaded, skipping: {track.get('artist', '—')} — {track.get('title', track['id'])}")  
+            return cached  
+        # The proxy resolves stream URLs lazily, when mpv actually opens each entry  
+        if self.proxy:  
+            return self.proxy.url_for(track["id"], self.quality)  
+        return get_stream_url(track["id"], quality=self.quality)  
+  
+    def enqueue(self, track) -> bool:  
+        url = self.stream_url(track)  
+        if not url:  
+            return False  
+        self.tracks.append(track)  
+        self.mpv.command("loadfile", url, "append-play")  
+        if self._pos is not None and len(self.tracks) - 1 - self._pos <= int(config.prefetch_tracks):  
+            self._prefetch(track)  
+        return True  
+  
+    def _prefetch(self, track):  
+        # Warm the disk cache for upcoming entries while the current one plays  
+        if self.proxy and str(track["id"]) not in self.local_ids:  
+            self.proxy.prefetch(track["id"], self.quality)  
+  
+    def finish_enqueue(self):  
+        """No more tracks will be added: quit as soon as mpv runs out of playlist."""  
+        self._enqueue_done = True  
+        try:  
+            if self.mpv.get_property("idle-active"):  
+                self.mpv.quit()  
+        except MpvError:  
+            pass  
+  
+    def wait(self):  
+        self.mpv.wait()  
+        print()  
+  
+    # --- mpv events (reader thread) ---  
+    def _on_playlist_pos(self, idx):  
+        if not isinstance(idx, int) or not 0 <= idx < len(self.tracks):  
+            return  
+        t = self.tracks[idx]  
+        self._pos = idx  
+        self._second = None  
+        if self.show_metadata:  
+            _print_metadata(t)  
         else:  
+            print(f"\nNow Playing: {t.get('artist', '—')} — {t.get('title', '—')}")  
+        for nxt in self.tracks[idx + 1: idx + 1 + int(config.prefetch_tracks)]:  
+            self._prefetch(nxt)  
+  
+    def _on_playback_time(self, value):  
+        if value is None or self._paused:  
             return  
+        second = int(value)  
+        if second != self._second:  
+            self._second = second  
+            sys.stdout.write("\r[" + time.strftime("%H:%M:%S", time.gmtime(second)) + "]")  
+            sys.stdout.flush()  
+  
+    def _on_pause(self, value):  
+        self._paused = bool(value)  
+        if self._paused:  
+            sys.stdout.write("\r(Paused)  ")  
+            sys.stdout.flush()  
+  
+    def _on_idle(self, idle):  
+        if idle and self._enqueue_done:  
+            self.mpv.quit()  
+  
+def _play_tracks(tracks, quality: str = None, proxy: CacheProxy = None, show_metadata: bool = False,  
+                 offline: bool = False):  
+    if not offline and not require_login(config):  
+        return  
   
-        # Subscribe to playlist-pos, playback-time, pause  
-        s.send(b'{"command": ["observe_property", 1, "playlist-pos"]}\n')  
-        s.send(b'{"command": ["observe_property", 2, "playback-time"]}\n')  
-        s.send(b'{"command": ["observe_property", 3, "pause"]}\n')  
-  
-        # Timer thread inside IPC, started when playback begins  
-        def timer_loop():  
-            while True:  
-                if state["started"]:  
-                    if state["paused"]:  
-                        out = "(Paused)"  
-                    else:  
-                        # format HH:MM:SS from elapsed  
-                        out = "[" + time.strftime("%H:%M:%S", time.gmtime(state["elapsed"])) + "]"  
-                    sys.stdout.write("\r" + out)  
-                    sys.stdout.flush()  
-                time.sleep(1)  
-  
-        threading.Thread(target=timer_loop, daemon=True).start()  
-  
-        while True:  
-            data = s.recv(4096)  
-            if not data:  
-                break  
-            for raw in data.splitlines():  
-                try:  
-                    msg = json.loads(raw.decode())  
-                except Exception:  
-                    continue  
-  
-                # Track change event  
-                if msg.get("event") == "property-change" and msg.get("name") == "playlist-pos":  
-                    idx = msg.get("data", 0)  
-                    if isinstance(idx, int) and idx < len(tracks):  
-                        t = tracks[idx]  
-                        state["elapsed"] = 0  
-                        state["started"] = True  
-                        print(f"\nNow Playing: {t.get('artist', '—')} — {t.get('title', '—')}")  
-  
-                # Playback time update  
-                elif msg.get("event") == "property-change" and msg.get("name") == "playback-time":  
-                    state["elapsed"] = int(msg.get("data", 0))  
-  
-                # Pause state change  
-                elif msg.get("event") == "property-change" and msg.get("name") == "pause":  
-                    state["paused"] = bool(msg.get("data", False))  
-  
-    threading.Thread(target=ipc_listener, daemon=True).start()  
+    player = Player(quality, proxy, show_metadata, offline)  
+    if not player.mpv.supported:  
+        # No Unix sockets (Windows): one plain mpv run per track  
+        for t in tracks:  
+            url = player.stream_url(t)  
+            if url:  
+                _launch_mpv(url, title=t.get("title"))  
+        return  
   
+    print("\n============ DAB CLI Player ============")  
     try:  
-        subprocess.run(cmd)  
-    except Exception as e:  
+        player.start()  
+    except MpvError as e:  
         print("mpv error:", e)  
+        return  
+    print("[SPACE]=Play/Pause | > Next | < Prev | q Quit")  
   
+    # The first track starts playing as soon as it is appended; the rest follow  
     try:  
-        os.remove(sock_path)  
-    except Exception:  
-        pass  
+        for t in tracks:  
+            player.enqueue(t)  
+    except MpvError:  
+        pass  # mpv was closed while the queue was still being filled  
+    player.finish_enqueue()  
+  
+    if not player.tracks:  
+        print("No downloaded tracks to play offline." if offline else "No playable stream URLs.")  
+    player.wait()  
+    if player.local_ids:  
+        print(f"[Player] {len(player.local_ids)} of {len(player.tracks)} tracks played from local files")  
+  
+def play_single(track_id: str, quality: str = None, proxy: CacheProxy = None, offline: bool = False):  
+    _play_tracks([Track(id=track_id, title=f"Track ID {track_id}", artist="—")], quality, proxy, offline=offline)  
+  
+def play_queue(track_ids: list, quality: str = None, proxy: CacheProxy = None):  
+    tracks = [Track(id=tid, title=f"Track {i + 1}", artist="Unknown") for i, tid in enumerate(track_ids)]  
+    _play_tracks(tracks, quality, proxy)  
+  
+def play_queue_with_metadata(tracks: list, quality: str = None, proxy: CacheProxy = None):  
+    _play_tracks(tracks, quality, proxy, show_metadata=True)  
+  
+def play_ipc_queue(tracks, quality=None, proxy: CacheProxy = None, offline: bool = False):  
+    _play_tracks(tracks, quality, proxy, offline=offline)  
   
-    # Cleanup  
-    try:  
-        os.remove(sock_path)  
-    except Exception:  
-        pass
\ No newline at end of file
@@ -1,11 +1,37 @@
 # tagger.py
 
+import hashlib
 import os
+import time
 from mutagen.easyid3 import EasyID3
 from mutagen.flac import FLAC, Picture
 from mutagen.id3 import ID3, ID3NoHeaderError, APIC, USLT
+import events
+import governor
+import metrics
+import staging
+import store
 from config import config
 from api import get_lyrics
+from cover import embed_cover, image_size
+
+FRONT_COVER = 3
+
+# Writes vs. files that already carried the desired tags (reported at the end of a run)
+TAG_STATS = {"written": 0, "skipped": 0}
+
+
+def reset_tag_stats():
+    TAG_STATS["written"] = 0
+    TAG_STATS["skipped"] = 0
+
+
+def tag_stats_fields() -> dict:
+    """Tag counters as event fields (only when tagging is on)."""
+    if not config.use_metadata_tagging:
+        return {}
+    return {"tags_written": TAG_STATS["written"], "tags_unchanged": TAG_STATS["skipped"]}
+
 
 def save_lrc(file_path: str, lyrics: str):
     base, _ = os.path.splitext(file_path)
@@ -15,92 +41,186 @@ def save_lrc(file_path: str, lyrics: str):
     if config.debug:
         print(f"[tagger] Saved synced lyrics to {lrc_path}")
 
+
+def _read_cover(cover_path: str):
+    """(data, mime) of the size-capped artwork to embed, or (None, None)."""
+    if not cover_path or not os.path.exists(cover_path):
+        return None, None
+    return embed_cover(cover_path, config.cover_max_dimension, config.cover_max_bytes)
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _has_lyrics(file_path: str, existing_text) -> bool:
+    return bool(existing_text) or os.path.exists(os.path.splitext(file_path)[0] + ".lrc")
+
+
+def _tag_mp3(file_path: str, metadata: dict, cover: bytes, mime: str, fetch_lyrics) -> bool:
+    """Apply tags to an MP3 in a single ID3 write. Returns False if nothing changed."""
+    try:
+        id3 = ID3(file_path)
+    except ID3NoHeaderError:
+        id3 = ID3()
+
+    changed = False
+    for key, value in metadata.items():
+        if key not in EasyID3.valid_keys.keys():
+            continue
+        try:
+            current = EasyID3.Get[key](id3, key)
+        except KeyError:
+            current = []
+        # ID3 frames drop empty strings on read (e.g. TCON), so "" matches "not set"
+        if current != [value] and not (value == "" and current in ([], [""])):
+            EasyID3.Set[key](id3, key, [value])
+            changed = True
+
+    if cover is not None:
+        fronts = [f for f in id3.getall("APIC") if f.type == FRONT_COVER]
+        if len(fronts) != 1 or _digest(fronts[0].data) != _digest(cover):
+            # Replace the front cover instead of stacking another copy
+            for frame_key in [k for k, f in id3.items() if k.startswith("APIC") and f.type == FRONT_COVER]:
+                del id3[frame_key]
+            id3.add(APIC(
+                encoding=3,
+                mime=mime,
+                type=FRONT_COVER,
+                desc="Cover",
+                data=cover
+            ))
+            changed = True
+
+    if config.get_lyrics and not _has_lyrics(file_path, id3.getall("USLT")):
+        lyrics, unsynced = fetch_lyrics()
+        if lyrics:
+            if unsynced:
+                id3.add(USLT(
+                    encoding=3,
+                    lang="eng",
+                    desc="Lyrics",
+                    text=lyrics
+                ))
+                changed = True
+            else:
+                save_lrc(file_path, lyrics)
+
+    if changed:
+        id3.save(file_path)
+    return changed
+
+
+def _tag_flac(file_path: str, metadata: dict, cover: bytes, mime: str, fetch_lyrics) -> bool:
+    """Apply tags to a FLAC in a single write. Returns False if nothing changed."""
+    audio = FLAC(file_path)
+
+    changed = False
+    for key, value in metadata.items():
+        if audio.get(key) != [value]:
+            audio[key] = value
+            changed = True
+
+    if cover is not None:
+        fronts = [p for p in audio.pictures if p.type == FRONT_COVER]
+        if len(fronts) != 1 or _digest(fronts[0].data) != _digest(cover):
+            # Replace the front cover instead of stacking another copy
+            others = [p for p in audio.pictures if p.type != FRONT_COVER]
+            audio.clear_pictures()
+            for pic in others:
+                audio.add_picture(pic)
+            pic = Picture()
+            pic.type = FRONT_COVER
+            pic.mime = mime
+            pic.desc = "Cover"
+            pic.data = cover
+            size = image_size(cover, mime)
+            if size:
+                pic.width, pic.height = size
+                pic.depth = 24
+            audio.add_picture(pic)
+            changed = True
+
+    if config.get_lyrics and not _has_lyrics(file_path, audio.get("LYRICS")):
+        lyrics, unsynced = fetch_lyrics()
+        if lyrics:
+            if unsynced:
+                audio["LYRICS"] = lyrics
+                changed = True
+            else:
+                save_lrc(file_path, lyrics)
+
+    if changed:
+        audio.save()
+    return changed
+
+
 def tag_audio(file_path: str, metadata: dict, cover_path: str = None):
     """
     Tags metadata, cover art, and lyrics (auto-fetched) into MP3 or FLAC.
+    The file is only rewritten when its tags, front cover or lyrics differ from
+    what is wanted, so re-tagging (and tagging hardlinked copies) is cheap.
     Any other format is skipped.
     """
+    try:
+        # Bounded: at most tag_concurrency files and cover_memory_mb of artwork at once
+        with governor.TAGGING, governor.COVERS.hold(_cover_size(cover_path)):
+            started = time.monotonic()
+            try:
+                return _tag_audio(file_path, metadata, cover_path)
+            finally:
+                if config.use_metadata_tagging:
+                    metrics.TAG_SECONDS.observe(time.monotonic() - started)
+    finally:
+        # A download tagged on the scratch disk can now move to the output directory
+        staging.release(file_path)
+
+
+def _cover_size(cover_path: str) -> int:
+    try:
+        return os.path.getsize(cover_path) if cover_path else 0
+    except OSError:
+        return 0
+
+
+def _tag_audio(file_path: str, metadata: dict, cover_path: str = None):
     if not config.use_metadata_tagging or not os.path.exists(file_path):
         return False
+    if not store.may_tag(file_path):
+        # A hardlinked store view whose tags belong to another folder's view
+        TAG_STATS["skipped"] += 1
+        events.emit("tagged", scope="tag", path=file_path, changed=False, shared=True)
+        return True
 
     title  = metadata.get("title", "")
     artist = metadata.get("artist", "")
 
-    lyrics, unsynced = get_lyrics(title, artist) if config.get_lyrics else (None, None)
+    # Lyrics are only fetched when the file doesn't carry any yet
+    def fetch_lyrics():
+        return get_lyrics(title, artist)
 
     ext = os.path.splitext(file_path)[-1].lower()
 
     try:
+        cover, mime = _read_cover(cover_path)
+
         # MP3
         if ext == ".mp3":
-            try:
-                audio = EasyID3(file_path)
-            except ID3NoHeaderError:
-                audio = EasyID3()
-                audio.save(file_path)
-                audio = EasyID3(file_path)
-
-            for key, value in metadata.items():
-                if key in EasyID3.valid_keys.keys():
-                    audio[key] = value
-            audio.save()
-
-            id3 = ID3(file_path)
-
-            if cover_path and os.path.exists(cover_path):
-                with open(cover_path, "rb") as img:
-                    id3.add(APIC(
-                        encoding=3,
-                        mime="image/jpeg",
-                        type=3,
-                        desc="Cover",
-                        data=img.read()
-                    ))
-
-            if config.get_lyrics and lyrics:
-                if unsynced:
-                    id3.add(USLT(
-                        encoding=3,
-                        lang="eng",
-                        desc="Lyrics",
-                        text=lyrics
-                    ))
-                else:
-                    save_lrc(file_path, lyrics)
-
-            id3.save()
+            changed = _tag_mp3(file_path, metadata, cover, mime, fetch_lyrics)
 
         # FLAC
         elif ext == ".flac":
-            audio = FLAC(file_path)
-            for key, value in metadata.items():
-                audio[key] = value
-
-            if cover_path and os.path.exists(cover_path):
-                pic = Picture()
-                pic.type = 3
-                pic.mime = "image/jpeg"
-                pic.desc = "Cover"
-                with open(cover_path, "rb") as img:
-                    pic.data = img.read()
-                audio.add_picture(pic)
-
-            if config.get_lyrics and lyrics:
-                if unsynced:
-                    audio["LYRICS"] = lyrics
-                else:
-                    save_lrc(file_path, lyrics)
-
-            audio.save()
+            changed = _tag_flac(file_path, metadata, cover, mime, fetch_lyrics)
 
         else:
             if config.debug:
                 print(f"[tagger] Skipping tag: unsupported format {ext}")
             return False
 
+        TAG_STATS["written" if changed else "skipped"] += 1
+        events.emit("tagged", scope="tag", path=file_path, changed=changed)
         return True
 
     except Exception as e:
-        if config.debug:
-            print(f"[tagger] Tagging failed for {file_path}: {e}")
-        return False
\ No newline at end of file
+        events.emit("failed", scope="tag", path=file_path, error=str(e))
+        return False
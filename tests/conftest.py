@@ -0,0 +1,33 @@
+# tests/conftest.py
+import os
+import struct
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config import config  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def output_directory(tmp_path, monkeypatch):
+    """Every test gets its own output directory (and with it its own .dabcli state)."""
+    directory = tmp_path / "out"
+    directory.mkdir()
+    monkeypatch.setattr(config, "output_directory", str(directory))
+    monkeypatch.setattr(config, "show_progress", False)
+    return directory
+
+
+def make_flac(path, audio: bytes = b"\x00" * 4096) -> str:
+    """A minimal FLAC mutagen can tag: STREAMINFO (44.1 kHz stereo 16-bit) followed by audio bytes."""
+    samples = 44100
+    info = struct.pack(">HH", 4096, 4096) + b"\x00\x00\x00" * 2
+    info += ((44100 << 44) | (1 << 41) | (15 << 36) | samples).to_bytes(8, "big") + b"\x11" * 16
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info + audio)
+    return str(path)
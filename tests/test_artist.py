@@ -0,0 +1,114 @@
+# tests/test_artist.py
+import os
+
+import pytest
+
+import artist
+import metacache
+from config import config
+from utils import load_json
+
+PER_PAGE = 35
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    """A discography (newest first), the pages requested, and the albums downloaded."""
+    state = {"albums": [], "pages": [], "downloads": [], "fail": set()}
+
+    def fake_get(endpoint, params=None):
+        offset = params["offset"]
+        state["pages"].append(offset)
+        page = state["albums"][offset:offset + params["limit"]]
+        return {
+            "artist": {"id": params["artistId"], "name": "Band"},
+            "albums": [{"id": album_id, "title": f"Album {album_id}"} for album_id in page],
+            "pagnation": {"hasMore": offset + params["limit"] < len(state["albums"])},
+        }
+
+    def fake_download(album_id, cli_args=None, directory=None, discography_artist=None):
+        state["downloads"].append(album_id)
+        return album_id not in state["fail"]
+
+    monkeypatch.setattr(artist, "get", fake_get)
+    monkeypatch.setattr(artist, "download_album", fake_download)
+    return state
+
+
+def _sync(remote, albums):
+    remote.update(albums=albums, pages=[], downloads=[])
+    artist.sync_discography("ar1")
+    return remote["downloads"]
+
+
+def _ids(count: int, start: int = 0) -> list:
+    return [f"al{i:03d}" for i in range(start, start + count)]
+
+
+def test_get_discography_stops_at_first_known_album(remote):
+    remote["albums"] = _ids(100)
+    data = artist.get_discography("ar1", fetch_all=True, stop_at={"al040"})
+    assert [alb["id"] for alb in data["albums"]] == _ids(40)
+    assert remote["pages"] == [0, PER_PAGE]  # the third page is never fetched
+
+
+def test_sync_downloads_only_new_releases(remote):
+    assert _sync(remote, _ids(50)) == _ids(50)
+
+    newest_first = ["al900", "al901"] + _ids(50)
+    assert _sync(remote, newest_first) == ["al900", "al901"]
+    assert remote["pages"] == [0]
+
+    state = load_json(artist._sync_state_path("ar1"))
+    assert state["complete"] == sorted(newest_first)
+    assert state["incomplete"] == []
+
+
+def test_incomplete_albums_are_resumed_even_below_the_stop_point(remote):
+    remote["fail"] = {"al030"}
+    _sync(remote, _ids(40))
+    assert load_json(artist._sync_state_path("ar1"))["incomplete"] == ["al030"]
+
+    remote["fail"] = set()
+    assert _sync(remote, ["al999"] + _ids(40)) == ["al999", "al030"]
+    state = load_json(artist._sync_state_path("ar1"))
+    assert "al030" in state["complete"] and state["incomplete"] == []
+
+
+def _compilation(album_id: str) -> dict:
+    """Four tracks, only two of them with Band on them."""
+    tracks = [{"id": f"t{i}", "title": f"Song {i}", "artist": "Band" if i % 2 else "Other"} for i in range(1, 5)]
+    return {"id": album_id, "title": "Various Hits", "artist": "Various Artists", "releaseDate": "2020",
+            "trackCount": len(tracks), "tracks": tracks}
+
+
+def _album_folder(album: dict) -> str:
+    return os.path.join(config.output_directory, "discographies", "Band - ar1",
+                        f"2020 - Various Artists - Various Hits - {album['id']}")
+
+
+def test_compilation_with_all_selected_tracks_is_not_requeued(remote):
+    album = _compilation("al500")
+    metacache.remember_album(album)
+    folder = _album_folder(album)
+    os.makedirs(folder)
+    for idx, track in enumerate(album["tracks"], 1):
+        if track["artist"] == "Band":
+            open(os.path.join(folder, f"{idx:02d} - Band - {track['title']} - {track['id']}.flac"), "wb").close()
+
+    assert _sync(remote, ["al500"]) == []
+    state = load_json(artist._sync_state_path("ar1"))
+    assert state["complete"] == ["al500"]
+
+
+def test_album_on_disk_checks_the_selected_track_ids(output_directory):
+    album = _compilation("al501")
+    folder = _album_folder(album)
+    os.makedirs(folder)
+    open(os.path.join(folder, "01 - Band - Song 1 - t1.flac"), "wb").close()
+    directory = os.path.dirname(folder)
+
+    assert not artist._album_on_disk(directory, album)  # 1 of trackCount 4
+    assert not artist._album_on_disk(directory, album, ["t1", "t3"])
+    open(os.path.join(folder, "03 - Band - Song 3 - t3.flac"), "wb").close()
+    assert artist._album_on_disk(directory, album, ["t1", "t3"])
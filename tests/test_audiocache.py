@@ -0,0 +1,113 @@
+# tests/test_audiocache.py
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from audiocache import AudioCache, CacheProxy
+
+AUDIO = b"fLaC" + bytes(range(256)) * 1024
+
+
+class _SlowCDN(BaseHTTPRequestHandler):
+    """Sends AUDIO in a few pieces with pauses, so a fill is still running when the proxy stops."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/flac")
+        self.send_header("Content-Length", str(len(AUDIO)))
+        self.end_headers()
+        step = len(AUDIO) // 4
+        for start in range(0, len(AUDIO), step):
+            self.wfile.write(AUDIO[start:start + step])
+            self.wfile.flush()
+            time.sleep(0.3)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cdn():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowCDN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/audio.flac"
+    server.shutdown()
+    server.server_close()
+
+
+def test_stop_waits_for_fill_and_post_processing(tmp_path, cdn):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 * len(AUDIO))
+    exported = []
+
+    def on_ready(track_id, quality, path):
+        time.sleep(0.2)  # e.g. copying and tagging in --mode download
+        exported.append((track_id, path))
+
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache, on_ready=on_ready).start()
+    proxy.prefetch("1001", "27")
+    time.sleep(0.05)  # the fill is under way
+    proxy.stop()
+
+    path = cache.path_for("1001", "27")
+    assert exported == [("1001", path)]
+    with open(path, "rb") as f:
+        assert f.read() == AUDIO
+    leftovers = [name for _, _, names in os.walk(cache.directory) for name in names if ".part" in name]
+    assert leftovers == []
+
+
+def test_stop_gives_up_after_timeout(tmp_path, cdn, capsys):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 * len(AUDIO))
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache).start()
+    proxy.prefetch("1002", "27")
+    time.sleep(0.05)
+    started = time.monotonic()
+    proxy.stop(timeout=0.1)
+    assert time.monotonic() - started < 1.0  # shutdown() itself polls every 0.5s; the fill needs 1.2s
+    assert "Gave up waiting" in capsys.readouterr().out
+
+
+def test_committed_file_is_not_evicted_while_post_processing(tmp_path, cdn):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=len(AUDIO) - 1)  # nothing fits
+    seen = []
+
+    def on_ready(track_id, quality, path):
+        cache.evict()  # e.g. another fill committing meanwhile
+        seen.append(os.path.exists(path))
+
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache, on_ready=on_ready).start()
+    proxy.prefetch("1003", "27")
+    proxy.stop()
+
+    assert seen == [True]
+    cache.evict()  # unpinned once post-processing is done
+    assert not os.path.exists(cache.path_for("1003", "27"))
+
+
+def test_seek_into_uncached_track_still_fills_the_cache(tmp_path, cdn):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 * len(AUDIO))
+    exported = []
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache,
+                       on_ready=lambda track_id, quality, path: exported.append(track_id)).start()
+
+    r = requests.get(proxy.url_for("1004", "27"), headers={"Range": "bytes=4096-"}, timeout=10)
+    assert r.ok
+    proxy.stop()
+
+    assert exported == ["1004"]
+    with open(cache.path_for("1004", "27"), "rb") as f:
+        assert f.read() == AUDIO
+
+
+def test_finished_prefetches_are_forgotten(tmp_path, cdn):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 * len(AUDIO))
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache).start()
+    for track_id in ("1005", "1006", "1007"):
+        proxy.prefetch(track_id, "27")
+        proxy._prefetches[-1].join(10)
+    assert len(proxy._prefetches) == 1
+    proxy.stop()
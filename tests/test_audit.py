@@ -0,0 +1,70 @@
+# tests/test_audit.py
+import os
+
+import pytest
+from mutagen.flac import FLAC
+
+import audit
+import downloader
+import metacache
+import search
+import tagger
+from config import config
+from conftest import make_flac
+
+ALBUM = {
+    "id": "al9", "title": "Album", "artist": "Band", "genre": "Rock", "releaseDate": "2020-01-01",
+    "cover": "https://example.invalid/cover.jpg",
+    "tracks": [{"id": "t1", "title": "Song", "artist": "Band feat. Guest"}],
+}
+REL = os.path.join("albums", "2020 - Band - Album - al9", "01 - Band feat. Guest - Song - t1.flac")
+
+
+@pytest.fixture
+def broken(output_directory, monkeypatch):
+    """A PHANTOM DATA stub queued for repair, with its album metadata and kept cover at hand."""
+    path = os.path.join(str(output_directory), REL)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"PHANTOM DATA")
+    with open(os.path.join(os.path.dirname(path), "cover.jpg"), "wb") as f:
+        f.write(b"\xff\xd8\xff\xe0" + bytes(64) + b"\xff\xd9")
+    metacache.remember_album(ALBUM)
+    audit.queue_repairs({"files": {REL: {"track_id": "t1", "issues": ["phantom"]}}})
+    monkeypatch.setattr(config, "get_lyrics", False)
+    monkeypatch.setattr(search, "get_track_metadata_by_id", lambda track_id: {"id": track_id, "title": "Song"})
+    monkeypatch.setattr(tagger, "get_lyrics", lambda title, artist: None)
+    return path
+
+
+def test_failed_repair_keeps_the_original(broken, monkeypatch):
+    monkeypatch.setattr(downloader, "download_track", lambda **kwargs: None)
+    audit.run_repairs()
+
+    with open(broken, "rb") as f:
+        assert f.read() == b"PHANTOM DATA"
+    assert not os.path.exists(audit._backup_path(broken))
+    assert [item["path"] for item in audit.load_json(audit._repair_queue_path())] == [REL]
+
+
+def test_repaired_track_is_tagged_from_its_album(broken, monkeypatch):
+    def fake_download(track_id, directory, index, track_meta):
+        assert not os.path.exists(broken)  # out of the way while downloading...
+        assert os.path.exists(audit._backup_path(broken))  # ...but not gone
+        return make_flac(os.path.join(directory, "01 - Band feat. Guest - Song - t1.flac"))
+
+    monkeypatch.setattr(downloader, "download_track", fake_download)
+    audit.run_repairs()
+
+    tags = FLAC(broken)
+    assert tags["album"] == ["Album"] and tags["albumArtist"] == ["Band"] and tags["date"] == ["2020"]
+    assert len(tags.pictures) == 1
+    assert not os.path.exists(audit._backup_path(broken))
+    assert audit.load_json(audit._repair_queue_path()) == []
+
+
+def test_interrupted_repair_is_restored_on_the_next_run(broken, monkeypatch):
+    os.replace(broken, audit._backup_path(broken))
+    monkeypatch.setattr(downloader, "download_track", lambda **kwargs: None)
+    audit.run_repairs()
+    assert os.path.exists(broken) and not os.path.exists(audit._backup_path(broken))
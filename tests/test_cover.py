@@ -0,0 +1,40 @@
+# tests/test_cover.py
+import hashlib
+import os
+
+import pytest
+
+import cover
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(64) + b"\xff\xd9"
+
+
+def _cover(directory, data: bytes = JPEG) -> str:
+    path = os.path.join(str(directory), "cover.jpg")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_variant_is_worked_out_once_per_cover(output_directory, monkeypatch):
+    hashed = []
+    sha1 = hashlib.sha1
+    monkeypatch.setattr(cover.hashlib, "sha1", lambda data: hashed.append(len(data)) or sha1(data))
+    path = _cover(output_directory)
+
+    for _ in range(12):  # one album's tracks
+        assert cover.embed_cover(path, 1200, 512000) == (JPEG, "image/jpeg")
+    assert len(hashed) == 1
+
+    _cover(output_directory, JPEG + b"\x00")  # replaced on disk: worked out again
+    assert cover.embed_cover(path, 1200, 512000)[0] == JPEG + b"\x00"
+    assert len(hashed) == 2
+
+
+def test_undecodable_cover_is_embedded_unchanged(output_directory, capsys):
+    pytest.importorskip("PIL")
+    broken = b"\xff\xd8\xff\xe0" + os.urandom(4096)  # a JPEG signature, then garbage
+    path = _cover(output_directory, broken)
+
+    assert cover.embed_cover(path, 1200, 1024) == (broken, "image/jpeg")
+    assert "Could not decode the cover" in capsys.readouterr().out
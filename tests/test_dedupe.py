@@ -0,0 +1,122 @@
+# tests/test_dedupe.py
+import json
+import os
+import shutil
+
+import pytest
+
+import dedupe
+from config import config
+
+
+def _id3(text: bytes) -> bytes:
+    """A minimal ID3v2.3 tag with one TIT2 frame."""
+    frame = b"TIT2" + (len(text) + 1).to_bytes(4, "big") + b"\x00\x00" + b"\x00" + text
+    size = len(frame)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + frame
+
+
+def _mp3(directory, name: str, audio: bytes, title: bytes = b"Song") -> str:
+    path = os.path.join(str(directory), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(_id3(title) + audio)
+    return path
+
+
+AUDIO_A = b"\xff\xfb\x90\x00" + bytes(range(256)) * 64
+AUDIO_B = b"\xff\xfb\x90\x00" + bytes(reversed(range(256))) * 64
+
+
+def _shard_lines() -> list:
+    folder = config.state_path("dedupe")
+    lines = []
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            lines.extend(json.loads(line) for line in f)
+    return lines
+
+
+def test_payload_key_ignores_tags(output_directory):
+    original = _mp3(output_directory, "a.mp3", AUDIO_A, b"Original")
+    compilation = _mp3(output_directory, "b.mp3", AUDIO_A, b"Best Of")
+    other = _mp3(output_directory, "c.mp3", AUDIO_B)
+
+    assert dedupe.payload_key(original) == dedupe.payload_key(compilation)
+    assert dedupe.payload_key(original)[1] == len(AUDIO_A)
+    assert dedupe.payload_key(original) != dedupe.payload_key(other)
+
+
+def test_record_appends_to_one_shard(output_directory):
+    first = _mp3(output_directory, "Album/01.mp3", AUDIO_A)
+    second = _mp3(output_directory, "Album/02.mp3", AUDIO_B)
+    key_a, _ = dedupe.record(first)
+    key_b, _ = dedupe.record(second)
+    dedupe.record(first)  # re-recorded (e.g. downloaded again): one more line, same shard
+
+    with open(dedupe._shard_path(key_a), encoding="utf-8") as f:
+        assert [json.loads(line)["path"] for line in f if key_a in line] == [os.path.join("Album", "01.mp3")] * 2
+    assert dedupe._load_index()[os.path.join("Album", "02.mp3")]["key"] == key_b
+    assert not os.path.exists(dedupe._legacy_index_path())
+
+
+def test_check_new_finds_same_audio_under_another_name(output_directory, monkeypatch):
+    monkeypatch.setattr(dedupe, "_reflink", lambda src, dst: shutil.copyfile(src, dst) and True)
+    original = _mp3(output_directory, "Album/01.mp3", AUDIO_A, b"Original")
+    dedupe.record(original)
+    dedupe.record(_mp3(output_directory, "Other/01.mp3", AUDIO_B))
+
+    new = _mp3(output_directory, "Compilation/07.mp3", AUDIO_A, b"Best Of")
+    assert dedupe.check_new(new) == original
+    assert dedupe.payload_key(new) == dedupe.payload_key(original)
+
+    unrelated = _mp3(output_directory, "Compilation/08.mp3", AUDIO_B + b"\x00", b"New")
+    assert dedupe.check_new(unrelated) is None
+
+
+@pytest.mark.skipif(not hasattr(os, "link"), reason="needs hard links")
+def test_dedupe_collection_links_copies_and_compacts(output_directory):
+    first = _mp3(output_directory, "Album/01.mp3", AUDIO_A)
+    copy = os.path.join(str(output_directory), "Reissue", "01.mp3")
+    os.makedirs(os.path.dirname(copy))
+    shutil.copyfile(first, copy)
+    _mp3(output_directory, "Album/02.mp3", AUDIO_B)
+    dedupe.record(first)
+    dedupe.record(first)
+
+    reclaimed = dedupe.dedupe_collection(workers=1)
+
+    assert reclaimed == os.path.getsize(first)
+    assert os.path.samefile(first, copy)
+    paths = [entry["path"] for entry in _shard_lines()]
+    assert sorted(paths) == sorted([os.path.join("Album", "01.mp3"), os.path.join("Album", "02.mp3"),
+                                    os.path.join("Reissue", "01.mp3")])
+
+
+def test_dedupe_collection_migrates_legacy_index(output_directory, capsys):
+    path = _mp3(output_directory, "Album/01.mp3", AUDIO_A)
+    st = os.stat(path)
+    legacy = {"files": {os.path.join("Album", "01.mp3"): {
+        "size": st.st_size, "mtime": int(st.st_mtime), "key": "mp3:known", "payload": len(AUDIO_A)}}}
+    os.makedirs(config.state_path(), exist_ok=True)
+    with open(dedupe._legacy_index_path(), "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    dedupe.dedupe_collection(workers=1)
+
+    assert "1 audio files, 0 to hash" in capsys.readouterr().out
+    assert not os.path.exists(dedupe._legacy_index_path())
+    assert dedupe._load_index()[os.path.join("Album", "01.mp3")]["key"] == "mp3:known"
+
+
+def test_check_new_skips_originals_changed_since_indexing(output_directory, monkeypatch):
+    monkeypatch.setattr(dedupe, "_reflink", lambda src, dst: shutil.copyfile(src, dst) and True)
+    original = _mp3(output_directory, "Album/01.mp3", AUDIO_A)
+    dedupe.record(original)
+    _mp3(output_directory, "Album/01.mp3", AUDIO_B)  # replaced in place after it was indexed
+    os.utime(original, (1, 1))
+
+    new = _mp3(output_directory, "Compilation/07.mp3", AUDIO_A, b"Best Of")
+    assert dedupe.check_new(new) is None
+    assert dedupe.payload_key(new) != dedupe.payload_key(original)
@@ -0,0 +1,77 @@
+# tests/test_events.py
+import json
+import sys
+
+import pytest
+
+import events
+from models import Track
+
+
+@pytest.fixture
+def jsonl(capsys, monkeypatch):
+    """--events jsonl for one test: call it first thing in the test; returns capsys."""
+    monkeypatch.setattr(events, "_sinks", list(events._sinks))
+    monkeypatch.setattr(events, "_mode", "human")
+
+    def configure():
+        monkeypatch.setattr(sys, "stdout", sys.stdout)  # configure() points it at stderr
+        events.configure("jsonl")
+        return capsys
+
+    return configure
+
+
+def _records(capsys) -> list:
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_jsonl_writes_one_object_per_event(jsonl):
+    captured = jsonl()
+    events.emit("started", scope="album", album_id="al1", title="Album", tracks=2)
+    events.emit("completed", track_id="7", path="/music/07 - Song.flac")
+
+    records = _records(captured)
+    assert [(r["event"], r["scope"]) for r in records] == [("started", "album"), ("completed", "track")]
+    assert records[0]["tracks"] == 2 and records[1]["path"] == "/music/07 - Song.flac"
+    assert all(isinstance(r["ts"], float) for r in records)
+    assert events.headless()
+
+
+def test_jsonl_moves_stray_output_off_stdout(jsonl):
+    captured = jsonl()
+    print("[Downloader] not an event")
+    events.emit("failed", reason="stopped", track_id="7")
+    out, err = captured.readouterr()
+    assert [json.loads(line)["event"] for line in out.splitlines()] == ["failed"]
+    assert "not an event" in err
+
+
+def test_jsonl_serialises_records(jsonl):
+    captured = jsonl()
+    track = Track.from_api({"id": 7, "title": "Song", "artist": "Band"})
+    events.emit("queued", track=track, position=1, count=1)
+    assert _records(captured)[0]["track"]["title"] == "Song"
+
+
+def test_configure_keeps_subscribers(jsonl):
+    captured = jsonl()
+    seen = []
+    events.subscribe(seen.append)
+    events.configure("human")
+    events.emit("tagged", scope="tag", path="a.flac", changed=True)
+    assert [r["event"] for r in seen] == ["tagged"]
+    assert events._HUMAN in events._sinks and not events.headless()
+    assert _records(captured) == []
+
+
+def test_progress_emits_deltas(jsonl, monkeypatch):
+    captured = jsonl()
+    monkeypatch.setattr(events, "PROGRESS_INTERVAL", 0)
+    progress = events.Progress("7", total=300, connections=2)
+    progress.add(100)
+    progress.add(200)
+    progress.flush()  # nothing new since the last event
+    records = _records(captured)
+    assert [(r["bytes"], r["delta"]) for r in records] == [(100, 100), (300, 200)]
+    assert records[-1]["total_bytes"] == 300 and records[-1]["connections"] == 2
@@ -0,0 +1,122 @@
+# tests/test_governor.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import audiocache
+import dabcli
+import downloader
+import governor
+import library
+from audiocache import AudioCache, CacheProxy
+from governor import ByteBudget
+
+AUDIO = bytes(range(256)) * 1024
+
+
+class _SlowCDN(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(AUDIO)))
+        self.end_headers()
+        half = len(AUDIO) // 2
+        self.wfile.write(AUDIO[:half])
+        self.wfile.flush()
+        time.sleep(0.2)
+        self.wfile.write(AUDIO[half:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cdn():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowCDN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/audio.flac"
+    server.shutdown()
+    server.server_close()
+
+
+def _room_for_one(monkeypatch, chunk_size: int) -> ByteBudget:
+    budget = ByteBudget("network", governor.stream_buffer(chunk_size))
+    monkeypatch.setattr(governor, "NETWORK", budget)
+    return budget
+
+
+def test_budget_blocks_until_released():
+    budget = ByteBudget("test", 100)
+    budget.acquire(60)
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: budget.acquire(60) or acquired.set(), daemon=True)
+    waiter.start()
+
+    assert not acquired.wait(0.2)
+    budget.release(60)
+    assert acquired.wait(5)
+    assert budget.waits == 1 and budget.peak == 60
+
+
+def test_oversized_request_passes_when_nothing_is_held():
+    budget = ByteBudget("test", 100)
+    with budget.hold(500):
+        assert budget.used == 500
+    assert budget.used == 0 and budget.waits == 0
+
+
+def test_stream_buffer_counts_the_socket_buffer():
+    assert governor.stream_buffer(64 * 1024) > 64 * 1024
+
+
+def test_download_streams_wait_for_network_budget(cdn, tmp_path, monkeypatch):
+    budget = _room_for_one(monkeypatch, downloader.CHUNK_SIZE)
+    results = []
+
+    def fetch(name):
+        results.append(downloader._download_single(cdn, str(tmp_path / name), name, str(tmp_path / name)))
+
+    threads = [threading.Thread(target=fetch, args=(name,)) for name in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert results == [None, None]
+    assert budget.waits == 1 and budget.peak == budget.limit and budget.used == 0
+
+
+def test_cache_fills_wait_for_network_budget(cdn, tmp_path, monkeypatch):
+    budget = _room_for_one(monkeypatch, audiocache.CHUNK_SIZE)
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 * len(AUDIO))
+    proxy = CacheProxy(lambda track_id, quality: cdn, cache).start()
+    proxy.prefetch("1", "27")
+    proxy.prefetch("2", "27")
+    proxy.stop()
+
+    assert cache.lookup("1", "27") and cache.lookup("2", "27")
+    assert budget.waits == 1 and budget.peak == budget.limit
+
+
+def test_report_is_scheduled_once(monkeypatch):
+    registered = []
+    monkeypatch.setattr(governor, "_scheduled", False)
+    monkeypatch.setattr(governor.atexit, "register", registered.append)
+    governor.schedule_report()
+    governor.schedule_report()
+    assert registered == [governor.report]
+
+
+@pytest.mark.parametrize("argv", [["play", "--offline"], ["library", "lib1", "--sync"]])
+def test_download_and_play_runs_always_report(argv, monkeypatch):
+    registered = []
+    monkeypatch.setattr(governor, "_scheduled", False)
+    monkeypatch.setattr(governor.atexit, "register", registered.append)
+    monkeypatch.setattr(dabcli, "stream_cli_entry", lambda args: None)
+    monkeypatch.setattr(dabcli, "require_login", lambda config: True)
+    monkeypatch.setattr(library, "sync_library", lambda *args, **kwargs: None)
+
+    parser, subparsers = dabcli.build_parser()
+    dabcli.run(parser.parse_args(argv), subparsers)
+    assert registered == [governor.report]
@@ -0,0 +1,132 @@
+# tests/test_library.py
+import os
+
+import pytest
+
+import downloader
+import library
+import retryqueue
+from config import config
+from utils import load_json
+
+
+def _track(track_id: int) -> dict:
+    return {"id": track_id, "title": f"Song {track_id}", "artist": "Band", "albumTitle": "Album"}
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    """The remote library (a list of track dicts) and the IDs downloaded by each sync."""
+    state = {"tracks": [], "downloads": [], "fail": set(), "stop": set()}
+
+    def fake_get(endpoint, params=None):
+        return {"library": {"id": "lib1", "name": "Favourites", "tracks": [dict(t) for t in state["tracks"]]}}
+
+    def fake_download(track, lib_folder, quality, cli_args=None):
+        state["downloads"].append(track["id"])
+        if track["id"] in state["stop"]:
+            downloader._STOPPED = True  # what pressing 'q' during the transfer does
+            return None
+        downloader._STOPPED = False
+        if track["id"] in state["fail"]:
+            return None
+        path = os.path.join(lib_folder, library._track_filename(track))
+        with open(path, "wb") as f:
+            f.write(b"audio")
+        return path
+
+    monkeypatch.setattr(config, "token", "test")
+    monkeypatch.setattr(config, "retry_backoff_seconds", 0)
+    monkeypatch.setattr(config, "retry_attempts", 1)
+    monkeypatch.setattr(library, "get", fake_get)
+    monkeypatch.setattr(library, "_download_library_track", fake_download)
+    monkeypatch.setattr(downloader, "_STOPPED", False)
+    return state
+
+
+def _sync(remote, tracks, **kwargs):
+    remote["tracks"] = tracks
+    remote["downloads"] = []
+    library.sync_library("lib1", **kwargs)
+    return remote["downloads"]
+
+
+def _folder() -> str:
+    return os.path.join(config.output_directory, "libraries", "Favourites")
+
+
+def _playlist() -> list:
+    with open(os.path.join(_folder(), "library.m3u8"), encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_diff_tracks():
+    previous = [_track(1), _track(2), _track(3), _track(4)]
+    current = [_track(3), _track(1), _track(2), _track(5)]
+    added, removed, reordered = library.diff_tracks(previous, current)
+    assert [t["id"] for t in added] == [5]
+    assert [t["id"] for t in removed] == [4]
+    assert reordered == 1  # 1,2,3 → 3,1,2: only 3 moved
+
+
+def test_moving_one_track_to_the_top_counts_once():
+    previous = [_track(i) for i in range(1, 11)]
+    current = [_track(10)] + previous[:9]
+    assert library.diff_tracks(previous, current) == ([], [], 1)
+    assert library.diff_tracks(previous, list(reversed(previous)))[2] == 9
+
+
+def test_diff_tracks_compares_ids_as_strings():
+    added, removed, reordered = library.diff_tracks([{"id": "7"}], [{"id": 7}])
+    assert (added, removed, reordered) == ([], [], 0)
+
+
+def test_sync_downloads_only_the_difference(remote):
+    assert _sync(remote, [_track(1), _track(2), _track(3)]) == [1, 2, 3]
+    assert _sync(remote, [_track(1), _track(2), _track(3)]) == []
+    assert _sync(remote, [_track(4), _track(1), _track(3)]) == [4]
+
+    snapshot = load_json(library._snapshot_path("lib1"))
+    assert [t["id"] for t in snapshot["tracks"]] == [4, 1, 3]
+    assert [t["file"] for t in snapshot["tracks"]] == [library._track_filename(_track(i)) for i in (4, 1, 3)]
+    assert _playlist() == [library._track_filename(_track(i)) for i in (4, 1, 3)]
+    # Removed remotely, but kept on disk without --prune
+    assert os.path.exists(os.path.join(_folder(), library._track_filename(_track(2))))
+
+
+def test_sync_redownloads_files_missing_on_disk(remote):
+    _sync(remote, [_track(1), _track(2)])
+    os.remove(os.path.join(_folder(), library._track_filename(_track(2))))
+    assert _sync(remote, [_track(1), _track(2)]) == [2]
+
+
+def test_failed_additions_are_retried_by_the_next_sync(remote):
+    remote["fail"] = {2}
+    assert _sync(remote, [_track(1), _track(2)]) == [1, 2, 2]  # the end-of-run retry fails too
+    assert [t["id"] for t in load_json(library._snapshot_path("lib1"))["tracks"]] == [1]
+
+    remote["fail"] = set()
+    assert _sync(remote, [_track(1), _track(2)]) == [2]
+
+
+def test_track_stopped_by_user_is_not_retried(remote):
+    remote["stop"] = {2}
+    assert _sync(remote, [_track(1), _track(2), _track(3)]) == [1, 2, 3]  # no end-of-run retry
+    assert not os.path.exists(retryqueue.retry_file())
+    assert [t["id"] for t in load_json(library._snapshot_path("lib1"))["tracks"]] == [1, 3]
+
+    remote["stop"] = set()
+    assert _sync(remote, [_track(1), _track(2), _track(3)]) == [2]  # picked up by the next sync
+
+
+def test_prune_and_quarantine_removed_tracks(remote):
+    _sync(remote, [_track(1), _track(2), _track(3)])
+
+    _sync(remote, [_track(1), _track(3)], quarantine=True)
+    name = library._track_filename(_track(2))
+    assert not os.path.exists(os.path.join(_folder(), name))
+    assert os.path.exists(os.path.join(_folder(), ".removed", name))
+
+    _sync(remote, [_track(1)], prune=True)
+    assert os.path.exists(os.path.join(_folder(), library._track_filename(_track(1))))
+    assert not os.path.exists(os.path.join(_folder(), library._track_filename(_track(3))))
@@ -0,0 +1,103 @@
+# tests/test_limiter.py
+import email.utils
+import time
+
+import pytest
+
+import limiter
+from limiter import AdaptiveLimiter, retry_after_seconds
+
+
+class _Resp:
+    def __init__(self, status_code: int, retry_after: str = None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Responses handed out in order by transport.request, and the requests made."""
+    state = {"queue": [], "calls": []}
+
+    def fake_request(method, url, **kwargs):
+        state["calls"].append((method, url))
+        return state["queue"].pop(0)
+
+    monkeypatch.setattr(limiter.transport, "request", fake_request)
+    monkeypatch.setattr(limiter, "API", AdaptiveLimiter("api", maximum=16, initial=8))
+    monkeypatch.setattr(limiter, "CDN", AdaptiveLimiter("cdn", maximum=16, initial=8))
+    return state
+
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after_seconds(_Resp(429, "7")) == 7.0
+    assert retry_after_seconds(_Resp(429)) is None
+    assert retry_after_seconds(_Resp(429, "soon")) is None
+    later = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after_seconds(_Resp(429, later)) <= 60
+
+
+def test_throttle_halves_the_limit_and_pauses_for_retry_after():
+    lim = AdaptiveLimiter("test", maximum=16, initial=8)
+    lim.acquire()
+    lim.release("throttled", retry_after=30)
+    snap = lim.snapshot()
+    assert snap["limit"] == 4 and snap["throttled"] == 1
+    assert 29 < snap["paused_for"] <= 30
+
+    lim.release("throttled", retry_after=1)  # same window: counted, but not cut again
+    assert lim.limit == 4 and lim.snapshot()["paused_for"] > 29
+
+
+def test_success_grows_the_limit_additively():
+    lim = AdaptiveLimiter("test", maximum=16, initial=4)
+    for _ in range(4):
+        lim.acquire()
+        lim.release("ok", latency=0.01)
+    assert lim.limit == 4  # +1/limit each: just short of one full step after a round
+    lim.acquire()
+    lim.release("ok", latency=0.01)
+    assert lim.limit == 5
+
+
+def test_slow_replies_shrink_the_limit_gently():
+    lim = AdaptiveLimiter("test", maximum=16, initial=10, latency_target=0.5)
+    lim.acquire()
+    lim.release("ok", latency=2.0)
+    assert lim.limit == 9
+
+
+def test_api_request_retries_429_after_retry_after(replies):
+    replies["queue"] = [_Resp(429, "0"), _Resp(200)]
+    resp = limiter.api_request("GET", "https://api.invalid/x")
+    assert resp.status_code == 200
+    assert len(replies["calls"]) == 2
+    assert limiter.API.limit == 4
+    assert limiter.API.retries == {"throttled": 1} and limiter.API.in_flight == 0
+
+
+def test_api_request_returns_the_last_throttled_reply(replies):
+    replies["queue"] = [_Resp(503, "0") for _ in range(limiter.MAX_RETRIES + 1)]
+    assert limiter.api_request("GET", "https://api.invalid/x").status_code == 503
+    assert limiter.API.throttled == limiter.MAX_RETRIES + 1
+    assert limiter.API.limit == 4  # one cut per round trip
+
+
+def test_cdn_stream_retries_before_the_body_starts(replies):
+    throttled = _Resp(429, "0")
+    replies["queue"] = [throttled, _Resp(200)]
+    with limiter.cdn_stream("https://cdn.invalid/a.flac") as resp:
+        assert resp.status_code == 200
+        assert limiter.CDN.in_flight == 1
+    assert throttled.closed and resp.closed
+    assert limiter.CDN.in_flight == 0 and limiter.CDN.limit == 4
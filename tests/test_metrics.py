@@ -0,0 +1,97 @@
+# tests/test_metrics.py
+import re
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import events
+import limiter
+import metrics
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="(?:[^"\\]|\\.)*"(,[a-z_]+="(?:[^"\\]|\\.)*")*\})? (-?[0-9.e+]+|\+Inf)$')
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    for metric in metrics._metrics:
+        monkeypatch.setattr(metric, "_values", {})
+    monkeypatch.setattr(limiter, "API", limiter.AdaptiveLimiter("api", maximum=8, initial=4))
+    monkeypatch.setattr(limiter, "CDN", limiter.AdaptiveLimiter("cdn", maximum=4, initial=2))
+
+
+def _samples(text: str) -> dict:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_exposition_format():
+    text = metrics.render()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    for metric in metrics._metrics:
+        help_line = lines.index(f"# HELP {metric.name} {metric.help}")
+        assert lines[help_line + 1] == f"# TYPE {metric.name} {metric.kind}"
+    for line in lines:
+        assert line.startswith("# ") or SAMPLE.match(line), line
+    samples = _samples(text)
+    assert samples['dabcli_concurrency_limit{host="api"}'] == "4"
+    assert samples['dabcli_concurrency_limit{host="cdn"}'] == "2"
+    assert samples['dabcli_budget_used_bytes{budget="network"}'] == "0"
+
+
+def test_events_feed_the_counters():
+    events.Progress("7", total=1000).add(1000)
+    events.emit("completed", track_id="7", path="a.flac", duration=4.2)
+    events.emit("failed", track_id="8", reason="write", error="disk full")
+    events.emit("tagged", scope="tag", path="a.flac", changed=True)
+    events.emit("completed", scope="album", album_id="al1")
+
+    samples = _samples(metrics.render())
+    assert samples["dabcli_downloaded_bytes_total"] == "1000"
+    assert samples['dabcli_tracks_total{outcome="completed"}'] == "1"
+    assert samples['dabcli_tracks_total{outcome="failed"}'] == "1"
+    assert samples['dabcli_tags_total{result="written"}'] == "1"
+    assert samples['dabcli_collections_total{outcome="completed",scope="album"}'] == "1"
+
+
+def test_histogram_buckets_are_cumulative():
+    for seconds in (0.5, 3, 45):
+        metrics.TRANSFER_SECONDS.observe(seconds)
+    samples = _samples(metrics.render())
+    name = "dabcli_transfer_duration_seconds"
+    assert samples[f'{name}_bucket{{le="1"}}'] == "1"
+    assert samples[f'{name}_bucket{{le="5"}}'] == "2"
+    assert samples[f'{name}_bucket{{le="60"}}'] == "3"
+    assert samples[f'{name}_bucket{{le="+Inf"}}'] == "3"
+    assert (samples[f"{name}_sum"], samples[f"{name}_count"]) == ("48.5", "3")
+
+
+def test_label_values_are_escaped():
+    metrics.API_REQUESTS.inc(endpoint='/search "q"\\', status=200)
+    assert 'dabcli_api_requests_total{endpoint="/search \\"q\\"\\\\",status="200"} 1' in metrics.render()
+
+
+def test_endpoint_labels_are_bounded():
+    assert metrics.endpoint_label("/album?albumId=1") == "/album"
+    assert metrics.endpoint_label("/libraries/42?page=1") == "/libraries/{id}"
+    assert metrics.endpoint_label("") == "/"
+
+
+def test_served_over_http():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), metrics._Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5) as resp:
+            assert resp.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert "# TYPE dabcli_tracks_total counter" in resp.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_textfile_is_replaced_atomically(tmp_path):
+    path = tmp_path / "node" / "dabcli.prom"
+    metrics.write_textfile(str(path))
+    assert "# TYPE dabcli_start_time_seconds gauge" in path.read_text(encoding="utf-8")
+    assert [p.name for p in path.parent.iterdir()] == ["dabcli.prom"]
@@ -0,0 +1,62 @@
+# tests/test_models.py
+import copy
+import json
+import pickle
+
+import pytest
+
+from models import Album, Track, jsonable, loads, parse_tracks
+from utils import load_json, save_json
+
+
+def _api_track(track_id: int, artist: str = "Band") -> dict:
+    # Built at runtime so equal strings are distinct objects, as they are when decoded from JSON
+    return {"id": track_id, "title": f"Song {track_id}", "artist": "".join(artist),
+            "albumTitle": "Album", "genre": "Rock", "audioQuality": {"maximumBitDepth": 24}, "popularity": 3}
+
+
+def test_track_keeps_only_the_known_fields():
+    track = Track.from_api(_api_track(7))
+    assert dict(track) == {"id": 7, "title": "Song 7", "artist": "Band", "albumTitle": "Album", "genre": "Rock"}
+    assert "popularity" not in track and track.get("duration") is None
+    assert not hasattr(track, "__dict__")
+    with pytest.raises(KeyError):
+        track["popularity"] = 4
+
+
+def test_tracks_behave_like_dicts():
+    track = Track.from_api(_api_track(7))
+    assert track.setdefault("duration", 180) == 180 and track["duration"] == 180
+    del track["genre"]
+    assert "genre" not in track and len(track) == 5
+    with pytest.raises(KeyError):
+        track["genre"]
+    assert Track.from_api(track) is track and Track.from_api(None) is None
+
+
+def test_repeated_strings_are_shared():
+    first, second = parse_tracks([_api_track(1, "Some Band"), _api_track(2, "Some Band")])
+    assert first["artist"] is second["artist"]
+    assert first["title"] is not second["title"]
+
+
+def test_album_tracks_become_records():
+    album = Album.from_api({"id": "al1", "title": "Album", "tracks": [_api_track(1), _api_track(2)],
+                            "upc": "0123"})
+    assert [type(t) for t in album["tracks"]] == [Track, Track]
+    assert "upc" not in album
+
+
+def test_records_serialise_as_plain_objects(tmp_path):
+    album = Album.from_api({"id": "al1", "title": "Album", "tracks": [_api_track(1)]})
+    assert json.loads(json.dumps(album, default=jsonable))["tracks"][0]["title"] == "Song 1"
+    path = str(tmp_path / "album.json")
+    save_json(path, {"album": album})
+    assert load_json(path)["album"]["tracks"][0]["id"] == 1
+
+    assert pickle.loads(pickle.dumps(album)) == album
+    assert copy.deepcopy(album)["tracks"][0] == album["tracks"][0]
+
+
+def test_loads_accepts_bytes_and_str():
+    assert loads(b'{"id": 7}') == loads('{"id": 7}') == {"id": 7}
@@ -0,0 +1,137 @@
+# tests/test_mpvipc.py
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from mpvipc import MpvController, MpvError
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+class _FakeMpv:
+    """The mpv end of the IPC socket: collects commands, writes whatever the test scripts."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.commands = []
+        self._buf = b""
+
+    def read_commands(self, count: int, timeout: float = 5) -> list:
+        self.sock.settimeout(timeout)
+        while len(self.commands) < count:
+            self._buf += self.sock.recv(65536)
+            *lines, self._buf = self._buf.split(b"\n")
+            self.commands.extend(json.loads(line) for line in lines if line.strip())
+        return self.commands
+
+    def send(self, data: bytes):
+        self.sock.sendall(data)
+
+
+@pytest.fixture
+def mpv():
+    ours, theirs = socket.socketpair()
+    controller = MpvController()
+    controller._sock = ours
+    controller._reader = threading.Thread(target=controller._read_loop, daemon=True)
+    controller._reader.start()
+    fake = _FakeMpv(theirs)
+    yield controller, fake
+    theirs.close()
+    controller.closed.wait(2)
+    ours.close()
+
+
+def _reply(request_id, data=None, error="success") -> bytes:
+    return json.dumps({"request_id": request_id, "error": error, "data": data}).encode() + b"\n"
+
+
+def test_replies_are_matched_by_request_id(mpv):
+    controller, fake = mpv
+    results = {}
+    threads = [
+        threading.Thread(target=lambda name=name: results.update({name: controller.get_property(name)}))
+        for name in ("volume", "pause")
+    ]
+    for t in threads:
+        t.start()
+    commands = fake.read_commands(2)
+    ids = {c["command"][1]: c["request_id"] for c in commands}
+
+    # Replies out of order, an event in between, and one reply split across two writes
+    second = _reply(ids["pause"], False)
+    fake.send(second[:9])
+    time.sleep(0.05)
+    fake.send(second[9:] + b'{"event": "playback-restart"}\n' + _reply(ids["volume"], 80))
+    for t in threads:
+        t.join(5)
+
+    assert results == {"volume": 80, "pause": False}
+    assert len(set(ids.values())) == 2
+    assert controller._pending == {}
+
+
+def test_error_reply_raises(mpv):
+    controller, fake = mpv
+    errors = []
+
+    def failing():
+        try:
+            controller.command("loadfile", "missing.flac")
+        except MpvError as e:
+            errors.append(str(e))
+
+    t = threading.Thread(target=failing)
+    t.start()
+    request_id = fake.read_commands(1)[0]["request_id"]
+    fake.send(_reply(request_id, error="invalid parameter"))
+    t.join(5)
+    assert errors == ["loadfile: invalid parameter"]
+
+
+def test_property_changes_and_events_reach_callbacks(mpv):
+    controller, fake = mpv
+    seen = []
+    controller.on("end-file", lambda msg: seen.append(("end-file", msg["reason"])))
+
+    t = threading.Thread(target=controller.observe, args=("playlist-pos", lambda value: seen.append(("pos", value))))
+    t.start()
+    command = fake.read_commands(1)[0]
+    assert command["command"][0] == "observe_property" and command["command"][2] == "playlist-pos"
+    fake.send(_reply(command["request_id"]))
+    t.join(5)
+
+    fake.send(b'{"event": "property-change", "name": "playlist-pos", "data": 1}\n'
+              b'{"event": "end-file", "reason": "eof"}\n')
+    deadline = time.monotonic() + 5
+    while len(seen) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert seen == [("pos", 1), ("end-file", "eof")]
+
+
+def test_closed_socket_releases_waiting_commands(mpv):
+    controller, fake = mpv
+    shutdown = []
+    controller.on("shutdown", shutdown.append)
+    errors = []
+
+    def waiting():
+        try:
+            controller.get_property("volume")
+        except MpvError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=waiting)
+    t.start()
+    fake.read_commands(1)
+    fake.sock.close()  # mpv quit
+    t.join(5)
+
+    assert not t.is_alive() and controller.closed.is_set()
+    assert [str(e) for e in errors] == ["mpv closed before replying to get_property"]
+    assert shutdown == [{"event": "shutdown"}]
+    with pytest.raises(MpvError):
+        controller.command("quit")
@@ -0,0 +1,49 @@
+# tests/test_planner.py
+import os
+
+import planner
+from config import config
+
+
+def _track(track_id: str, title: str) -> dict:
+    return {"id": track_id, "title": title, "artist": "Band"}
+
+
+def _touch(path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"audio")
+    return path
+
+
+def _items(output_directory):
+    album = os.path.join(str(output_directory), "albums", "2020 - Band - Album - al1")
+    items = [planner._item(_track(tid, title), album, idx)
+             for idx, (tid, title) in enumerate([("1", "Here"), ("2", "Elsewhere"), ("3", "New"), ("4", "Old Name")], 1)]
+    items.append(planner._item(_track("3", "New"), os.path.join(str(output_directory), "libraries", "Mix")))
+    _touch(items[0]["path"])
+    _touch(os.path.join(str(output_directory), "albums", "Other - al2", "05 - Band - Elsewhere - 2.flac"))
+    _touch(os.path.join(album, "09 - Band - Renamed - 4.flac"))  # same track ID, older file name
+    return items
+
+
+def test_classify_present_link_download(output_directory, monkeypatch):
+    monkeypatch.setattr(config, "output_format", "flac")
+    items = _items(output_directory)
+    planner._classify(items, "27")
+    assert [i["state"] for i in items] == ["present", "link", "download", "present", "link"]
+
+
+def test_build_plan_sizes_only_downloads(output_directory, monkeypatch):
+    monkeypatch.setattr(config, "output_format", "flac")
+    probed = []
+    monkeypatch.setattr(planner, "get_stream_url", lambda track_id, quality: f"https://cdn.invalid/{track_id}")
+    monkeypatch.setattr(planner, "_size_of", lambda url: probed.append(url) or 30 * 1024 * 1024)
+    monkeypatch.setattr(planner, "measured_throughput", lambda: 1024 * 1024)
+
+    plan = planner.build_plan(_items(output_directory))
+
+    assert probed == ["https://cdn.invalid/3"]
+    assert (plan["present"], plan["link"], plan["download"]) == (2, 2, 1)
+    assert plan["bytes"] == 30 * 1024 * 1024 and plan["rate_source"] == "past downloads"
+    assert plan["free"] > 0
@@ -0,0 +1,75 @@
+# tests/test_retag.py
+import os
+
+import pytest
+from mutagen.flac import FLAC
+
+import metacache
+import retag
+from config import config
+from conftest import make_flac
+from utils import save_json
+
+ALBUM = {
+    "id": "al7", "title": "Album", "artist": "Band", "genre": "Rock", "releaseDate": "2021-05-01",
+    "tracks": [{"id": "11", "title": "One", "artist": "Band"}, {"id": "12", "title": "Two", "artist": "Band"}],
+}
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    def no_api(*args, **kwargs):
+        raise AssertionError("metadata should come from the local cache")
+
+    monkeypatch.setattr(retag, "get", no_api)
+    monkeypatch.setattr(config, "use_metadata_tagging", True)
+    monkeypatch.setattr(config, "get_lyrics", False)
+
+
+def _album_folder(output_directory) -> str:
+    folder = os.path.join(str(output_directory), "albums", "2021 - Band - Album - al7")
+    for idx, track in enumerate(ALBUM["tracks"], 1):
+        make_flac(os.path.join(folder, f"{idx:02d} - Band - {track['title']} - {track['id']}.flac"))
+    with open(os.path.join(folder, "cover.jpg"), "wb") as f:
+        f.write(b"\xff\xd8\xff\xe0" + bytes(64) + b"\xff\xd9")
+    metacache.remember_album(ALBUM)
+    return folder
+
+
+def test_resolve_target_finds_album_folders(output_directory):
+    folder = _album_folder(output_directory)
+    assert retag.resolve_target("al7") == folder
+    assert retag.resolve_target(folder) == folder
+
+
+def test_plan_jobs_uses_cached_album_and_snapshot_metadata(output_directory, monkeypatch):
+    folder = _album_folder(output_directory)
+    library = os.path.join(str(output_directory), "libraries", "Favourites")
+    liked = make_flac(os.path.join(library, "Guest - Hit - 99.flac"))
+    unknown = make_flac(os.path.join(library, "Nobody - Nothing - 404.flac"))
+    save_json(config.state_path("sync", "libraries", "lib1.json"), {"tracks": [
+        {"id": 99, "title": "Hit", "artist": "Guest", "albumTitle": "Single", "releaseDate": "2019"}]})
+    fetched = []
+    monkeypatch.setattr(retag, "_fetch_track", lambda track_id: fetched.append(track_id) or (track_id, None))
+
+    jobs, unresolved = retag.plan_jobs(retag._collect_files([folder, library]))
+
+    by_path = {path: (metadata, cover) for path, metadata, cover in jobs}
+    first = os.path.join(folder, "01 - Band - One - 11.flac")
+    assert by_path[first][0]["album"] == "Album" and by_path[first][0]["albumArtist"] == "Band"
+    assert by_path[first][1] == os.path.join(folder, "cover.jpg")
+    assert by_path[liked][0]["album"] == "Single"
+    assert unresolved == [unknown]
+    assert fetched == ["404"]  # only what no cache knows is fetched
+
+
+def test_retag_writes_once_then_skips(output_directory, capsys):
+    folder = _album_folder(output_directory)
+
+    retag.retag("al7", workers=1)
+    assert "2 files tagged, 0 already up to date, 0 failed" in capsys.readouterr().out
+    tags = FLAC(os.path.join(folder, "02 - Band - Two - 12.flac"))
+    assert tags["title"] == ["Two"] and tags["date"] == ["2021"] and len(tags.pictures) == 1
+
+    retag.retag("al7", workers=1)
+    assert "0 files tagged, 2 already up to date, 0 failed" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+# tests/test_retryqueue.py
+import pytest
+
+import downloader
+import retryqueue
+from config import config
+from retryqueue import RetryQueue, save_failures
+from utils import load_json
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(config, "retry_backoff_seconds", 0)
+    monkeypatch.setattr(config, "retry_attempts", 3)
+
+
+def _entry(track_id, folder="Album") -> dict:
+    return {"kind": "album", "album_id": "al1", "track_id": track_id, "index": 1, "folder": folder, "quality": "27"}
+
+
+def _flaky(failures: int):
+    """A job that fails `failures` times, then succeeds; counts its calls."""
+    calls = []
+
+    def job():
+        calls.append(1)
+        return len(calls) > failures
+    return job, calls
+
+
+def test_recovered_tracks_stay_out_of_the_retry_file():
+    queue = RetryQueue("album")
+    recovers, recover_calls = _flaky(1)
+    never, never_calls = _flaky(99)
+    queue.defer(_entry("1"), recovers)
+    queue.defer(_entry("2"), never)
+
+    remaining = queue.run()
+
+    assert [e["track_id"] for e in remaining] == ["2"]
+    assert len(recover_calls) == 2 and len(never_calls) == 3
+    assert [e["track_id"] for e in load_json(retryqueue.retry_file())] == ["2"]
+
+
+def test_exceptions_count_as_failures():
+    queue = RetryQueue("album")
+
+    def broken():
+        raise RuntimeError("stream URL expired")
+
+    queue.defer(_entry("3"), broken)
+    assert [e["track_id"] for e in queue.run()] == ["3"]
+
+
+def test_save_failures_merges_by_track_and_folder():
+    save_failures([_entry("1"), _entry("2")])
+    save_failures([_entry("2"), _entry("2", folder="Best Of")])
+    saved = sorted((e["track_id"], e["folder"]) for e in load_json(retryqueue.retry_file()))
+    assert saved == [("1", "Album"), ("2", "Album"), ("2", "Best Of")]
+
+
+def test_interrupted_run_saves_what_is_left():
+    queue = RetryQueue("album")
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    queue.defer(_entry("4"), interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        queue.run()
+    assert [e["track_id"] for e in load_json(retryqueue.retry_file())] == ["4"]
+
+
+def test_retry_stopped_by_user_is_dropped(monkeypatch):
+    monkeypatch.setattr(downloader, "_STOPPED", False)
+
+    def stopped():
+        downloader._STOPPED = True  # 'q' pressed during the retry
+        return None
+
+    queue = RetryQueue("album")
+    queue.defer(_entry("1"), stopped)
+
+    assert queue.run() == []
+    assert load_json(retryqueue.retry_file(), []) == []
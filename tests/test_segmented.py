@@ -0,0 +1,77 @@
+# tests/test_segmented.py
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+import limiter
+from config import config
+
+AUDIO = bytes(range(256)) * 4096  # 1 MiB
+
+
+class _CDN(BaseHTTPRequestHandler):
+    """Honours the one-byte probe, but answers every other range with the whole body."""
+    honour_ranges = False
+
+    def do_GET(self):
+        header = self.headers.get("Range", "")
+        if header == "bytes=0-0" or (self.honour_ranges and header):
+            start, end = (int(x) for x in header[6:].split("-"))
+            body = AUDIO[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(AUDIO)}")
+        else:
+            body = AUDIO
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cdn(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CDN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/audio.flac"
+    monkeypatch.setattr(config, "token", "test")
+    monkeypatch.setattr(config, "segmented_download", True)
+    monkeypatch.setattr(config, "segment_threshold_mb", 0)
+    monkeypatch.setattr(downloader, "_CONTROLS_STARTED", True)
+    monkeypatch.setattr(downloader, "get_stream_url", lambda track_id, quality: url)
+    yield _CDN
+    _CDN.honour_ranges = False
+    server.shutdown()
+    server.server_close()
+
+
+def _download(output_directory) -> str:
+    meta = {"id": "55", "title": "Song", "artist": "Band"}
+    return downloader.download_track("55", "27", str(output_directory), 1, meta)
+
+
+def test_ignored_range_falls_back_to_a_single_stream(cdn, output_directory):
+    path = _download(output_directory)
+    assert path and os.path.basename(path) == "01 - Band - Song - 55.flac"
+    with open(path, "rb") as f:
+        assert f.read() == AUDIO
+
+
+def test_connections_follow_the_free_cdn_slots(cdn, output_directory, monkeypatch):
+    cdn.honour_ranges = True
+    monkeypatch.setattr(config, "segment_connections", 8)
+    monkeypatch.setattr(limiter, "CDN", limiter.AdaptiveLimiter("cdn", maximum=6, initial=2))
+    started = []
+    monkeypatch.setattr(downloader.events, "emit",
+                        lambda kind, **fields: started.append(fields.get("connections")) if kind == "started" else None)
+
+    path = _download(output_directory)
+
+    assert started == [2]
+    with open(path, "rb") as f:
+        assert f.read() == AUDIO
@@ -0,0 +1,50 @@
+# tests/test_shell.py
+import os
+import threading
+import time
+
+import pytest
+
+import downloader
+from config import config
+from shell import Shell
+
+
+@pytest.fixture
+def shell(monkeypatch):
+    monkeypatch.setattr(config, "token", "test")
+    monkeypatch.setattr(config, "test_mode", True)  # writes placeholder audio, no network
+    monkeypatch.setattr(downloader, "_CONTROLS_STARTED", True)
+    monkeypatch.setattr(downloader, "_HELD", False)
+    return Shell(parser=None, subparsers=None, run=None)
+
+
+def _download_in_background(track_id: str):
+    meta = {"id": track_id, "title": f"Song {track_id}", "artist": "Band"}
+    thread = threading.Thread(target=downloader.download_track, args=(track_id,), kwargs={"track_meta": meta})
+    thread.start()
+    return thread
+
+
+def _downloaded(output_directory, track_id: str) -> bool:
+    return any(name.endswith(f" - {track_id}.{config.output_format}") for name in os.listdir(output_directory))
+
+
+def test_pause_holds_tracks_started_later(shell, output_directory):
+    shell.do_pause("")
+    # The next track of a paused album or library must not start (it used to reset the pause)
+    thread = _download_in_background("1001")
+    time.sleep(0.5)
+    assert thread.is_alive()
+    assert not _downloaded(output_directory, "1001")
+
+    shell.do_resume("")
+    thread.join(5)
+    assert _downloaded(output_directory, "1001")
+
+
+def test_keyboard_pause_does_not_carry_over(shell, output_directory, monkeypatch):
+    monkeypatch.setattr(downloader, "_PAUSED", True)  # 'p' during the previous track
+    thread = _download_in_background("1002")
+    thread.join(5)
+    assert _downloaded(output_directory, "1002")
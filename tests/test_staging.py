@@ -0,0 +1,99 @@
+# tests/test_staging.py
+import json
+import os
+import queue
+import subprocess
+import sys
+
+import pytest
+
+import staging
+from config import config
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    directory = tmp_path / "scratch"
+    monkeypatch.setattr(config, "staging_directory", str(directory))
+    # A fresh mover per test
+    monkeypatch.setattr(staging, "_mover", None)
+    monkeypatch.setattr(staging, "_pending", {})
+    monkeypatch.setattr(staging, "_released", set())
+    monkeypatch.setattr(staging, "_queue", queue.Queue())
+    return directory
+
+
+@pytest.fixture
+def dead_pid():
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def _leftover(scratch, final: str, state: str, pid: int, content: bytes = b"audio") -> str:
+    """What a crashed run leaves behind: a staged file and its manifest."""
+    token = f"crashed-{len(os.listdir(scratch))}"
+    folder = scratch / token
+    folder.mkdir(parents=True)
+    staged = folder / os.path.basename(final)
+    staged.write_bytes(content)
+    manifest = {"final": final, "staged": str(staged), "state": state, "pid": pid}
+    (scratch / f"{token}.json").write_text(json.dumps(manifest))
+    return str(staged)
+
+
+def _final(output_directory, name: str) -> str:
+    return os.path.join(str(output_directory), "Album", name)
+
+
+def test_staged_download_is_moved_into_place(scratch, output_directory):
+    final = _final(output_directory, "01 - Song.flac")
+    staged = staging.stage(final)
+    assert staging.is_staged(staged) and staging.is_pending(os.path.abspath(final))
+    with open(staged, "wb") as f:
+        f.write(b"audio")
+    with open(os.path.splitext(staged)[0] + ".lrc", "w") as f:
+        f.write("[00:00.00] la")
+    staging.downloaded(staged)
+    staging.release(staged)
+
+    staging.drain()
+
+    with open(final, "rb") as f:
+        assert f.read() == b"audio"
+    assert os.path.exists(os.path.splitext(final)[0] + ".lrc")
+    assert not staging.is_pending(os.path.abspath(final))
+    assert os.listdir(str(scratch)) == []
+
+
+def test_recovery_after_crash(scratch, output_directory, dead_pid, capsys):
+    scratch.mkdir()
+    partial = _final(output_directory, "01 - Partial.flac")
+    tagged = _final(output_directory, "02 - Tagged.flac")
+    untagged = _final(output_directory, "03 - Untagged.flac")
+    _leftover(scratch, partial, "downloading", dead_pid)
+    _leftover(scratch, tagged, "ready", dead_pid, b"tagged")
+    _leftover(scratch, untagged, "downloaded", dead_pid, b"untagged")
+
+    staging._start()  # what the first stage() or wait_for_space() of a run does
+    staging.drain()
+
+    assert not os.path.exists(partial)  # half a download is dropped, never moved
+    with open(tagged, "rb") as f:
+        assert f.read() == b"tagged"
+    with open(untagged, "rb") as f:
+        assert f.read() == b"untagged"
+    assert "Recovered an untagged download" in capsys.readouterr().out
+    assert os.listdir(str(scratch)) == []
+
+
+def test_recovery_leaves_live_processes_alone(scratch, output_directory):
+    scratch.mkdir()
+    final = _final(output_directory, "01 - Elsewhere.flac")
+    staged = _leftover(scratch, final, "ready", os.getppid())
+
+    staging._start()
+    staging.drain()
+
+    assert os.path.exists(staged)
+    assert not os.path.exists(final)
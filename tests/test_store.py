@@ -0,0 +1,89 @@
+# tests/test_store.py
+import os
+
+import pytest
+
+import downloader
+import store
+from config import config
+from conftest import make_flac
+from mutagen.flac import FLAC
+from tagger import tag_audio
+
+
+@pytest.fixture
+def object_store(monkeypatch):
+    monkeypatch.setattr(config, "use_object_store", True)
+    monkeypatch.setattr(config, "store_link_mode", "hardlink")
+    monkeypatch.setattr(config, "token", "test")
+    monkeypatch.setattr(config, "test_mode", True)  # writes placeholder audio, no network
+    monkeypatch.setattr(downloader, "_CONTROLS_STARTED", True)
+
+
+META = {"id": "555", "title": "Song", "artist": "Band"}
+
+
+def _download(directory, index=None):
+    return downloader.download_track("555", quality="27", directory=str(directory), index=index, track_meta=META)
+
+
+def test_views_share_one_object(object_store, output_directory):
+    album = output_directory / "Album"
+    best_of = output_directory / "Best Of"
+    first = _download(album, index=1)
+    second = _download(best_of, index=7)
+
+    obj_path = store.object_path("555", "27")
+    assert os.path.samefile(first, obj_path) and os.path.samefile(second, obj_path)
+    assert os.path.basename(second).startswith("07 - ")
+    assert store.stats() == (1, os.path.getsize(obj_path), 2)
+
+
+def test_rebuild_restores_and_renames_views(object_store, output_directory):
+    album, best_of = output_directory / "Album", output_directory / "Best Of"
+    first = _download(album, index=1)
+    second = _download(best_of, index=7)
+    os.remove(first)
+    os.rename(second, os.path.join(str(best_of), "old name - 555.flac"))
+
+    assert store.rebuild_views() == (1, 1, 0)
+    assert os.path.exists(first) and os.path.exists(second)
+    assert os.listdir(str(best_of)) == [os.path.basename(second)]
+
+
+def test_import_existing_links_duplicate_copies(output_directory):
+    for folder in ("Album", "Best Of"):
+        os.makedirs(output_directory / folder)
+        (output_directory / folder / "Band - Song - 555.flac").write_bytes(b"audio" * 100)
+
+    adopted, linked, reclaimed = store.import_existing()
+
+    assert (adopted, linked, reclaimed) == (1, 1, 500)
+    obj_path = store.object_path("555", "27", "flac")
+    for folder in ("Album", "Best Of"):
+        assert os.path.samefile(output_directory / folder / "Band - Song - 555.flac", obj_path)
+
+
+def test_hardlinked_views_keep_the_first_views_tags(output_directory, monkeypatch):
+    monkeypatch.setattr(config, "use_object_store", True)
+    monkeypatch.setattr(config, "get_lyrics", False)
+    obj_path = make_flac(store.object_path("555", "27", "flac"))
+    views = {}
+    for folder, album in (("Album", "Album"), ("Best Of", "Best Of")):
+        directory = os.path.join(str(output_directory), folder)
+        views[album] = os.path.join(directory, "Band - Song - 555.flac")
+        store.link_view(obj_path, views[album])
+        store.record_view(obj_path, "555", META, directory)
+
+    tag_audio(views["Album"], {"title": "Song", "album": "Album", "tracknumber": "1"})
+    written = os.stat(obj_path).st_mtime_ns
+    tag_audio(views["Best Of"], {"title": "Song", "album": "Best Of", "tracknumber": "7"})
+    tag_audio(views["Album"], {"title": "Song", "album": "Album", "tracknumber": "1"})  # a later sync
+
+    assert FLAC(views["Best Of"])["album"] == ["Album"]
+    assert os.stat(obj_path).st_mtime_ns == written  # no rewrite back and forth
+
+    # Once the owning view is removed on purpose, the next view tags the object
+    store.forget_view(obj_path, os.path.dirname(views["Album"]))
+    tag_audio(views["Best Of"], {"title": "Song", "album": "Best Of", "tracknumber": "7"})
+    assert FLAC(views["Best Of"])["album"] == ["Best Of"]
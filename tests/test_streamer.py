@@ -0,0 +1,163 @@
+# tests/test_streamer.py
+import os
+
+import pytest
+
+import localfiles
+import streamer
+from config import config
+
+
+class _FakeMpv:
+    """Records what the player asks of mpv."""
+    supported = True
+
+    def __init__(self):
+        self.commands = []
+        self.idle = False
+        self.quit_called = False
+
+    def command(self, *args, **kwargs):
+        self.commands.append(args)
+
+    def get_property(self, name):
+        return self.idle if name == "idle-active" else None
+
+    def quit(self):
+        self.quit_called = True
+
+    def start(self):
+        return self
+
+    def observe(self, name, callback):
+        pass
+
+    def wait(self):
+        return 0
+
+
+class _FakeProxy:
+    def __init__(self):
+        self.prefetched = []
+
+    def url_for(self, track_id, quality):
+        return f"http://127.0.0.1:1/q/{quality}/{track_id}"
+
+    def prefetch(self, track_id, quality):
+        self.prefetched.append(track_id)
+
+
+@pytest.fixture(autouse=True)
+def fresh_local_index(monkeypatch):
+    monkeypatch.setattr(localfiles, "_index", None)
+    monkeypatch.setattr(localfiles, "_rescanned", False)
+
+
+@pytest.fixture
+def player(monkeypatch):
+    monkeypatch.setattr(config, "prefetch_tracks", 2)
+    player = streamer.Player("27", _FakeProxy())
+    player.mpv = _FakeMpv()
+    return player
+
+
+def _tracks(*ids) -> list:
+    return [{"id": track_id, "title": f"Song {track_id}", "artist": "Band"} for track_id in ids]
+
+
+def test_mpv_opens_the_next_entry_early(monkeypatch):
+    monkeypatch.setattr(config, "prefetch_buffer_mb", 150)
+    args = streamer._mpv_buffer_args()
+    assert "--prefetch-playlist=yes" in args and "--demuxer-max-bytes=150MiB" in args
+
+
+def test_upcoming_tracks_are_prefetched_when_a_track_starts(player):
+    for track in _tracks("1", "2", "3", "4", "5"):
+        player.enqueue(track)
+    assert player.proxy.prefetched == []  # nothing plays yet
+
+    player._on_playlist_pos(0)
+    assert player.proxy.prefetched == ["2", "3"]
+    player._on_playlist_pos(1)
+    assert player.proxy.prefetched == ["2", "3", "3", "4"]  # the proxy ignores repeats
+
+
+def test_tracks_enqueued_inside_the_window_are_prefetched(player):
+    player.enqueue(_tracks("1")[0])
+    player._on_playlist_pos(0)
+    player.enqueue(_tracks("2")[0])
+    player.enqueue(_tracks("3")[0])
+    player.enqueue(_tracks("4")[0])  # three ahead: outside prefetch_tracks
+    assert player.proxy.prefetched == ["2", "3"]
+
+
+def test_a_whole_queue_plays_in_one_mpv(monkeypatch, capsys):
+    spawned = []
+    monkeypatch.setattr(streamer, "MpvController", lambda args: spawned.append(_FakeMpv()) or spawned[-1])
+    monkeypatch.setattr(config, "token", "test")
+    proxy = _FakeProxy()
+
+    streamer.play_queue_with_metadata(_tracks("1", "2", "3"), "27", proxy)
+
+    assert len(spawned) == 1
+    assert spawned[0].commands == [("loadfile", proxy.url_for(i, "27"), "append-play") for i in ("1", "2", "3")]
+
+
+def test_player_quits_once_the_queue_is_done_and_mpv_idles(player):
+    player.enqueue(_tracks("1")[0])
+    player._on_idle(True)  # between tracks while the queue is still being filled
+    assert not player.mpv.quit_called
+
+    player.finish_enqueue()
+    assert not player.mpv.quit_called  # still playing
+    player._on_idle(True)
+    assert player.mpv.quit_called
+
+
+def _downloaded(output_directory, track_id) -> str:
+    path = output_directory / "albums" / "Album" / f"01 - Band - Song {track_id} - {track_id}.flac"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"audio")
+    return str(path)
+
+
+def _never_resolve(track_id, quality=None):
+    raise AssertionError(f"stream URL requested for {track_id}")
+
+
+def test_local_first_plays_downloaded_tracks_from_disk(player, output_directory, monkeypatch):
+    monkeypatch.setattr(config, "play_local_first", True)
+    monkeypatch.setattr(streamer, "get_stream_url", _never_resolve)
+    local = _downloaded(output_directory, "7")
+    here, remote = _tracks("7", "8")
+
+    assert player.stream_url(here) == local
+    assert player.stream_url(remote) == "http://127.0.0.1:1/q/27/8"
+    player._prefetch(here)
+    assert player.local_ids == {"7"} and player.proxy.prefetched == []
+
+
+def test_local_copies_are_ignored_unless_local_first(player, output_directory, monkeypatch):
+    monkeypatch.setattr(config, "play_local_first", False)
+    _downloaded(output_directory, "7")
+    assert player.stream_url(_tracks("7")[0]) == "http://127.0.0.1:1/q/27/7"
+
+
+def test_offline_uses_downloads_then_the_stream_cache(output_directory, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, "stream_cache", True)
+    monkeypatch.setattr(config, "stream_cache_directory", str(tmp_path / "cache"))
+    monkeypatch.setattr(streamer, "get_stream_url", _never_resolve)
+    local = _downloaded(output_directory, "7")
+    cached = streamer.AudioCache().path_for("8", "27")
+    os.makedirs(os.path.dirname(cached))
+    with open(cached, "wb") as f:
+        f.write(b"audio")
+
+    player = streamer.Player("27", offline=True)
+    player.mpv = _FakeMpv()
+    downloaded, in_cache, missing = _tracks("7", "8", "9")
+
+    assert player.enqueue(downloaded) and player.enqueue(in_cache)
+    assert not player.enqueue(missing)
+    assert [c[1] for c in player.mpv.commands if c[0] == "loadfile"] == [local, cached]
+    assert "[Offline] Not downloaded, skipping: Band — Song 9" in capsys.readouterr().out
@@ -0,0 +1,75 @@
+# tests/test_tagger.py
+import os
+
+import pytest
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3
+
+import tagger
+from config import config
+from conftest import make_flac
+
+METADATA = {"title": "Song", "artist": "Band", "album": "Album", "genre": "", "date": "2020"}
+JPEG = b"\xff\xd8\xff\xe0" + bytes(64) + b"\xff\xd9"
+
+
+@pytest.fixture(autouse=True)
+def quiet_tagging(monkeypatch):
+    monkeypatch.setattr(config, "use_metadata_tagging", True)
+    monkeypatch.setattr(config, "get_lyrics", False)
+    monkeypatch.setattr(config, "cover_max_dimension", 0)
+    monkeypatch.setattr(config, "cover_max_bytes", 0)
+    tagger.reset_tag_stats()
+
+
+def _cover(directory, data: bytes = JPEG, name: str = "cover.jpg") -> str:
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _mp3(directory) -> str:
+    path = os.path.join(str(directory), "01 - Band - Song - 1.mp3")
+    with open(path, "wb") as f:
+        f.write(b"\xff\xfb\x90\x00" + bytes(4096))
+    return path
+
+
+def _fingerprint(path: str):
+    with open(path, "rb") as f:
+        return f.read(), os.stat(path).st_mtime_ns
+
+
+@pytest.mark.parametrize("make", [lambda d: make_flac(os.path.join(str(d), "01 - Band - Song - 1.flac")), _mp3])
+def test_equal_tags_are_not_rewritten(make, output_directory):
+    path = make(output_directory)
+    cover = _cover(output_directory)
+    assert tagger.tag_audio(path, METADATA, cover_path=cover)
+    assert tagger.TAG_STATS == {"written": 1, "skipped": 0}
+    before = _fingerprint(path)
+
+    assert tagger.tag_audio(path, METADATA, cover_path=cover)
+    assert tagger.TAG_STATS == {"written": 1, "skipped": 1}
+    assert _fingerprint(path) == before
+
+    assert tagger.tag_audio(path, dict(METADATA, title="Other"), cover_path=cover)
+    assert tagger.TAG_STATS == {"written": 2, "skipped": 1}
+
+
+def test_new_cover_replaces_the_front_cover(output_directory):
+    path = make_flac(os.path.join(str(output_directory), "01 - Band - Song - 1.flac"))
+    tagger.tag_audio(path, METADATA, cover_path=_cover(output_directory))
+    other = JPEG[:-2] + b"\x01\xff\xd9"
+    tagger.tag_audio(path, METADATA, cover_path=_cover(output_directory, other, "other.jpg"))
+
+    pictures = FLAC(path).pictures
+    assert [p.data for p in pictures] == [other]
+
+
+def test_mp3_cover_is_not_stacked(output_directory):
+    path = _mp3(output_directory)
+    cover = _cover(output_directory)
+    tagger.tag_audio(path, METADATA, cover_path=cover)
+    tagger.tag_audio(path, dict(METADATA, album="Reissue"), cover_path=cover)
+    assert len(ID3(path).getall("APIC")) == 1
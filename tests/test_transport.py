@@ -0,0 +1,126 @@
+# tests/test_transport.py
+import io
+import json
+import os
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import transport
+from config import config
+
+
+class _Raw(io.BytesIO):
+    """The bits of a urllib3 response that requests and transport read from."""
+
+    def read(self, amt=None, decode_content=True):
+        return super().read(-1 if amt is None else amt)
+
+    def release_conn(self):
+        pass
+
+
+def _response(status: int, body: bytes, headers: dict = None, stream: bool = False) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.reason = "OK" if status == 200 else "Too Many Requests"
+    resp.headers = CaseInsensitiveDict(headers or {})
+    resp.url = "https://example.invalid/"
+    if stream:
+        resp.raw = _Raw(body)
+    else:
+        resp._content = body
+    return resp
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Answers handed out in order by the network; a recording directory under tmp_path."""
+    answers = []
+
+    def fake_send(method, url, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(transport, "_send", fake_send)
+    monkeypatch.setattr(transport, "MODE", None)
+    monkeypatch.setattr(transport, "_directory", None)
+    monkeypatch.setattr(transport, "_scale", 1.0)
+    monkeypatch.setattr(transport, "_counters", {})
+    monkeypatch.setattr(config, "token", "test")
+    return answers, str(tmp_path / "recording")
+
+
+def _entries(directory) -> list:
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(directory)
+                  for name in names if name.endswith(".json"))
+
+
+def _replay(directory, monkeypatch):
+    monkeypatch.setattr(transport, "_counters", {})
+    monkeypatch.setattr(transport, "_send", lambda *a, **k: pytest.fail("network used during replay"))
+    transport.configure(replay=directory, latency_scale=0)
+
+
+def test_record_then_replay_round_trip(server, monkeypatch):
+    answers, directory = server
+    answers.extend([
+        _response(429, b"slow down", {"Retry-After": "1"}),
+        _response(200, b'{"tracks": [1, 2]}', {"Content-Type": "application/json", "Set-Cookie": "sid=secret"}),
+        _response(200, b"0123456789" * 100, {"Content-Length": "1000"}, stream=True),
+    ])
+    transport.configure(record=directory)
+    search = {"q": "band", "offset": 0}
+    assert transport.request("GET", "https://api.invalid/search", params=search).status_code == 429
+    assert transport.request("GET", "https://api.invalid/search", params=search).json() == {"tracks": [1, 2]}
+    with transport.request("GET", "https://cdn.invalid/a.flac", headers={"Range": "bytes=0-"}, stream=True) as r:
+        recorded_body = b"".join(r.iter_content(256))
+    assert recorded_body == b"0123456789" * 100
+
+    _replay(directory, monkeypatch)
+    reordered = {"offset": 0, "q": "band"}
+    first = transport.request("GET", "https://api.invalid/search", params=reordered)
+    assert (first.status_code, first.headers["Retry-After"], first.content) == (429, "1", b"slow down")
+    second = transport.request("GET", "https://api.invalid/search", params=reordered)
+    assert second.json() == {"tracks": [1, 2]} and "Set-Cookie" not in second.headers
+    assert transport.request("GET", "https://api.invalid/search", params=reordered).status_code == 200  # last repeats
+    with transport.request("GET", "https://cdn.invalid/a.flac", headers={"Range": "bytes=0-"}, stream=True) as r:
+        assert b"".join(r.iter_content(256)) == recorded_body
+
+    with pytest.raises(requests.ConnectionError):
+        transport.request("GET", "https://cdn.invalid/a.flac", headers={"Range": "bytes=500-"}, stream=True)
+    for path in _entries(directory):
+        with open(path, encoding="utf-8") as f:
+            assert "secret" not in f.read()
+
+
+def test_errors_are_replayed(server, monkeypatch):
+    answers, directory = server
+    answers.append(requests.Timeout("read timed out"))
+    transport.configure(record=directory)
+    with pytest.raises(requests.Timeout):
+        transport.request("GET", "https://api.invalid/album", params={"albumId": "al1"})
+
+    _replay(directory, monkeypatch)
+    with pytest.raises(requests.Timeout, match="read timed out"):
+        transport.request("GET", "https://api.invalid/album", params={"albumId": "al1"})
+
+
+def test_stream_closed_early_is_replayed_truncated(server, monkeypatch):
+    answers, directory = server
+    answers.append(_response(200, b"x" * 1000, stream=True))
+    transport.configure(record=directory)
+    resp = transport.request("GET", "https://cdn.invalid/b.flac", stream=True)
+    assert resp.raw.read(100) == b"x" * 100
+    resp.close()
+
+    (meta,) = _entries(directory)
+    with open(meta, encoding="utf-8") as f:
+        assert json.load(f)["truncated"]
+
+    _replay(directory, monkeypatch)
+    with transport.request("GET", "https://cdn.invalid/b.flac", stream=True) as r:
+        assert r.raw.read() == b"x" * 100
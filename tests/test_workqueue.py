@@ -0,0 +1,143 @@
+# tests/test_workqueue.py
+import os
+import threading
+import time
+
+import pytest
+
+import downloader
+import search
+import workqueue
+from workqueue import Leases, add_job, run_worker, status
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(workqueue, "WAIT_INTERVAL", 0.01)
+
+
+def _age(name: str, seconds: int):
+    path = workqueue._lease_path(name)
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def _run_worker_with_timeout(timeout: float = 10, **kwargs):
+    worker = threading.Thread(target=run_worker, kwargs=kwargs, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), "worker did not finish"
+
+
+def test_add_job_is_idempotent():
+    assert add_job("album", "al123")
+    assert not add_job("album", "al123")
+    assert status()["jobs"] == 1
+
+
+def test_track_job_runs_end_to_end(monkeypatch, output_directory):
+    downloads = []
+
+    def fake_download(track_id, quality, directory, index, track_meta):
+        # The transfer lease is held here, under a different name than the job's
+        assert os.path.exists(workqueue._lease_path(f"xfer-{track_id}"))
+        assert os.path.exists(workqueue._lease_path(f"track-{track_id}"))
+        downloads.append(track_id)
+        return -1  # already on disk: nothing to tag
+
+    monkeypatch.setattr(search, "get_track_metadata_by_id", lambda track_id: {"id": track_id, "title": "Song"})
+    monkeypatch.setattr(downloader, "_download_track", fake_download)
+    assert add_job("track", "4242")
+
+    _run_worker_with_timeout(once=True)
+
+    assert downloads == ["4242"]
+    assert status() == {"jobs": 0, "done": 1, "failed": 0, "leased": 0}
+    assert downloader.TRACK_GUARD is None
+
+
+def test_worker_skips_jobs_leased_elsewhere(monkeypatch):
+    ran = []
+    monkeypatch.setattr(workqueue, "_run_job", lambda job, cli_args: ran.append(job["id"]) or True)
+    for target in ("a1", "a2", "a3"):
+        add_job("album", target)
+    other = Leases(300)
+    assert other.try_acquire("album-a2")
+
+    worker = threading.Thread(target=run_worker, kwargs={"idle_exit": True}, daemon=True)
+    worker.start()
+    deadline = time.monotonic() + 10
+    while status()["done"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ran == ["album-a1", "album-a3"]
+    assert worker.is_alive()  # idle_exit still waits for the job another worker holds
+
+    other.release("album-a2")  # e.g. that worker stopped without finishing it
+    worker.join(10)
+    assert not worker.is_alive()
+    assert ran == ["album-a1", "album-a3", "album-a2"]
+    assert status() == {"jobs": 0, "done": 3, "failed": 0, "leased": 0}
+
+
+def test_failed_job_is_retried_then_moved_to_failed(monkeypatch):
+    monkeypatch.setattr(workqueue, "_run_job", lambda job, cli_args: False)
+    monkeypatch.setattr(workqueue, "RETRY_DELAY", 0)
+    add_job("album", "bad")
+
+    for _ in range(workqueue.MAX_ATTEMPTS):
+        _run_worker_with_timeout(once=True)
+
+    assert status() == {"jobs": 0, "done": 0, "failed": 1, "leased": 0}
+
+
+def test_lease_is_exclusive_until_it_expires():
+    first, second = Leases(300), Leases(300)
+    assert first.try_acquire("album-x")
+    assert not second.try_acquire("album-x")
+
+    _age("album-x", 301)
+    assert second.try_acquire("album-x")
+    assert second.owns("album-x") and not first.owns("album-x")
+
+
+def test_reclaim_never_discards_a_fresh_lease(monkeypatch):
+    """Another worker reclaims and re-leases between this worker's stat and rename."""
+    dead, slow, fast = Leases(300), Leases(300), Leases(300)
+    assert dead.try_acquire("album-y")
+    _age("album-y", 301)
+
+    real_rename = os.rename
+    raced = []
+
+    def racing_rename(src, dst):
+        if not raced and src == workqueue._lease_path("album-y"):
+            raced.append(True)
+            assert fast.try_acquire("album-y")  # reclaims the expired lease and takes it
+        return real_rename(src, dst)
+
+    monkeypatch.setattr(workqueue.os, "rename", racing_rename)
+    assert not slow.try_acquire("album-y")
+
+    assert raced
+    assert fast.owns("album-y")
+    leftovers = [n for n in os.listdir(workqueue._dir("leases")) if ".stale-" in n]
+    assert leftovers == []
+
+
+def test_transfer_guard_waits_for_other_worker():
+    holder, waiter = Leases(300), Leases(300)
+    order = []
+
+    def download_elsewhere():
+        with waiter.track("77"):
+            order.append("waiter")
+            assert waiter.owns("xfer-77")
+
+    with holder.track("77"):
+        thread = threading.Thread(target=download_elsewhere)
+        thread.start()
+        time.sleep(0.1)
+        order.append("holder")
+    thread.join(5)
+
+    assert order == ["holder", "waiter"]
@@ -0,0 +1,250 @@
+# transport.py
+"""
+Record and replay HTTP traffic (--record DIR / --replay DIR).
+
+Every API call, CDN transfer and cover fetch goes through request(). With
+--record each exchange is saved in DIR: status, headers, the body, how long
+the server took to answer (elapsed) and to send the body (transfer), or the
+error it raised. With --replay the same requests are answered from DIR
+without any network access, after the recorded delays multiplied by
+--latency-scale (0 replays as fast as possible). Streamed bodies are paced
+over the recorded transfer time, so progress, limiter and throughput code
+behave as they did during the recording.
+
+Requests are matched on method, URL (query parameters sorted), Range header
+and JSON body. A request made several times during the recording (pagination
+re-reads, retries) gets its answers back in the same order; once they run out
+the last one is repeated. Session cookies are never written to DIR.
+"""
+import datetime
+import hashlib
+import http.cookiejar
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+MODE = None  # None, "record" or "replay"
+_session = None  # pooled keep-alive connections, see keep_alive()
+_directory = None
+_scale = 1.0
+_lock = threading.Lock()
+_counters = {}  # key hash -> next sequence number
+_DROP_HEADERS = {"set-cookie", "content-encoding", "transfer-encoding", "connection"}
+
+
+def configure(record: str = None, replay: str = None, latency_scale: float = 1.0):
+    global MODE, _directory, _scale
+    if record:
+        MODE, _directory = "record", os.path.abspath(record)
+        os.makedirs(_directory, exist_ok=True)
+        print(f"[Transport] Recording HTTP traffic to {_directory}")
+    elif replay:
+        if not os.path.isdir(replay):
+            raise SystemExit(f"[Transport] No recording at {replay}")
+        MODE, _directory = "replay", os.path.abspath(replay)
+        _scale = max(0.0, float(latency_scale))
+        from config import config
+        config.token = config.token or "replay"  # the recording holds the answers; never log in
+        print(f"[Transport] Replaying HTTP traffic from {_directory} (latency x{_scale:g})")
+
+
+def keep_alive():
+    """Reuse connections across requests (long-lived processes such as the shell)."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        # Authentication is sent explicitly; never pick up cookies from responses
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+
+
+def _send(method: str, url: str, **kwargs):
+    if _session is not None:
+        return _session.request(method, url, **kwargs)
+    return requests.request(method, url, **kwargs)
+
+
+def _key(method: str, url: str, params=None, headers=None, json_body=None) -> tuple:
+    prepared = requests.Request(method, url, params=params).prepare().url
+    parts = urllib.parse.urlsplit(prepared)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    described = {
+        "method": method.upper(),
+        "url": urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, query, "")),
+        "range": CaseInsensitiveDict(headers or {}).get("Range"),
+        "json": json_body,
+    }
+    text = json.dumps(described, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20], described
+
+
+def _next_sequence(key: str) -> int:
+    with _lock:
+        seq = _counters.get(key, 0)
+        _counters[key] = seq + 1
+    return seq
+
+
+def _paths(key: str, seq: int):
+    base = os.path.join(_directory, key, f"{seq:04d}")
+    return base + ".json", base + ".body"
+
+
+def _write_entry(path: str, entry: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(tmp, path)
+
+
+def request(method: str, url: str, **kwargs):
+    """requests.request, recorded or replayed when a transport mode is set."""
+    if method.upper() == "HEAD":
+        kwargs.setdefault("allow_redirects", False)  # like requests.head
+    if MODE == "record":
+        return _record(method, url, **kwargs)
+    if MODE == "replay":
+        return _replay(method, url, **kwargs)
+    return _send(method, url, **kwargs)
+
+
+# === Recording ===
+class _TeeBody:
+    """Wraps the live response body: what the caller reads is also written to the recording."""
+
+    def __init__(self, raw, body_path: str, finish):
+        self._raw = raw
+        self._file = open(body_path + ".part", "wb")
+        self._body_path = body_path
+        self._finish = finish
+        self._started = time.monotonic()
+        self._done = False
+
+    def read(self, amt=None, **_):
+        data = self._raw.read(amt, decode_content=True)
+        self._file.write(data)
+        if not data:
+            self._close(complete=True)
+        return data
+
+    def _close(self, complete: bool):
+        if self._done:
+            return
+        self._done = True
+        self._file.close()
+        os.replace(self._body_path + ".part", self._body_path)
+        self._finish(time.monotonic() - self._started, complete)
+
+    def close(self):
+        self._close(complete=False)
+        self._raw.close()
+
+    def release_conn(self):
+        self._raw.release_conn()
+
+
+def _record(method: str, url: str, **kwargs):
+    key, described = _key(method, url, kwargs.get("params"), kwargs.get("headers"), kwargs.get("json"))
+    meta_path, body_path = _paths(key, _next_sequence(key))
+    started = time.monotonic()
+    try:
+        resp = _send(method, url, **kwargs)
+    except requests.RequestException as e:
+        _write_entry(meta_path, {"request": described, "error": type(e).__name__, "message": str(e),
+                                 "elapsed": round(time.monotonic() - started, 4)})
+        raise
+    entry = {
+        "request": described,
+        "status": resp.status_code,
+        "reason": resp.reason,
+        "url": resp.url,
+        "headers": {k: v for k, v in resp.headers.items() if k.lower() not in _DROP_HEADERS},
+        "elapsed": round(time.monotonic() - started, 4),
+    }
+
+    def finish(transfer: float, complete: bool):
+        entry["transfer"] = round(transfer, 4)
+        if not complete:
+            entry["truncated"] = True  # the caller stopped reading early; so will the replay
+        _write_entry(meta_path, entry)
+
+    os.makedirs(os.path.dirname(body_path), exist_ok=True)
+    if kwargs.get("stream"):
+        resp.raw = _TeeBody(resp.raw, body_path, finish)
+        return resp
+    with open(body_path, "wb") as f:
+        f.write(resp.content)
+    finish(0.0, True)
+    return resp
+
+
+# === Replay ===
+class _PacedBody:
+    """A recorded body handed out at the recorded transfer rate."""
+
+    def __init__(self, path: str, transfer: float):
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        self._per_byte = transfer / size if size else 0.0
+
+    def read(self, amt=None, **_):
+        data = self._file.read(-1 if amt is None else amt)
+        if data and self._per_byte:
+            time.sleep(len(data) * self._per_byte)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def release_conn(self):
+        pass
+
+
+def _load(key: str, seq: int):
+    meta_path, body_path = _paths(key, seq)
+    if not os.path.exists(meta_path):
+        # Asked more often than during the recording: repeat the last answer
+        folder = os.path.dirname(meta_path)
+        recorded = sorted(n for n in os.listdir(folder) if n.endswith(".json")) if os.path.isdir(folder) else []
+        if not recorded:
+            return None, None
+        meta_path = os.path.join(folder, recorded[-1])
+        body_path = meta_path[:-len(".json")] + ".body"
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f), body_path
+
+
+def _replay(method: str, url: str, **kwargs):
+    key, described = _key(method, url, kwargs.get("params"), kwargs.get("headers"), kwargs.get("json"))
+    entry, body_path = _load(key, _next_sequence(key))
+    if entry is None:
+        raise requests.ConnectionError(f"[Transport] Not in the recording: {described['method']} {described['url']}")
+    time.sleep(entry.get("elapsed", 0) * _scale)
+    if "error" in entry:
+        error = getattr(requests.exceptions, entry["error"], requests.RequestException)
+        raise error(entry.get("message", ""))
+
+    resp = requests.Response()
+    resp.status_code = entry["status"]
+    resp.reason = entry.get("reason", "")
+    resp.url = entry.get("url", url)
+    resp.headers = CaseInsensitiveDict(entry.get("headers", {}))
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.elapsed = datetime.timedelta(seconds=entry.get("elapsed", 0))
+    transfer = entry.get("transfer", 0) * _scale
+    if kwargs.get("stream"):
+        resp.raw = _PacedBody(body_path, transfer)
+    else:
+        time.sleep(transfer)
+        with open(body_path, "rb") as f:
+            resp._content = f.read()
+    return resp
@@ -1,5 +1,9 @@
+import json
+import os
 import unicodedata
 
+from models import jsonable
+
 
 def print_login_required():
     print("User not logged in. Please log in to your DAB account to use DABCLI.\n"
@@ -26,3 +30,55 @@ def sanitize_filename(name: str) -> str:
     if name in {"", ".", ".."}:
         return "untitled"
     return name
+
+
+def track_id_from_filename(filename: str):
+    """Return the track ID from a '... - <track_id>.<ext>' filename, or None."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if " - " not in stem:
+        return None
+    track_id = stem.rsplit(" - ", 1)[1].strip()
+    return track_id or None
+
+
+def parse_track_filename(filename: str):
+    """
+    Split a '[NN - ]<artist> - <title> - <track_id>.<ext>' filename.
+    Returns (index, artist, title, track_id); missing parts are None.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    index = None
+    head, sep, rest = stem.partition(" - ")
+    if sep and len(head) == 2 and head.isdigit():
+        index, stem = int(head), rest
+    if " - " not in stem:
+        return index, None, None, None
+    stem, track_id = stem.rsplit(" - ", 1)
+    artist, _, title = stem.partition(" - ")
+    return index, artist or None, title or None, track_id.strip() or None
+
+
+def load_json(path: str, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path: str, data):
+    """Write JSON atomically (temp file + rename) so a crash never leaves half a file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=jsonable)
+    os.replace(tmp_path, path)
+
+
+# IDs behind the numbered rows of the last table printed per kind (track, album,
+# artist), so the shell can accept "album 3" after a listing
+LISTINGS = {}
+
+
+def remember_listing(kind: str, ids):
+    LISTINGS[kind] = [str(i) for i in ids]
@@ -0,0 +1,301 @@
+# workqueue.py
+"""
+Shared work queue for several `dabcli.py worker` processes, possibly on
+different hosts writing to the same (e.g. NFS) output directory.
+
+The queue is a spool directory, .dabcli/queue/, using only operations that
+are atomic on network filesystems (exclusive create, rename); SQLite locking
+is not reliable over NFS:
+
+  jobs/<job>.json      pending or in-progress job (album, track or artist)
+  leases/<name>.lease  time-limited claim, created with O_EXCL; its mtime is
+                       the heartbeat. Leases older than the lease time are
+                       reclaimed by renaming them away (only one worker wins);
+                       if what was moved turns out to be a fresh lease, it is
+                       linked back into place.
+  done/, failed/       finished jobs (moved by rename)
+
+Job leases are named after the job (album-<id>, track-<id>, artist-<id>).
+Besides jobs, workers lease individual transfers (xfer-<id>) for as long as a
+track is downloaded, so the same track in two albums is never downloaded twice
+at once: the second worker waits and then finds the file in place to link.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import config
+from utils import load_json, save_json
+
+MAX_ATTEMPTS = 3
+WAIT_INTERVAL = 2.0
+RETRY_DELAY = 60  # seconds, times the number of failed attempts
+
+
+def _dir(*parts) -> str:
+    return config.state_path("queue", *parts)
+
+
+def _job_path(job_id: str, state: str = "jobs") -> str:
+    return _dir(state, f"{job_id}.json")
+
+
+def _lease_path(name: str) -> str:
+    return _dir("leases", f"{name}.lease")
+
+
+def _lease_owner(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# === Enqueue ===
+def add_job(kind: str, target: str, **extra) -> bool:
+    """Queue a job; returns False if the same job is already queued or done."""
+    job_id = f"{kind}-{target}"
+    if os.path.exists(_job_path(job_id, "done")):
+        return False
+    os.makedirs(_dir("jobs"), exist_ok=True)
+    try:
+        fd = os.open(_job_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    save_json(_job_path(job_id), {"id": job_id, "kind": kind, "target": str(target),
+                                  "added": int(time.time()), "attempts": 0, **extra})
+    return True
+
+
+def status() -> dict:
+    counts = {}
+    for state in ("jobs", "done", "failed"):
+        path = _dir(state)
+        counts[state] = len([n for n in os.listdir(path) if n.endswith(".json")]) if os.path.isdir(path) else 0
+    leases = _dir("leases")
+    counts["leased"] = len([n for n in os.listdir(leases) if n.endswith(".lease")]) if os.path.isdir(leases) else 0
+    return counts
+
+
+# === Leases ===
+class Leases:
+    """Leases held by one worker, kept alive by a heartbeat thread."""
+
+    def __init__(self, lease_seconds: int):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.lost = set()
+        os.makedirs(_dir("leases"), exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for name in list(self._held):
+            self.release(name)
+
+    def try_acquire(self, name: str) -> bool:
+        path = _lease_path(name)
+        self._reclaim_if_expired(path)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{self.owner}\n")
+        with self._lock:
+            self._held.add(name)
+        return True
+
+    def owns(self, name: str) -> bool:
+        return _lease_owner(_lease_path(name)) == self.owner
+
+    def release(self, name: str):
+        with self._lock:
+            self._held.discard(name)
+        if self.owns(name):
+            try:
+                os.remove(_lease_path(name))
+            except OSError:
+                pass
+
+    def _reclaim_if_expired(self, path: str):
+        try:
+            seen = os.stat(path)
+        except OSError:
+            return
+        age = time.time() - seen.st_mtime
+        if age <= self.lease_seconds:
+            return
+        owner = _lease_owner(path)
+        stale = f"{path}.stale-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, stale)  # atomic: only one worker reclaims a given lease
+        except OSError:
+            return
+        # Between the stat and the rename another worker may have reclaimed the
+        # lease and created a fresh one (or the owner renewed it): only discard
+        # the file that was found expired, and put anything else back.
+        try:
+            moved = os.stat(stale)
+        except OSError:
+            return
+        if (moved.st_ino, moved.st_mtime_ns) != (seen.st_ino, seen.st_mtime_ns) or _lease_owner(stale) != owner:
+            try:
+                os.link(stale, path)  # fails if yet another lease has taken its place
+            except FileExistsError:
+                pass  # its owner's heartbeat reports the lease as lost
+            except OSError:
+                os.rename(stale, path)  # no hard links on this filesystem
+                return
+            os.remove(stale)
+            return
+        print(f"[Worker] Reclaimed expired lease {os.path.basename(path)} ({int(age)}s old)")
+        os.remove(stale)
+
+    def _heartbeat(self):
+        interval = max(1.0, self.lease_seconds / 4)
+        while not self._stop.wait(interval):
+            with self._lock:
+                held = list(self._held)
+            for name in held:
+                if not self.owns(name):
+                    print(f"[Worker] Lost lease {name}")
+                    self.lost.add(name)
+                    with self._lock:
+                        self._held.discard(name)
+                    continue
+                try:
+                    os.utime(_lease_path(name))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def track(self, track_id):
+        """
+        Hold xfer-<id> while the track is downloaded; wait while another worker
+        has it. (Not track-<id>: that is the lease of a queued track job, which
+        this worker may be holding itself.)
+        """
+        name = f"xfer-{track_id}"
+        while not self.try_acquire(name):
+            time.sleep(WAIT_INTERVAL)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+
+# === Worker ===
+def _pending_jobs() -> list:
+    path = _dir("jobs")
+    if not os.path.isdir(path):
+        return []
+    return sorted(n[:-5] for n in os.listdir(path) if n.endswith(".json"))
+
+
+def _finish(job: dict, ok: bool):
+    job_id = job["id"]
+    if ok:
+        os.makedirs(_dir("done"), exist_ok=True)
+        os.replace(_job_path(job_id), _job_path(job_id, "done"))
+        return
+    job["attempts"] = job.get("attempts", 0) + 1
+    job["retry_at"] = int(time.time() + RETRY_DELAY * job["attempts"])
+    if job["attempts"] >= MAX_ATTEMPTS:
+        os.makedirs(_dir("failed"), exist_ok=True)
+        save_json(_job_path(job_id), job)
+        os.replace(_job_path(job_id), _job_path(job_id, "failed"))
+        print(f"[Worker] {job_id} failed {job['attempts']} times; moved to failed/")
+    else:
+        save_json(_job_path(job_id), job)
+
+
+def _run_job(job: dict, cli_args) -> bool:
+    kind = job["kind"]
+    if kind == "album":
+        from album import download_album
+        return download_album(job["target"], cli_args=cli_args, directory=job.get("directory"),
+                              discography_artist=job.get("discography_artist"))
+    if kind == "track":
+        from library import _download_library_track
+        from search import get_track_metadata_by_id
+        track = get_track_metadata_by_id(job["target"])
+        if not track:
+            return False
+        quality = "5" if config.output_format == "mp3" else "27"
+        return _download_library_track(track, job.get("directory") or config.output_directory, quality, cli_args) is not None
+    if kind == "artist":
+        # Expand into album jobs so the albums spread across workers
+        from artist import get_discography
+        from utils import sanitize_filename
+        data = get_discography(job["target"], fetch_all=True)
+        if not data or not data["artist"].get("name"):
+            return False
+        artist = data["artist"]["name"]
+        directory = os.path.join(config.output_directory, "discographies", sanitize_filename(f"{artist} - {job['target']}"))
+        added = sum(add_job("album", alb["id"], directory=directory, discography_artist=artist) for alb in data["albums"])
+        print(f"[Worker] {artist}: queued {added} of {len(data['albums'])} albums")
+        return True
+    print(f"[Worker] Unknown job kind: {kind}")
+    return False
+
+
+def run_worker(cli_args=None, lease_seconds: int = 300, once: bool = False, idle_exit: bool = False):
+    """
+    Claim and run jobs until the queue is empty (once / idle_exit) or forever,
+    polling for new work. Safe to start and stop at any time.
+    """
+    import downloader
+
+    leases = Leases(lease_seconds).start()
+    downloader.TRACK_GUARD = leases.track
+    print(f"[Worker] {leases.owner} started (lease {lease_seconds}s)")
+    processed = 0
+    try:
+        while True:
+            claimed = None
+            pending = _pending_jobs()
+            for job_id in pending:
+                if leases.try_acquire(job_id):
+                    job = load_json(_job_path(job_id))
+                    if job and job.get("retry_at", 0) <= time.time():
+                        claimed = job_id
+                        break
+                    leases.release(job_id)  # finished meanwhile, or waiting to be retried
+            if claimed is None:
+                if once or (idle_exit and not pending):
+                    break
+                time.sleep(WAIT_INTERVAL * 5)
+                continue
+
+            print(f"[Worker] Running {claimed}")
+            try:
+                ok = _run_job(job, cli_args)
+            except Exception as e:
+                print(f"[Worker] {claimed} raised: {e}")
+                ok = False
+            if claimed in leases.lost:
+                print(f"[Worker] Lease on {claimed} expired while running; leaving it to its new owner")
+            else:
+                _finish(job, ok)
+            leases.release(claimed)
+            processed += 1
+            if once:
+                break
+    except KeyboardInterrupt:
+        print("\n[Worker] Stopping; the current job's lease is released and will be picked up again.")
+    finally:
+        downloader.TRACK_GUARD = None
+        leases.stop()
+    print(f"[Worker] Processed {processed} jobs")